@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+命令行启动耗时基准测试
+
+在子进程中反复执行轻量命令，报告每条命令的最小值、中位数和最大值，
+并检查是否意外导入了 fast：
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "import research_agent.main": [
+        "-c",
+        "import sys, research_agent.main; sys.exit('fast' in sys.modules)",
+    ],
+    "run_research.py --list-models": ["run_research.py", "--list-models"],
+    "run_research.py --health": ["run_research.py", "--health"],
+}
+
+
+def time_command(args: List[str], runs: int) -> Dict[str, float]:
+    """执行 runs 次命令，返回耗时统计（毫秒）"""
+    samples = []
+    returncode = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *args], cwd=ROOT, capture_output=True, text=True
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+        returncode = result.returncode
+    return {
+        "min_ms": round(min(samples), 1),
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "returncode": returncode,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="命令行启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = {name: time_command(cmd, args.runs) for name, cmd in COMMANDS.items()}
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'命令':<32} {'最小':>9} {'中位数':>9} {'最大':>9} {'退出码':>6}")
+    for name, row in results.items():
+        print(
+            f"{name:<32} {row['min_ms']:>7.1f}ms {row['median_ms']:>7.1f}ms "
+            f"{row['max_ms']:>7.1f}ms {row['returncode']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+research_workflow 端到端基准测试
+
+在 ollama.base_url 指向的地址启动本地模拟 LLM 服务器（OpenAI 兼容接口），
+以本地模型模式运行完整工作流，报告延迟分位数、吞吐量和峰值内存。agent 通过
+http_runtime 以 HTTP 请求模拟服务器，不需要 fast、GPU、网络或 API 密钥：
+
+    python benchmarks/bench_workflow.py --questions 20 --concurrency 4 \
+        --latency 0.05 --tokens-per-second 500 --response-tokens 200
+
+--profile both 依次测量 standard 和 fast 两种流水线并对比每个问题的延迟。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 基准测试始终使用本地模型并绕过响应缓存，测量的是真实的编排开销
+os.environ["USE_LOCAL_MODEL"] = "true"
+os.environ["LLM_CACHE_BYPASS"] = "true"
+
+from aiohttp import web  # noqa: E402
+
+from research_agent.config import config  # noqa: E402
+from research_agent.http_runtime import http_runtime  # noqa: E402
+from research_agent.mock_llm_server import (  # noqa: E402
+    STATS_KEY,
+    create_app,
+    default_address,
+)
+from research_agent.runtime import agent_runtime  # noqa: E402
+
+
+def percentile(values: List[float], p: float) -> float:
+    """线性插值计算分位数，p 取 0-100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def run_benchmark(args, profile: str = "standard") -> Dict[str, float]:
+    from research_agent.main import research_workflow
+    from research_agent.runtime import shutdown_shared_resources
+
+    host, port = default_address()
+    app = create_app(args.latency, args.tokens_per_second, args.response_tokens)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    questions = [f"基准测试问题 {i}: 量子计算的发展现状" for i in range(args.questions)]
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(question: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await research_workflow(
+                question, stream=False, resume=False, profile=profile
+            )
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(q) for q in questions))
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await shutdown_shared_resources()
+        await runner.cleanup()
+
+    return {
+        "profile": profile,
+        "questions": len(latencies),
+        "concurrency": args.concurrency,
+        "p50_s": percentile(latencies, 50),
+        "p90_s": percentile(latencies, 90),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies) if latencies else 0.0,
+        "wall_s": elapsed,
+        "throughput_qps": len(latencies) / elapsed if elapsed else 0.0,
+        "llm_requests": app[STATS_KEY].requests,
+        "llm_models": dict(app[STATS_KEY].models),
+        "peak_llm_concurrency": app[STATS_KEY].peak_active,
+        "peak_python_mb": peak / 2**20,
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="research_workflow 端到端基准测试")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="首 token 延迟")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    parser.add_argument(
+        "--profile",
+        choices=["standard", "fast", "both"],
+        default="standard",
+        help="流水线配置，both 表示两种都测并对比",
+    )
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    # 关闭逐阶段输出，报告写入临时目录
+    config.config.setdefault("tracing", {}).update(summary=False, verbose=False)
+    config.config.setdefault("checkpoint", {})["enabled"] = False
+    # 和跳过 LLM 缓存一样，不合并并发的相同调用，每个问题都真实请求模型
+    config.config.setdefault("singleflight", {})["enabled"] = False
+    os.chdir(tempfile.mkdtemp(prefix="research_bench_"))
+    # 不经过 fast，agent 直接以 HTTP 请求模拟服务器
+    agent_runtime.use(http_runtime)
+
+    profiles = ["standard", "fast"] if args.profile == "both" else [args.profile]
+    results = [asyncio.run(run_benchmark(args, profile)) for profile in profiles]
+    if len(results) == 2:
+        standard, fast = results
+        results.append(
+            {
+                "profile": "fast vs standard",
+                "p50_saved_s": standard["p50_s"] - fast["p50_s"],
+                "p90_saved_s": standard["p90_s"] - fast["p90_s"],
+                "llm_requests_saved": standard["llm_requests"] - fast["llm_requests"],
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results if len(results) > 1 else results[0], indent=2))
+        return
+    for result in results:
+        print()
+        for key, value in result.items():
+            print(
+                f"{key:<22} {value:.3f}"
+                if isinstance(value, float)
+                else f"{key:<22} {value}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
-import fast
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List, Optional
 from .config import config
+from .context_packer import (
+    pack_passages,
+    pack_search_context,
+    pack_sources,
+    source_budget,
+    truncate_to_tokens,
+)
+from .llm_cache import cached_run
+from .runtime import agent_runtime, deferred_agent
+from .tracing import get_tracer
 
 
-@fast.agent(
-    instruction="""你是一个深度分析专家。你的任务是：
+ANALYSIS_INSTRUCTION = """你是一个深度分析专家。你的任务是：
 1. 对收集到的信息进行多层次分析
 2. 识别不同观点和证据
 3. 评估信息的质量和一致性
@@ -14,17 +23,63 @@ from .config import config
 - 主要发现总结
 - 不同观点对比
 - 证据强度评估
-- 需要深入研究的问题""",
-    model=config.get_model("analysis_chain"),
-)
+- 需要深入研究的问题"""
+
+
+ANALYSIS_MAP_INSTRUCTION = """你是一个信息提炼专家。你的任务是：
+1. 阅读给定的一批来源
+2. 提取与研究问题相关的关键发现、数据和观点
+3. 用 [编号] 标注每条发现的来源
+4. 指出来源之间的矛盾
+
+只输出要点列表，不要给出最终结论。"""
+
+
+CRITICAL_REVIEW_INSTRUCTION = """你是一个批判性思维专家。你的任务是：
+1. 识别分析中的逻辑漏洞
+2. 检查偏见和假设
+3. 评估结论的可靠性
+4. 提出改进建议"""
+
+
+ANALYZE_AND_REVIEW_INSTRUCTION = """你是一个研究分析专家。你的任务是在一次回答中：
+1. 对收集到的信息进行深度分析
+2. 随后以批判性思维审查自己的分析
+
+输出两个部分，标题必须分别为：
+## 深度分析
+（主要发现、不同观点对比、证据强度评估、需要深入研究的问题）
+## 批判性审查
+（逻辑漏洞、偏见和假设、结论的可靠性、改进建议）"""
+
+ANALYSIS_HEADING = "## 深度分析"
+REVIEW_HEADING = "## 批判性审查"
+
+
+@deferred_agent("analysis_chain", ANALYSIS_INSTRUCTION)
 async def analyze_information(search_data: Dict[str, Any], question_analysis: str):
-    async with fast.run() as agent:
+    settings = config.get_analysis_config()
+    sources = search_data.get("raw_results", [])
+    # 已检索到段落时提示词规模由 top_k 控制，auto 模式不再需要分批
+    if settings["mode"] == "map_reduce" or (
+        settings["mode"] == "auto"
+        and not search_data.get("passages")
+        and len(sources) > settings["chunk_size"]
+    ):
+        return await _map_reduce(sources, question_analysis, settings)
+
+    search_context = pack_search_context(
+        search_data,
+        question_analysis,
+        source_budget(config.get_model("analysis_chain"), question_analysis),
+    )
+    async with agent_runtime.session() as agent:
         analysis_prompt = f"""
 基于以下研究问题分析：
 {question_analysis}
 
 和搜索数据：
-{search_data}
+{search_context}
 
 请进行深度分析，重点关注：
 1. 关键发现和趋势
@@ -33,24 +88,102 @@ async def analyze_information(search_data: Dict[str, Any], question_analysis: st
 4. 存在的争议或不确定性
 5. 需要进一步研究的领域
 """
-        response = await agent.run(analysis_prompt)
+        response = await cached_run(
+            agent, "analysis_chain", ANALYSIS_INSTRUCTION, analysis_prompt
+        )
         return response
 
 
-@fast.agent(
-    instruction="""你是一个批判性思维专家。你的任务是：
-1. 识别分析中的逻辑漏洞
-2. 检查偏见和假设
-3. 评估结论的可靠性
-4. 提出改进建议""",
-    model=config.get_model("analysis_chain"),
-)
-async def critical_review(analysis: str):
-    async with fast.run() as agent:
+@deferred_agent("analysis_map", ANALYSIS_MAP_INSTRUCTION)
+async def analyze_chunk(question_analysis: str, sources_text: str):
+    async with agent_runtime.session() as agent:
+        map_prompt = f"""
+研究问题分析：
+{question_analysis}
+
+本批来源：
+{sources_text}
+
+请提炼本批来源中与研究问题相关的要点，并用 [编号] 标注出处。
+"""
+        return await cached_run(
+            agent, "analysis_map", ANALYSIS_MAP_INSTRUCTION, map_prompt
+        )
+
+
+async def _map_reduce(
+    sources: List[Dict[str, Any]], question_analysis: str, settings: Dict[str, Any]
+) -> str:
+    """map-reduce 分析：分批并发提炼来源要点，再合并为最终分析"""
+    chunk_size = max(int(settings["chunk_size"]), 1)
+    starts = list(range(0, len(sources), chunk_size))
+    semaphore = asyncio.Semaphore(settings["max_concurrency"] or len(starts) or 1)
+    map_budget = source_budget(config.get_model("analysis_map"), question_analysis)
+
+    async def map_chunk(start: int) -> str:
+        chunk = sources[start : start + chunk_size]
+        async with semaphore:
+            sources_text = pack_sources(
+                chunk, question_analysis, map_budget, offset=start
+            )
+            return await analyze_chunk(question_analysis, sources_text)
+
+    with get_tracer().span("analysis.map", sources=len(sources), chunks=len(starts)):
+        results = await asyncio.gather(
+            *(map_chunk(start) for start in starts), return_exceptions=True
+        )
+
+    partials = []
+    for start, result in zip(starts, results):
+        end = min(start + chunk_size, len(sources))
+        if isinstance(result, BaseException):
+            print(f"分析来源 [{start + 1}]-[{end}] 时出错: {result}")
+            continue
+        partials.append((f"来源 [{start + 1}]-[{end}]", str(result)))
+    if not partials:
+        raise RuntimeError("所有来源批次的分析均失败")
+
+    # 各批要点平分 reduce 阶段的预算
+    budget = source_budget(config.get_model("analysis_chain"), question_analysis)
+    share = max(budget // len(partials), 1)
+    findings = "\n\n".join(
+        f"{label}:\n{truncate_to_tokens(text, share)}" for label, text in partials
+    )
+
+    async with agent_runtime.session() as agent:
+        reduce_prompt = f"""
+基于以下研究问题分析：
+{question_analysis}
+
+和分批提炼的来源要点：
+{findings}
+
+请合并这些要点并进行深度分析，保留 [编号] 形式的来源标注，重点关注：
+1. 关键发现和趋势
+2. 不同来源的观点对比
+3. 证据的可靠性
+4. 存在的争议或不确定性
+5. 需要进一步研究的领域
+"""
+        return await cached_run(
+            agent, "analysis_chain", ANALYSIS_INSTRUCTION, reduce_prompt
+        )
+
+
+@deferred_agent("analysis_chain", CRITICAL_REVIEW_INSTRUCTION)
+async def critical_review(analysis: str, search_data: Optional[Dict[str, Any]] = None):
+    evidence = ""
+    if search_data and search_data.get("passages"):
+        passages = pack_passages(
+            search_data["passages"],
+            source_budget(config.get_model("analysis_chain"), analysis),
+        )
+        evidence = f"\n可用于核对的原文段落：\n{passages}\n"
+    async with agent_runtime.session() as agent:
         review_prompt = f"""
 请对以下分析进行批判性审查：
 {analysis}
-
+{evidence}
 重点检查：
 1. 逻辑一致性
 2. 潜在偏见
@@ -58,5 +191,41 @@ async def critical_review(analysis: str):
 4. 结论的合理性
 5. 改进建议
 """
-        response = await agent.run(review_prompt)
+        response = await cached_run(
+            agent, "analysis_chain", CRITICAL_REVIEW_INSTRUCTION, review_prompt
+        )
         return response
+
+
+def split_analysis_review(text: str) -> Dict[str, str]:
+    """把合并调用的输出拆成分析和审查两部分，缺少审查标题时全文作为分析"""
+    head, found, review = text.partition(REVIEW_HEADING)
+    analysis = head.replace(ANALYSIS_HEADING, "", 1).strip()
+    if not found:
+        return {"analysis": text.strip(), "review": ""}
+    return {"analysis": analysis, "review": review.strip()}
+
+
+@deferred_agent("analysis_chain", ANALYZE_AND_REVIEW_INSTRUCTION)
+async def analyze_and_review(search_data: Dict[str, Any], question_analysis: str):
+    """fast 流水线：深度分析和批判性审查合并为一次调用"""
+    search_context = pack_search_context(
+        search_data,
+        question_analysis,
+        source_budget(config.get_model("analysis_chain"), question_analysis),
+    )
+    async with agent_runtime.session() as agent:
+        prompt = f"""
+基于以下研究问题分析：
+{question_analysis}
+
+和搜索数据：
+{search_context}
+
+请先进行深度分析，再对自己的分析进行批判性审查，按要求的两个标题输出。
+引用来源时使用 [编号] 标注。
+"""
+        response = await cached_run(
+            agent, "analysis_chain", ANALYZE_AND_REVIEW_INSTRUCTION, prompt
+        )
+        return split_analysis_review(str(response))
@@ -0,0 +1,157 @@
+"""
+批量研究运行器
+
+从文件或标准输入读取问题（每行一个纯文本问题，或包含 question/id 字段的 JSON），
+在并发上限内运行 research_workflow，并把每个问题的结果追加写入 JSONL 文件。
+重新启动时跳过输出文件中已成功完成的问题，未完成的问题从阶段检查点续跑：
+
+    python -m research_agent.batch questions.txt -o results.jsonl -c 4
+    cat questions.jsonl | python -m research_agent.batch - -o results.jsonl
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .config import config
+
+
+def question_id(question: str) -> str:
+    """由问题文本生成稳定的 ID"""
+    normalized = " ".join(question.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def load_questions(lines: Iterable[str]) -> List[Dict[str, str]]:
+    """解析问题列表，忽略空行和重复问题"""
+    questions = []
+    seen: Set[str] = set()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            text = item["question"].strip()
+            qid = str(item.get("id") or question_id(text))
+        else:
+            text = line
+            qid = question_id(text)
+        if qid in seen:
+            continue
+        seen.add(qid)
+        questions.append({"id": qid, "question": text})
+    return questions
+
+
+def load_completed(output_path: str) -> Set[str]:
+    """读取输出文件中已成功完成的问题 ID"""
+    completed: Set[str] = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断时可能留下写了一半的行
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+async def run_batch(
+    questions: List[Dict[str, str]],
+    output_path: str,
+    concurrency: int = 4,
+    workflow: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+) -> Dict[str, int]:
+    """并发运行一批问题，返回成功、失败和跳过的数量"""
+    if workflow is None:
+        from .main import research_workflow
+
+        workflow = research_workflow
+
+    completed = load_completed(output_path)
+    pending = [q for q in questions if q["id"] not in completed]
+    summary = {"ok": 0, "error": 0, "skipped": len(questions) - len(pending)}
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        # 上次中断留下的半行需要先补上换行，避免与新记录拼接
+        if out.tell() > 0 and not _ends_with_newline(output_path):
+            out.write("\n")
+
+        async def _run(item: Dict[str, str]) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                record: Dict[str, Any] = {
+                    "id": item["id"],
+                    "question": item["question"],
+                }
+                try:
+                    # 续跑时复用上次中断前已完成的阶段
+                    result = await workflow(item["question"], stream=False, resume=True)
+                    record.update(
+                        status="ok",
+                        saved_file=result.get("saved_file"),
+                        final_report=result.get("final_report"),
+                    )
+                except Exception as e:  # 单个问题失败不影响整批
+                    record.update(status="error", error=f"{type(e).__name__}: {e}")
+                record["elapsed"] = round(time.perf_counter() - start, 3)
+
+            summary[record["status"]] += 1
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+
+        await asyncio.gather(*(_run(q) for q in pending))
+
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = config.get_batch_config()
+    parser = argparse.ArgumentParser(description="批量运行研究问题")
+    parser.add_argument("input", help="问题文件（纯文本或 JSONL），- 表示标准输入")
+    parser.add_argument("-o", "--output", default=settings["output"])
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=settings["concurrency"]
+    )
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        questions = load_questions(sys.stdin)
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            questions = load_questions(f)
+
+    async def _main() -> Dict[str, int]:
+        from .runtime import shutdown_shared_resources
+
+        try:
+            return await run_batch(questions, args.output, args.concurrency)
+        finally:
+            await shutdown_shared_resources()
+
+    summary = asyncio.run(_main())
+    print(
+        f"批量研究完成: 成功 {summary['ok']} 个，失败 {summary['error']} 个，"
+        f"跳过 {summary['skipped']} 个，结果已写入 {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict
+
+
+def make_run_id(question: str) -> str:
+    """由问题文本生成确定性的运行 ID，同一问题重复运行时可以续跑"""
+    normalized = " ".join(question.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+class CheckpointStore:
+    """阶段检查点 - 每个阶段完成后立即把结果写入运行目录
+
+    只用于续跑未完成的运行：运行成功后由调用方 clear()；最早的阶段写入超过
+    ttl 秒（0 表示不过期）的运行视为过期，不再续跑。
+    """
+
+    def __init__(self, run_id: str, root: str = "runs", ttl: float = 0):
+        self.run_id = run_id
+        self.root = root
+        self.ttl = ttl
+        self.path = os.path.join(root, run_id)
+
+    def _stage_file(self, stage: str) -> str:
+        return os.path.join(self.path, f"{stage}.json")
+
+    def save(self, stage: str, value: Any) -> None:
+        """原子地写入阶段结果"""
+        os.makedirs(self.path, exist_ok=True)
+        target = self._stage_file(stage)
+        tmp = f"{target}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"stage": stage, "value": value}, f, ensure_ascii=False, default=str
+            )
+        os.replace(tmp, target)
+
+    def load_all(self) -> Dict[str, Any]:
+        """读取所有已完成阶段的结果，运行已过期时删除检查点并返回空字典"""
+        results: Dict[str, Any] = {}
+        if not os.path.isdir(self.path):
+            return results
+        names = [n for n in sorted(os.listdir(self.path)) if n.endswith(".json")]
+        if self.ttl and names:
+            oldest = min(os.path.getmtime(os.path.join(self.path, n)) for n in names)
+            if time.time() - oldest > self.ttl:
+                self.clear()
+                return results
+        for name in names:
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            results[record["stage"]] = record["value"]
+        return results
+
+    def clear(self) -> None:
+        """删除该运行的所有检查点"""
+        shutil.rmtree(self.path, ignore_errors=True)
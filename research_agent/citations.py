@@ -0,0 +1,88 @@
+import re
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+REFERENCES_HEADING = "## 参考文献"
+
+# 行内引用标记：[1]、[2, 3]、[4-6]，不匹配 Markdown 链接 [1](...)
+_MARKER_RE = re.compile(r"\[(\d+(?:\s*[,，、\-–]\s*\d+)*)\](?!\()")
+
+
+def cited_numbers(text: str) -> List[int]:
+    """按首次出现顺序返回正文中引用的来源编号，范围标记 [4-6] 展开"""
+    numbers: List[int] = []
+    for match in _MARKER_RE.finditer(text):
+        for part in re.split(r"\s*[,，、]\s*", match.group(1)):
+            bounds = [int(n) for n in re.split(r"\s*[\-–]\s*", part)]
+            low, high = bounds[0], bounds[-1]
+            if high - low > 50:  # 不是引用范围（如年份区间）
+                continue
+            for number in range(low, high + 1):
+                if number not in numbers:
+                    numbers.append(number)
+    return numbers
+
+
+def _site_name(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _year(value: Any) -> Optional[str]:
+    match = re.search(r"\b(1[89]\d\d|20\d\d)\b", str(value or ""))
+    return match.group(1) if match else None
+
+
+def _sentence(text: str) -> str:
+    text = " ".join(str(text).split())
+    return text if not text or text[-1] in ".?!。？！" else f"{text}."
+
+
+def format_reference(source: Dict[str, Any]) -> str:
+    """按 APA 第 7 版网页格式生成一条参考文献
+
+    作者缺失时标题移到作者位置，没有发布日期时写 (n.d.)，转载页面附在末尾。
+    """
+    title = _sentence(source.get("title") or "Untitled")
+    url = source.get("url") or ""
+    site = _site_name(url) if url else ""
+    year = _year(source.get("published") or source.get("date"))
+    when = f"({year})." if year else "(n.d.)."
+
+    author = source.get("author")
+    if author:
+        parts = [_sentence(author), when, f"*{title}*"]
+    else:
+        parts = [f"*{title}*", when]
+    if site and site != str(author or "").lower():
+        parts.append(_sentence(site))
+    if url:
+        parts.append(url)
+
+    reference = " ".join(parts)
+    alternates = [a["url"] for a in source.get("alternates", []) if a.get("url")]
+    if alternates:
+        reference += f" 另见: {', '.join(alternates)}"
+    return reference
+
+
+def render_references(text: str, sources: List[Dict[str, Any]]) -> str:
+    """根据正文中的引用标记生成参考文献列表，编号与来源序号一致
+
+    正文没有任何有效标记时列出全部来源；超出来源数量的编号忽略。
+    """
+    numbers = sorted(n for n in cited_numbers(text) if 1 <= n <= len(sources))
+    if not numbers:
+        numbers = list(range(1, len(sources) + 1))
+    if not numbers:
+        return ""
+    lines = [f"[{n}] {format_reference(sources[n - 1])}" for n in numbers]
+    return f"{REFERENCES_HEADING}\n\n" + "\n\n".join(lines) + "\n"
+
+
+def format_citations(report_text: str, sources: List[Dict[str, Any]]) -> str:
+    """在本地为报告附加参考文献列表，不调用模型，报告正文原样保留"""
+    references = render_references(report_text, sources)
+    if not references:
+        return report_text
+    return f"{report_text}\n\n{references}"
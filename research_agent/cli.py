@@ -0,0 +1,64 @@
+"""
+轻量命令行子命令
+
+供 cron 和脚本频繁调用，只导入配置和必需的模块，不加载 fast 和 agent：
+
+    python run_research.py --list-models   # 列出各 agent 当前使用的模型
+    python run_research.py --health        # 检查当前模式的模型后端，不可用时退出码为 1
+"""
+
+import json
+import os
+from typing import Any, Dict
+
+from .config import config
+
+AGENT_NAMES = [
+    "question_analyzer",
+    "web_searcher",
+    "analysis_chain",
+    "report_generator",
+]
+
+
+def list_models() -> Dict[str, Any]:
+    """各 agent 在当前模式下解析出的模型"""
+    names = list(dict.fromkeys(AGENT_NAMES + list(config.config.get("agents", {}))))
+    return {
+        "mode": "local" if config.is_using_local() else "cloud",
+        "agents": {name: config.get_model(name) for name in names},
+    }
+
+
+async def health() -> Dict[str, Any]:
+    """检查当前模式的模型后端是否可用"""
+    if not config.is_using_local():
+        ok = bool(os.getenv("ANTHROPIC_API_KEY") or os.getenv("OPENAI_API_KEY"))
+        return {
+            "ok": ok,
+            "mode": "cloud",
+            "error": None if ok else "未配置 ANTHROPIC_API_KEY 或 OPENAI_API_KEY",
+        }
+
+    from .model_switcher import ModelSwitcher
+
+    probe = await ModelSwitcher().probe_ollama()
+    return {
+        "ok": probe["ok"],
+        "mode": "local",
+        "error": probe["error"],
+        "latency": probe["latency"],
+        "models": probe["models"],
+    }
+
+
+def main(command: str) -> int:
+    """执行子命令并以 JSON 输出结果，返回退出码"""
+    if command == "--list-models":
+        result = list_models()
+    else:
+        import asyncio
+
+        result = asyncio.run(health())
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result.get("ok", True) else 1
@@ -1,12 +1,23 @@
 import yaml
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 class Config:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = config_path
-        self.config = self._load_config()
+        self._config: Optional[Dict[str, Any]] = None
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        """配置内容，首次访问时才读取配置文件"""
+        if self._config is None:
+            self._config = self._load_config()
+        return self._config
+
+    @config.setter
+    def config(self, value: Dict[str, Any]) -> None:
+        self._config = value
 
     def _load_config(self) -> Dict[str, Any]:
         """加载配置文件"""
@@ -28,6 +39,8 @@ class Config:
                 "base_url": "http://localhost:11434/v1",
                 "api_key": "ollama",
                 "timeout": 60,
+                "probe_ttl": 10,
+                "probe_timeout": 2,
             },
         }
 
@@ -69,9 +82,211 @@ class Config:
                 "base_url": "http://localhost:11434/v1",
                 "api_key": "ollama",
                 "timeout": 60,
+                "probe_ttl": 10,
+                "probe_timeout": 2,
             },
         )
 
+    def _get_section(self, name: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+        """读取配置段，缺失的键使用默认值"""
+        section = self.config.get(name) or {}
+        return {**defaults, **section}
+
+    def get_workflow_config(self) -> Dict[str, Any]:
+        """获取工作流调度配置"""
+        return self._get_section(
+            "workflow", {"max_concurrency": 4, "profile": "standard"}
+        )
+
+    def get_llm_cache_config(self) -> Dict[str, Any]:
+        """获取 LLM 响应缓存配置"""
+        return self._get_section(
+            "llm_cache",
+            {
+                "enabled": True,
+                "path": ".cache/llm_cache.sqlite3",
+                "max_size_mb": 100,
+                "ttl": None,
+                "bypass": False,
+            },
+        )
+
+    def get_query_plan_config(self) -> Dict[str, Any]:
+        """获取查询计划配置"""
+        return self._get_section("query_plan", {"max_queries": 5})
+
+    def get_search_config(self) -> Dict[str, Any]:
+        """获取搜索后端配置"""
+        return self._get_section(
+            "search",
+            {
+                "provider": "mock",
+                "endpoint": "http://localhost:8888/search",
+                "timeout": 10,
+                "max_concurrency": 8,
+                "max_connections": 20,
+                "per_host_limit": 4,
+            },
+        )
+
+    def get_fetch_config(self) -> Dict[str, Any]:
+        """获取网页抓取配置"""
+        return self._get_section(
+            "fetch",
+            {
+                "enabled": False,
+                "cache_path": ".cache/page_cache.sqlite3",
+                "timeout": 15,
+                "max_connections": 20,
+                "per_domain": 2,
+                "max_bytes": 2000000,
+                "max_chars": 20000,
+                "workers": 2,
+                "revalidate_after": 3600,
+                "user_agent": "research-agent/0.1",
+            },
+        )
+
+    def get_dedup_config(self) -> Dict[str, Any]:
+        """获取近似重复来源合并配置"""
+        return self._get_section(
+            "dedup",
+            {
+                "enabled": True,
+                "method": "minhash",
+                "threshold": 0.5,
+                "simhash_distance": 10,
+                "num_perm": 64,
+                "shingle_size": 2,
+                "min_tokens": 30,
+            },
+        )
+
+    def get_search_cache_config(self) -> Dict[str, Any]:
+        """获取搜索结果缓存配置"""
+        return self._get_section(
+            "search_cache",
+            {"enabled": True, "path": ".cache/search_cache.sqlite3", "ttl": 86400},
+        )
+
+    def get_retrieval_config(self) -> Dict[str, Any]:
+        """获取段落检索配置"""
+        return self._get_section(
+            "retrieval",
+            {
+                "enabled": True,
+                "path": ".cache/passages",
+                "top_k": 4,
+                "passage_tokens": 120,
+                "vectors": False,
+                "vector_dim": 256,
+                "vector_weight": 0.3,
+                "max_sources": 500,
+            },
+        )
+
+    def get_analysis_config(self) -> Dict[str, Any]:
+        """获取深度分析配置"""
+        return self._get_section(
+            "analysis", {"mode": "auto", "chunk_size": 8, "max_concurrency": 4}
+        )
+
+    def get_report_config(self) -> Dict[str, Any]:
+        """获取报告输出配置"""
+        return self._get_section("report", {"stream": False})
+
+    def get_batch_config(self) -> Dict[str, Any]:
+        """获取批量运行配置"""
+        return self._get_section(
+            "batch", {"concurrency": 4, "output": "batch_results.jsonl"}
+        )
+
+    def get_server_config(self) -> Dict[str, Any]:
+        """获取 HTTP 服务配置"""
+        return self._get_section(
+            "server",
+            {
+                "host": "127.0.0.1",
+                "port": 8080,
+                "workers": 2,
+                "max_queue": 16,
+                "max_jobs": 1000,
+            },
+        )
+
+    def get_worker_config(self) -> Dict[str, Any]:
+        """获取多进程 worker 和持久化任务队列配置"""
+        return self._get_section(
+            "worker",
+            {
+                "queue_path": ".cache/jobs.sqlite3",
+                "processes": 2,
+                "lease_seconds": 600,
+                "max_attempts": 3,
+                "retry_backoff": 30,
+                "poll_interval": 2,
+            },
+        )
+
+    def get_singleflight_config(self) -> Dict[str, Any]:
+        """获取在途请求合并配置"""
+        return self._get_section("singleflight", {"enabled": True})
+
+    def get_checkpoint_config(self) -> Dict[str, Any]:
+        """获取阶段检查点配置"""
+        return self._get_section(
+            "checkpoint",
+            {"enabled": True, "dir": "runs", "resume": False, "ttl": 86400},
+        )
+
+    def get_tracing_config(self) -> Dict[str, Any]:
+        """获取追踪配置"""
+        return self._get_section(
+            "tracing",
+            {
+                "enabled": True,
+                "export_path": ".cache/traces.jsonl",
+                "format": "jsonl",
+                "summary": True,
+                "verbose": True,
+            },
+        )
+
+    def get_routing_config(self) -> Dict[str, Any]:
+        """获取模型路由配置"""
+        return self._get_section(
+            "routing",
+            {
+                "enabled": True,
+                "latency_threshold": 30,
+                "error_threshold": 0.5,
+                "window": 20,
+                "cooldown": 30,
+                "hedge_agents": [],
+                "hedge_delay": 2.0,
+                "fallbacks": {},
+                "cross_side_fallback": False,
+            },
+        )
+
+    def get_rate_limit_config(self) -> Dict[str, Any]:
+        """获取按提供方的限流和重试配置"""
+        return self._get_section(
+            "rate_limits",
+            {
+                "enabled": True,
+                "max_retries": 4,
+                "base_delay": 1.0,
+                "max_delay": 30,
+                "providers": {},
+            },
+        )
+
+    def get_context_budget(self, model: str) -> int:
+        """获取模型的提示词 token 预算"""
+        budgets = self._get_section("context_budget", {"default": 12000})
+        return budgets.get("models", {}).get(model, budgets["default"])
+
 
 # 全局配置实例
 config = Config()
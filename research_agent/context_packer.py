@@ -0,0 +1,152 @@
+import math
+import re
+from typing import Any, Dict, List, Set
+
+from .config import config
+
+# CJK 统一表意文字、平假名/片假名、韩文音节
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# 即使提示词其他部分已占满预算，也至少为来源保留的 token 数
+MIN_SOURCE_BUDGET = 256
+
+# 为提示词模板和 agent 指令预留的 token 数
+PROMPT_RESERVE = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数：CJK 字符按 1 个计，其余按约 4 个字符 1 个计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def source_budget(model: str, *parts: str) -> int:
+    """计算扣除提示词其他部分后留给来源的 token 预算"""
+    used = sum(estimate_tokens(p) for p in parts) + PROMPT_RESERVE
+    return max(config.get_context_budget(model) - used, MIN_SOURCE_BUDGET)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """将文本截断到预算以内"""
+    if estimate_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…"
+
+
+def tokenize(text: str) -> List[str]:
+    """切分词项（保留重复）：英文单词和 CJK 二元组，单个汉字保留原样"""
+    text = text.lower()
+    terms = _WORD_RE.findall(text)
+    for run in re.findall(r"[\u3400-\u4dbf\u4e00-\u9fff]+", text):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _terms(text: str) -> Set[str]:
+    """提取用于相关性打分的词项集合"""
+    return set(tokenize(text))
+
+
+def source_text(source: Dict[str, Any]) -> str:
+    """来源正文：抓取到的页面正文优先，没有时使用搜索摘要"""
+    return str(source.get("content") or source.get("summary") or "")
+
+
+def rank_sources(sources: List[Dict[str, Any]], query: str) -> List[int]:
+    """按与查询的相关性为来源排序，返回原列表中的下标"""
+    query_terms = _terms(query)
+
+    def score(i: int) -> float:
+        source = sources[i]
+        text = f"{source.get('title', '')} {source_text(source)}"
+        overlap = len(query_terms & _terms(text))
+        # 被多个关键词同时命中的来源更可能切题
+        return overlap + 0.5 * len(source.get("keywords", []))
+
+    return sorted(range(len(sources)), key=lambda i: (-score(i), i))
+
+
+def format_source(index: int, source: Dict[str, Any]) -> str:
+    """紧凑序列化单个来源（正文或摘要，由 pack_sources 截断到预算内）"""
+    header = f"[{index}] {source.get('title', '')} | {source.get('url', '')}"
+    body = source_text(source)
+    return f"{header}\n{body}" if body else header
+
+
+def pack_sources(
+    sources: List[Dict[str, Any]], query: str, budget: int, offset: int = 0
+) -> str:
+    """按相关性挑选来源直到用完预算，编号保持为来源在原列表中的序号
+
+    sources 是更大列表的一个切片时，offset 为切片起点，编号与完整列表一致。
+    """
+    lines = []
+    remaining = budget
+    for i in rank_sources(sources, query):
+        entry = format_source(offset + i + 1, sources[i])
+        cost = estimate_tokens(entry) + 1
+        if cost > remaining:
+            header_cost = estimate_tokens(
+                format_source(
+                    offset + i + 1, {**sources[i], "content": "", "summary": ""}
+                )
+            )
+            # 放得下标题时截断正文，否则跳过这个来源
+            if header_cost + 8 > remaining:
+                continue
+            entry = truncate_to_tokens(entry, remaining - 1)
+            cost = estimate_tokens(entry) + 1
+        lines.append(entry)
+        remaining -= cost
+    return "\n".join(lines)
+
+
+def pack_passages(passages: List[Dict[str, Any]], budget: int) -> str:
+    """按给定顺序放入检索到的段落直到用完预算，编号为段落所属来源的序号"""
+    lines = []
+    remaining = budget
+    for passage in passages:
+        entry = format_source(
+            passage["source"],
+            {"title": passage.get("title", ""), "url": passage.get("url", "")},
+        )
+        entry = f"{entry}\n{passage['text']}"
+        cost = estimate_tokens(entry) + 1
+        if cost > remaining:
+            continue
+        lines.append(entry)
+        remaining -= cost
+    return "\n".join(lines)
+
+
+def pack_search_context(search_data: Dict[str, Any], query: str, budget: int) -> str:
+    """打包搜索数据：优先放入来源，剩余预算再放入检索摘要
+
+    search_data 带有检索到的段落（passages）时用段落代替完整来源。
+    """
+    if search_data.get("passages"):
+        sources = pack_passages(search_data["passages"], budget)
+    else:
+        sources = pack_sources(search_data.get("raw_results", []), query, budget)
+    parts = [sources] if sources else []
+
+    summary = search_data.get("analysis")
+    remaining = budget - estimate_tokens(sources) - 8
+    if summary and remaining > 0:
+        parts.append("检索摘要:\n" + truncate_to_tokens(str(summary), remaining))
+    return "\n\n".join(parts)
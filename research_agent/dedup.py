@@ -0,0 +1,175 @@
+import hashlib
+import random
+from typing import Any, Dict, List, Optional, Set
+
+from .config import config
+from .context_packer import source_text, tokenize
+
+# 梅森素数 2^61 - 1，MinHash 置换哈希取模用
+_PRIME = (1 << 61) - 1
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+def shingles(tokens: List[str], size: int = 2) -> Set[str]:
+    """词项 k-gram 集合"""
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i : i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHasher:
+    """MinHash 签名，用 LSH 分桶找候选对"""
+
+    def __init__(self, num_perm: int = 64, rows: int = 4, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.rows = rows
+        self.params = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, items: Set[str]) -> List[int]:
+        hashes = [_hash64(item) for item in items]
+        if not hashes:
+            return [_PRIME] * self.num_perm
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.params]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """估算 Jaccard 相似度"""
+        return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+    def candidate_pairs(self, signatures: List[List[int]]) -> Set[tuple]:
+        """任意一个分段完全相同的签名对成为候选"""
+        pairs = set()
+        for start in range(0, self.num_perm, self.rows):
+            buckets: Dict[tuple, List[int]] = {}
+            for i, sig in enumerate(signatures):
+                buckets.setdefault(tuple(sig[start : start + self.rows]), []).append(i)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        pairs.add((members[x], members[y]))
+        return pairs
+
+
+def simhash(tokens: List[str]) -> int:
+    """64 位 SimHash，按词频加权"""
+    weights: Dict[str, int] = {}
+    for token in tokens:
+        weights[token] = weights.get(token, 0) + 1
+    totals = [0] * 64
+    for token, weight in weights.items():
+        h = _hash64(token)
+        for bit in range(64):
+            totals[bit] += weight if h >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(64) if totals[bit] > 0) & _MASK64
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_duplicate_groups(
+    texts: List[str],
+    method: str = "minhash",
+    threshold: float = 0.5,
+    max_distance: int = 10,
+    num_perm: int = 64,
+    shingle_size: int = 2,
+    min_tokens: int = 30,
+) -> List[List[int]]:
+    """把近似重复的文本分组，返回下标分组（每组按下标升序，单个文本也自成一组）
+
+    少于 min_tokens 个词项的文本太短，无法可靠判重，不参与比较。
+    """
+    tokens = [tokenize(text) for text in texts]
+    eligible = [i for i, t in enumerate(tokens) if len(t) >= min_tokens]
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    if method == "minhash":
+        hasher = MinHasher(num_perm)
+        signatures = [
+            hasher.signature(shingles(tokens[i], shingle_size)) for i in eligible
+        ]
+        for x, y in hasher.candidate_pairs(signatures):
+            if hasher.similarity(signatures[x], signatures[y]) >= threshold:
+                union(eligible[x], eligible[y])
+    elif method == "simhash":
+        fingerprints = [simhash(tokens[i]) for i in eligible]
+        for x in range(len(eligible)):
+            for y in range(x + 1, len(eligible)):
+                if hamming(fingerprints[x], fingerprints[y]) <= max_distance:
+                    union(eligible[x], eligible[y])
+    else:
+        raise ValueError(f"未知的去重方法: {method}")
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def collapse_near_duplicates(
+    results: List[Dict[str, Any]], settings: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """合并近似重复的来源
+
+    每组保留正文最长的来源（同样长时保留排名靠前的），其余来源的标题和 URL
+    记录在 alternates 中供引用，命中的关键词合并。
+    """
+    settings = settings or config.get_dedup_config()
+    if not settings["enabled"] or len(results) < 2:
+        return results
+
+    # 判重文本：标题加正文（没有正文时用摘要）
+    texts = [f"{r.get('title', '')} {source_text(r)}" for r in results]
+    groups = find_duplicate_groups(
+        texts,
+        method=settings["method"],
+        threshold=settings["threshold"],
+        max_distance=settings["simhash_distance"],
+        num_perm=settings["num_perm"],
+        shingle_size=settings["shingle_size"],
+        min_tokens=settings["min_tokens"],
+    )
+
+    collapsed = []
+    for group in sorted(groups, key=min):
+        if len(group) == 1:
+            collapsed.append(results[group[0]])
+            continue
+        keep = max(group, key=lambda i: (len(texts[i]), -i))
+        representative = {**results[keep], "alternates": []}
+        keywords = list(representative.get("keywords", []))
+        for i in group:
+            if i == keep:
+                continue
+            representative["alternates"].append(
+                {"title": results[i].get("title", ""), "url": results[i].get("url", "")}
+            )
+            for keyword in results[i].get("keywords", []):
+                if keyword not in keywords:
+                    keywords.append(keyword)
+        if keywords:
+            representative["keywords"] = keywords
+        collapsed.append(representative)
+    return collapsed
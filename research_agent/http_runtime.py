@@ -0,0 +1,88 @@
+"""
+OpenAI 兼容的 HTTP 运行时
+
+不依赖 fast，直接向 OpenAI 兼容的 /chat/completions 接口（Ollama、vLLM、
+mock_llm_server 等）发请求，指令作为 system 消息、路由选出的模型作为 model 字段。
+用于基准测试和没有安装 fast 的环境：
+
+    agent_runtime.use(http_runtime)
+"""
+
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from .config import config
+from .rate_limiter import PROVIDERS
+
+
+def model_name(model: str) -> str:
+    """接口使用的模型名，去掉提供方前缀：generic.llama3.2:latest -> llama3.2:latest"""
+    provider, _, name = model.partition(".")
+    return name if provider in PROVIDERS and name else model
+
+
+class HTTPAgent:
+    """通过 OpenAI 兼容接口调用模型，接口与共享运行时中的 agent 相同"""
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+
+    def _payload(
+        self, prompt: str, instruction: str, model: str, stream: bool
+    ) -> Dict[str, Any]:
+        return {
+            "model": model_name(model),
+            "messages": [
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": prompt},
+            ],
+            "stream": stream,
+        }
+
+    async def run(self, prompt: str, instruction: str, model: str) -> str:
+        """一次性返回完整响应"""
+        async with self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=self._payload(prompt, instruction, model, False),
+        ) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(
+        self, prompt: str, instruction: str, model: str
+    ) -> AsyncIterator[str]:
+        """按服务器推送事件（SSE）逐块产出响应"""
+        async with self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=self._payload(prompt, instruction, model, True),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+
+@asynccontextmanager
+async def http_runtime(
+    base_url: Optional[str] = None, api_key: Optional[str] = None
+) -> AsyncIterator[HTTPAgent]:
+    """打开连接池并产出 HTTPAgent，默认使用 ollama 段的地址、密钥和超时"""
+    settings = config.get_ollama_config()
+    key = api_key or settings.get("api_key")
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=settings.get("timeout", 60)),
+        headers={"Authorization": f"Bearer {key}"} if key else None,
+    ) as session:
+        yield HTTPAgent(session, base_url or settings["base_url"])
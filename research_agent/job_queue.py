@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+from .batch import question_id
+from .config import config
+
+# 任务状态：queued -> running -> done / failed，失败可重试时回到 queued
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    """持久化任务队列 - 多个进程（或共享文件系统的多台主机）从同一个 SQLite 文件取任务
+
+    worker 领取任务时获得 lease_seconds 秒的租约，运行期间定期续约；租约过期的任务
+    （worker 崩溃或失联）可以被其他 worker 重新领取。失败的任务按指数退避重试，
+    超过 max_attempts 次后标记为 failed。
+
+    使用默认的回滚日志模式而不是 WAL，WAL 不支持网络文件系统。
+    """
+
+    def __init__(
+        self,
+        path: str = ".cache/jobs.sqlite3",
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+        retry_backoff: float = 30,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None) -> "JobQueue":
+        """根据 config.yaml 的 worker 段创建队列"""
+        settings = config.get_worker_config()
+        return cls(
+            path=path or settings["queue_path"],
+            lease_seconds=settings["lease_seconds"],
+            max_attempts=settings["max_attempts"],
+            retry_backoff=settings["retry_backoff"],
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 自动提交模式，事务由 BEGIN IMMEDIATE 显式控制
+            self._conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    profile TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status "
+                "ON jobs (status, available_at)"
+            )
+        return self._conn
+
+    def enqueue(
+        self,
+        question: str,
+        profile: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        """加入任务并返回 ID；ID 默认由问题文本生成，重复提交同一问题不会产生新任务"""
+        job_id = job_id or question_id(question)
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR IGNORE INTO jobs "
+            "(id, question, profile, status, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, question, profile, now, now, now),
+        )
+        return job_id
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """领取一个可运行的任务（排队中且已到重试时间，或租约已过期）"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?)"
+                    " OR (status = 'running' AND lease_expires < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["status"] == "running" and row["attempts"] >= self.max_attempts:
+                    # 最后一次尝试的 worker 失联，不再重试
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', lease_owner = NULL, "
+                        "error = ?, updated_at = ? WHERE id = ?",
+                        (f"租约过期（{row['lease_owner']}）", now, row["id"]),
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                    "lease_owner = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (owner, now + self.lease_seconds, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+                return {**dict(row), "attempts": row["attempts"] + 1, "owner": owner}
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update_leased(self, job_id: str, owner: str, sql: str, params: tuple) -> bool:
+        """只有仍持有租约的 worker 才能更新任务"""
+        cursor = self._connect().execute(
+            f"UPDATE jobs SET {sql}, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            (*params, time.time(), job_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """续约，返回 False 表示租约已被其他 worker 接管"""
+        return self._update_leased(
+            job_id, owner, "lease_expires = ?", (time.time() + self.lease_seconds,)
+        )
+
+    def complete(self, job_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        return self._update_leased(
+            job_id,
+            owner,
+            "status = 'done', lease_owner = NULL, result = ?, error = NULL",
+            (json.dumps(result, ensure_ascii=False, default=str),),
+        )
+
+    def fail(self, job_id: str, owner: str, error: str) -> bool:
+        """记录失败：未超过重试次数时按指数退避重新排队，否则标记为 failed"""
+        row = self.get(job_id)
+        if row is None:
+            return False
+        if row["attempts"] < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (row["attempts"] - 1)
+            return self._update_leased(
+                job_id,
+                owner,
+                "status = 'queued', lease_owner = NULL, error = ?, available_at = ?",
+                (error, time.time() + delay),
+            )
+        return self._update_leased(
+            job_id, owner, "status = 'failed', lease_owner = NULL, error = ?", (error,)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        ).fetchone()
+        return _job(row) if row else None
+
+    def jobs(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按创建顺序列出任务，可按状态过滤"""
+        if status is None:
+            rows = self._connect().execute("SELECT * FROM jobs ORDER BY created_at")
+        else:
+            rows = self._connect().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at", (status,)
+            )
+        return [_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        )
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .config import config
+from .context_packer import estimate_tokens
+from .model_router import get_model_router
+from .rate_limiter import get_rate_limiter
+from .singleflight import SingleFlight
+from .tracing import get_tracer
+
+
+class LLMCache:
+    """LLM 响应缓存 - 以 (模型, 指令, 提示词) 的内容哈希为键持久化到磁盘"""
+
+    def __init__(
+        self,
+        path: str = ".cache/llm_cache.sqlite3",
+        max_size_mb: float = 100,
+        ttl: Optional[float] = None,
+        enabled: bool = True,
+        bypass: bool = False,
+    ):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_config(cls) -> "LLMCache":
+        """根据 config.yaml 的 llm_cache 段创建缓存"""
+        settings = config.get_llm_cache_config()
+        return cls(
+            path=settings["path"],
+            max_size_mb=settings["max_size_mb"],
+            ttl=settings["ttl"],
+            enabled=settings["enabled"],
+            bypass=settings["bypass"],
+        )
+
+    @staticmethod
+    def make_key(model: str, instruction: str, prompt: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps([model, instruction, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _bypassed(self) -> bool:
+        return self.bypass or os.getenv("LLM_CACHE_BYPASS", "").lower() == "true"
+
+    def get(self, model: str, instruction: str, prompt: str) -> Optional[str]:
+        """查找缓存的响应，未命中或已过期时返回 None"""
+        if not self.enabled or self._bypassed():
+            return None
+
+        conn = self._connect()
+        key = self.make_key(model, instruction, prompt)
+        row = conn.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if row is not None:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+            self.misses += 1
+            return None
+
+        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def set(self, model: str, instruction: str, prompt: str, response: str) -> None:
+        """写入响应并按最近最少使用淘汰超出容量的条目"""
+        if not self.enabled:
+            return
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                self.make_key(model, instruction, prompt),
+                model,
+                response,
+                len(response.encode("utf-8")),
+                now,
+                now,
+            ),
+        )
+        self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        excess = total[0] - self.max_bytes
+        if excess <= 0:
+            return
+
+        freed = 0
+        stale = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        conn = self._connect()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _invoke(agent, instruction: str, prompt: str, model: str):
+    """以指定的指令和模型调用 agent
+
+    各阶段共享同一个运行时，运行时不绑定某个 agent 的注册信息，因此指令和
+    路由选出的模型每次都显式传给模型调用。
+    """
+    return agent.run(prompt, instruction=instruction, model=model)
+
+
+def _record_completion(span, response: Any) -> None:
+    text = response if isinstance(response, str) else str(response)
+    span.set(completion_chars=len(text), completion_tokens=estimate_tokens(text))
+
+
+async def cached_run(agent, agent_name: str, instruction: str, prompt: str) -> str:
+    """通过缓存执行 agent.run，命中时跳过模型调用
+
+    未命中时由模型路由器选择模型，首选模型慢或出错时回退到备选模型，
+    响应以实际作答的模型为键写入缓存。同时在途的相同调用只执行一次。
+    """
+    model = config.get_model(agent_name)
+    cache, router, limiter = get_llm_cache(), get_model_router(), get_rate_limiter()
+    with get_tracer().span(
+        "llm.call",
+        agent=agent_name,
+        model=model,
+        prompt_chars=len(prompt),
+        prompt_tokens=estimate_tokens(prompt),
+    ) as span:
+        cached = cache.get(model, instruction, prompt)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            _record_completion(span, cached)
+            return cached
+
+        async def miss():
+            async def call(routed: str):
+                # 限流和瞬时错误重试在回退到备选模型之前进行
+                return await limiter.call(
+                    routed,
+                    lambda: _invoke(agent, instruction, prompt, routed),
+                    estimate_tokens(prompt),
+                )
+
+            answered, response = await router.call(agent_name, call)
+            span.set(routed_model=answered)
+            if isinstance(response, str):
+                cache.set(answered, instruction, prompt, response)
+            return response
+
+        key = (agent_name, LLMCache.make_key(model, instruction, prompt))
+        flight = get_llm_flight()
+        span.set(coalesced=flight.in_flight(key))
+        response = await flight.do(key, miss)
+        _record_completion(span, response)
+        return response
+
+
+async def cached_stream(
+    agent, agent_name: str, instruction: str, prompt: str
+) -> AsyncIterator[str]:
+    """流式版本的 cached_run，命中缓存时一次性产出完整响应
+
+    agent 提供 stream() 时逐块产出，否则退回到 agent.run()。已产出的块无法撤回，
+    因此流式调用只使用路由器排序后的第一个模型，不做回退、对冲和重试，只限流。
+    """
+    model = config.get_model(agent_name)
+    cache, router, limiter = get_llm_cache(), get_model_router(), get_rate_limiter()
+    with get_tracer().span(
+        "llm.stream",
+        activate=False,
+        agent=agent_name,
+        model=model,
+        prompt_chars=len(prompt),
+        prompt_tokens=estimate_tokens(prompt),
+    ) as span:
+        cached = cache.get(model, instruction, prompt)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            _record_completion(span, cached)
+            yield cached
+            return
+
+        routed = router.order(agent_name)[0]
+        span.set(routed_model=routed)
+        stream = getattr(agent, "stream", None)
+        start = span.elapsed()
+        try:
+            if stream is None:
+                response = await limiter.call(
+                    routed,
+                    lambda: _invoke(agent, instruction, prompt, routed),
+                    estimate_tokens(prompt),
+                )
+                chunks = [response]
+                span.set(first_chunk_ms=round(span.elapsed() * 1000, 3))
+                yield response
+            else:
+                chunks = []
+                async with limiter.slot(routed, estimate_tokens(prompt)):
+                    async for chunk in stream(
+                        prompt, instruction=instruction, model=routed
+                    ):
+                        if not chunks:
+                            span.set(first_chunk_ms=round(span.elapsed() * 1000, 3))
+                        chunks.append(chunk)
+                        yield chunk
+        except Exception:
+            router.record(routed, span.elapsed() - start, False)
+            raise
+        router.record(routed, span.elapsed() - start, True)
+
+        response = "".join(chunks)
+        _record_completion(span, response)
+        cache.set(routed, instruction, prompt, response)
+
+
+# 全局 LLM 缓存实例
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """获取共享的LLM 缓存实例，首次调用时才读取配置"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache.from_config()
+    return _llm_cache
+
+
+_llm_flight: Optional[SingleFlight] = None
+
+
+def get_llm_flight() -> SingleFlight:
+    """获取共享的模型调用合并实例，首次调用时才读取配置"""
+    global _llm_flight
+    if _llm_flight is None:
+        _llm_flight = SingleFlight.from_config("llm")
+    return _llm_flight
@@ -1,78 +1,361 @@
-import fast
 import asyncio
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Hashable, List, Optional
 from dotenv import load_dotenv
 
-from .question_analyzer import analyze_question
-from .web_searcher import search_web
-from .analysis_chain import analyze_information, critical_review
-from .report_generator import generate_report, format_citations, save_report
+from .checkpoint import CheckpointStore, make_run_id
+from .citations import format_citations
+from .config import config
+from .llm_cache import get_llm_cache
+from .passage_index import retrieve_passages
+from .query_plan import QueryPlan
+from .runtime import deferred_chain, shutdown_shared_resources
+from .scheduler import DAGScheduler
+from .search_cache import normalize_query
+from .singleflight import SingleFlight
+from .streaming import ReportWriter
+from .tracing import get_tracer, summarize
 
 load_dotenv()
 
+# 流水线配置，见 config.yaml 的 workflow.profile
+PROFILES = ("standard", "fast")
 
-@fast.chain(
+# 合并同时在途的相同问题
+_workflow_flight: Optional[SingleFlight] = None
+
+
+def get_workflow_flight() -> SingleFlight:
+    """获取共享的工作流合并实例，首次调用时才读取配置"""
+    global _workflow_flight
+    if _workflow_flight is None:
+        _workflow_flight = SingleFlight.from_config("workflow")
+    return _workflow_flight
+
+
+class _ProgressFanout:
+    """把正在执行的工作流的进度事件转发给所有合并进来的调用
+
+    后加入的订阅者先补发加入前的事件，因此每个调用都能看到完整的阶段进度。
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        for event in self.events:
+            listener(event)
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        for listener in list(self.listeners):
+            listener(event)
+
+
+# 正在执行的工作流的进度转发，key 与 workflow flight 相同
+_progress: Dict[Hashable, _ProgressFanout] = {}
+
+
+def _load_agents() -> SimpleNamespace:
+    """导入各 agent 模块，推迟到工作流首次运行时"""
+    from .question_analyzer import analyze_question
+    from .web_searcher import search_web
+    from .analysis_chain import analyze_and_review, analyze_information, critical_review
+    from .report_generator import generate_report, save_report
+
+    return SimpleNamespace(
+        analyze_question=analyze_question,
+        search_web=search_web,
+        analyze_information=analyze_information,
+        critical_review=critical_review,
+        analyze_and_review=analyze_and_review,
+        generate_report=generate_report,
+        save_report=save_report,
+    )
+
+
+@deferred_chain(
+    loader=_load_agents,
     agents=[
         "analyze_question",
         "search_web",
         "analyze_information",
         "critical_review",
+        "analyze_and_review",
+        "analyze_chunk",
         "generate_report",
-        "format_citations",
-    ]
+    ],
 )
-async def research_workflow(research_question: str):
+async def research_workflow(
+    research_question: str,
+    stream: Optional[bool] = None,
+    run_id: Optional[str] = None,
+    resume: Optional[bool] = None,
+    profile: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
     """
     完整的研究工作流程
+
+    各阶段声明自己的输入，由 DAGScheduler 按依赖关系调度，相互独立的阶段并发执行。
+    网络搜索使用问题分析阶段给出的查询计划（子问题、按优先级排序的查询、预期来源数）。
+
+    stream 为 True 时（默认读取 report.stream 配置），报告边生成边写入文件并输出到终端。
+    报告正文用 [编号] 标注引用，参考文献列表在本地生成，不再调用模型。
+
+    每个阶段完成后结果写入 checkpoint.dir/<run_id>/，run_id 默认由问题文本生成；
+    resume 为 True 时（默认读取 checkpoint.resume 配置）跳过已有检查点的阶段。
+    运行成功后检查点即被删除，因此只有中断（且未超过 checkpoint.ttl）的运行会续跑。
+
+    profile 为 "fast" 时（默认读取 workflow.profile 配置）跳过搜索摘要，深度分析和
+    批判性审查合并为一次调用，模型调用从 5 次减少到 3 次。
+
+    on_progress 在每个阶段开始和完成时以事件字典调用，例如
+    {"event": "stage_started", "stage": "analysis", "label": "进行深度分析"}。
+
+    规范化后相同的问题（参数也相同）正在运行时，不再重复运行，而是等待并共享
+    其结果；这时 on_progress 同样收到该运行的阶段事件（加入前的事件会先补发）。
+
+    每次运行的阶段和模型调用 span 在结束时导出，并打印汇总表。
     """
+    key = (
+        normalize_query(research_question),
+        stream,
+        run_id,
+        resume,
+        profile or config.get_workflow_config()["profile"],
+    )
+    flight = get_workflow_flight()
+    fanout = _ProgressFanout()
+    if on_progress is not None:
+        fanout.subscribe(on_progress)
+
+    async def run():
+        # 本次调用负责执行，合并进来的调用通过 _progress 订阅进度
+        _progress[key] = fanout
+        try:
+            return await _traced_workflow(
+                research_question, stream, run_id, resume, profile, fanout.publish
+            )
+        finally:
+            if _progress.get(key) is fanout:
+                del _progress[key]
+
+    leader = _progress.get(key) if flight.in_flight(key) else None
+    if leader is not None and on_progress is not None:
+        leader.subscribe(on_progress)
+    try:
+        return await flight.do(key, run)
+    finally:
+        if leader is not None and on_progress is not None:
+            leader.unsubscribe(on_progress)
+
+
+async def _traced_workflow(
+    research_question: str,
+    stream: Optional[bool],
+    run_id: Optional[str],
+    resume: Optional[bool],
+    profile: Optional[str],
+    on_progress: Optional[Callable[[Dict[str, Any]], None]],
+):
+    """运行工作流并记录追踪"""
+    root = None
+    try:
+        with get_tracer().span("research_workflow", question=research_question) as root:
+            result = await _run_workflow(
+                research_question, stream, run_id, resume, profile, on_progress
+            )
+            root.set(run_id=result["run_id"])
+            return result
+    finally:
+        if root is not None:
+            _finish_trace(root)
+
+
+def _finish_trace(root) -> None:
+    """导出本次运行的 span 并打印汇总表"""
+    tracer = get_tracer()
+    spans = tracer.pop_trace(root.trace_id)
+    tracer.export(spans)
+    if config.get_tracing_config()["summary"]:
+        print("\n" + summarize(spans))
+
+
+async def _run_workflow(
+    research_question: str,
+    stream: Optional[bool],
+    run_id: Optional[str],
+    resume: Optional[bool],
+    profile: Optional[str],
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    if stream is None:
+        stream = config.get_report_config()["stream"]
+    profile = profile or config.get_workflow_config()["profile"]
+    if profile not in PROFILES:
+        raise ValueError(f"未知的流水线配置: {profile}")
     print(f"开始研究问题: {research_question}")
+    agents = _load_agents()
+    writer = ReportWriter() if stream else None
 
-    # 1. 分析问题
-    print("步骤 1: 分析研究问题...")
-    question_analysis = await analyze_question(research_question)
-    print("问题分析完成")
-
-    # 2. 提取搜索关键词并执行搜索
-    print("步骤 2: 执行网络搜索...")
-    # 简化版：从问题中提取关键词
-    keywords = research_question.split()[:3]  # 简单的关键词提取
-    search_results = await search_web(keywords)
-    print("搜索完成")
-
-    # 3. 深度分析
-    print("步骤 3: 进行深度分析...")
-    analysis = await analyze_information(search_results, question_analysis)
-    print("分析完成")
-
-    # 4. 批判性审查
-    print("步骤 4: 批判性审查...")
-    review = await critical_review(analysis)
-    print("审查完成")
-
-    # 5. 生成报告
-    print("步骤 5: 生成研究报告...")
-    report = await generate_report(
-        research_question, question_analysis, search_results, analysis, review
+    scheduler = DAGScheduler(config.get_workflow_config()["max_concurrency"])
+    scheduler.add(
+        "query_plan",
+        agents.analyze_question,
+        inputs=["question"],
+        label="分析研究问题",
+    )
+    scheduler.add(
+        "question_analysis",
+        lambda plan: plan["analysis"],
+        inputs=["query_plan"],
     )
-    print("报告生成完成")
+    scheduler.add(
+        "search_results",
+        lambda plan: agents.search_web(
+            plan["queries"],
+            QueryPlan.from_dict(plan).results_per_query(),
+            summarize=profile == "standard",
+        ),
+        inputs=["query_plan"],
+        label="执行网络搜索",
+    )
+    if config.get_retrieval_config()["enabled"]:
+        scheduler.add(
+            "evidence",
+            retrieve_passages,
+            inputs=["query_plan", "search_results"],
+            label="检索相关段落",
+        )
+    else:
+        scheduler.add(
+            "evidence", lambda search_results: search_results, ["search_results"]
+        )
+    if profile == "fast":
+        scheduler.add(
+            "analysis_review",
+            agents.analyze_and_review,
+            inputs=["evidence", "question_analysis"],
+            label="深度分析与批判性审查",
+        )
+        scheduler.add("analysis", lambda r: r["analysis"], ["analysis_review"])
+        scheduler.add("review", lambda r: r["review"], ["analysis_review"])
+    else:
+        scheduler.add(
+            "analysis",
+            agents.analyze_information,
+            inputs=["evidence", "question_analysis"],
+            label="进行深度分析",
+        )
+        scheduler.add(
+            "review",
+            agents.critical_review,
+            inputs=["analysis", "evidence"],
+            label="批判性审查",
+        )
+    scheduler.add(
+        "report",
+        lambda *args: agents.generate_report(
+            *args, on_chunk=writer.write if writer else None
+        ),
+        inputs=[
+            "question",
+            "question_analysis",
+            "evidence",
+            "analysis",
+            "review",
+        ],
+        label="生成研究报告",
+    )
+
+    def finalize(report: str, search_results: Dict[str, Any]) -> str:
+        final_report = format_citations(report, search_results.get("raw_results", []))
+        if writer is not None and writer.chars_written:
+            # 正文已流式写入，只追加参考文献
+            writer.write(final_report[len(report) :])
+        return final_report
+
+    scheduler.add(
+        "final_report",
+        finalize,
+        inputs=["report", "search_results"],
+        label="生成参考文献",
+    )
+
+    initial: Dict[str, Any] = {"question": research_question}
+    store = None
+    checkpoint_settings = config.get_checkpoint_config()
+    if checkpoint_settings["enabled"]:
+        if run_id is None:
+            run_id = make_run_id(research_question)
+            if profile != "standard":
+                # 不同流水线的中间结果不能混用
+                run_id = f"{run_id}-{profile}"
+        store = CheckpointStore(
+            run_id, checkpoint_settings["dir"], checkpoint_settings["ttl"]
+        )
+        if resume is None:
+            resume = checkpoint_settings["resume"]
+        if resume:
+            restored = store.load_all()
+            if restored:
+                print(f"从检查点恢复 {store.run_id}: {', '.join(sorted(restored))}")
+            initial.update(restored)
+        else:
+            store.clear()
 
-    # 6. 格式化引用
-    print("步骤 6: 格式化引用...")
-    sources = search_results.get("raw_results", [])
-    final_report = await format_citations(report, sources)
-    print("引用格式化完成")
+    def on_complete(name: str, value: Any) -> None:
+        if store is not None:
+            store.save(name, value)
+        if on_progress is not None:
+            on_progress({"event": "stage_completed", "stage": name})
 
-    # 7. 保存报告
-    filename = save_report(final_report)
+    def on_start(stage) -> None:
+        if on_progress is not None:
+            on_progress(
+                {"event": "stage_started", "stage": stage.name, "label": stage.label}
+            )
+
+    if writer is None:
+        results = await scheduler.run(initial, on_complete, on_start)
+    else:
+        with writer:
+            results = await scheduler.run(initial, on_complete, on_start)
+            if writer.chars_written == 0:
+                # 报告正文来自检查点，没有经过流式生成
+                writer.write(results["final_report"])
+    question_analysis = results["question_analysis"]
+    search_results = results["search_results"]
+    analysis = results["analysis"]
+    review = results["review"]
+    final_report = results["final_report"]
+
+    # 保存报告（流式模式下已边生成边写入）
+    filename = writer.filename if writer else agents.save_report(final_report)
     print(f"报告已保存为: {filename}")
+    if store is not None:
+        # 检查点只用于续跑中断的运行，成功后删除，再次提问会重新研究
+        store.clear()
 
     return {
         "question": research_question,
         "analysis": question_analysis,
+        "query_plan": results["query_plan"],
         "search_results": search_results,
         "detailed_analysis": analysis,
         "critical_review": review,
         "final_report": final_report,
         "saved_file": filename,
+        "streamed": bool(stream),
+        "profile": profile,
+        "run_id": store.run_id if store else None,
     }
 
 
@@ -84,6 +367,14 @@ async def main():
     print("基于 fast-agent 构建的智能研究系统")
     print()
 
+    try:
+        await _interactive_loop()
+    finally:
+        await shutdown_shared_resources()
+
+
+async def _interactive_loop():
+    """交互式问答循环"""
     while True:
         research_question = input("请输入您的研究问题 (输入 'quit' 退出): ")
 
@@ -100,14 +391,17 @@ async def main():
             result = await research_workflow(research_question)
             print("=" * 50)
             print(f"\n研究完成！报告已保存为: {result['saved_file']}")
-            print("\n" + "-" * 30)
-            print("报告预览:")
-            print("-" * 30)
-            print(
-                result["final_report"][:500] + "..."
-                if len(result["final_report"]) > 500
-                else result["final_report"]
-            )
+            if not result["streamed"]:
+                print("\n" + "-" * 30)
+                print("报告预览:")
+                print("-" * 30)
+                print(
+                    result["final_report"][:500] + "..."
+                    if len(result["final_report"]) > 500
+                    else result["final_report"]
+                )
+            stats = get_llm_cache().stats()
+            print(f"\nLLM 缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
             print("\n")
 
         except Exception as e:
@@ -0,0 +1,194 @@
+"""
+本地模拟 LLM 服务器
+
+实现 OpenAI 兼容的 /v1/chat/completions、/v1/models 以及 Ollama 的 /api/tags，
+可配置首 token 延迟、生成速度和响应长度，用于在没有 GPU 和网络的环境下
+端到端地测试和压测编排层：
+
+    python -m research_agent.mock_llm_server --latency 0.2 --tokens-per-second 200
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from .config import config
+
+
+class MockLLMStats:
+    """请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self.prompt_chars = 0
+        # 按请求中的 model 字段计数
+        self.models: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "peak_active": self.peak_active,
+            "prompt_chars": self.prompt_chars,
+            "models": dict(self.models),
+        }
+
+
+STATS_KEY = web.AppKey("stats", MockLLMStats)
+
+
+def _completion_text(prompt: str, response_tokens: int) -> str:
+    """生成固定长度的确定性响应，每个 token 对应一个词
+
+    响应带有提示词的哈希，不同提示词（即使长度相同）得到不同的响应。
+    """
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+    words = [f"token{i % 50}" for i in range(response_tokens)]
+    return f"模拟回答({digest}, {len(prompt)} 字符提示词): " + " ".join(words)
+
+
+def create_app(
+    latency: float = 0.0,
+    tokens_per_second: float = 0.0,
+    response_tokens: int = 200,
+    models: Optional[List[str]] = None,
+) -> web.Application:
+    """创建模拟服务器
+
+    latency 为首 token 延迟（秒），tokens_per_second 为生成速度（0 表示不限速），
+    response_tokens 为每个响应的 token 数。
+    """
+    stats = MockLLMStats()
+    models = models or ["llama3.2:latest", "qwen2.5:latest"]
+
+    def token_delay() -> float:
+        return 1 / tokens_per_second if tokens_per_second else 0.0
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = "".join(str(m.get("content", "")) for m in messages)
+        model = body.get("model", models[0])
+
+        stats.requests += 1
+        stats.active += 1
+        stats.peak_active = max(stats.peak_active, stats.active)
+        stats.prompt_chars += len(prompt)
+        stats.models[model] = stats.models.get(model, 0) + 1
+        try:
+            await asyncio.sleep(latency)
+            text = _completion_text(prompt, response_tokens)
+            created = int(time.time())
+
+            if not body.get("stream"):
+                await asyncio.sleep(token_delay() * response_tokens)
+                return web.json_response(
+                    {
+                        "id": f"chatcmpl-mock-{stats.requests}",
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": text},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": len(prompt) // 4,
+                            "completion_tokens": response_tokens,
+                            "total_tokens": len(prompt) // 4 + response_tokens,
+                        },
+                    }
+                )
+
+            response = web.StreamResponse(
+                headers={
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                }
+            )
+            await response.prepare(request)
+            pieces = text.split(" ")
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    "id": f"chatcmpl-mock-{stats.requests}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": piece if i == 0 else " " + piece},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                await response.write(
+                    f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+                )
+                if i:
+                    await asyncio.sleep(token_delay())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+        finally:
+            stats.active -= 1
+
+    async def list_models(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "object": "list",
+                "data": [
+                    {"id": m, "object": "model", "owned_by": "mock"} for m in models
+                ],
+            }
+        )
+
+    async def ollama_tags(request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": m, "model": m} for m in models]})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats.to_dict())
+
+    app = web.Application()
+    app[STATS_KEY] = stats
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/v1/models", list_models)
+    app.router.add_get("/api/tags", ollama_tags)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def default_address() -> tuple:
+    """从 ollama.base_url 读取监听地址"""
+    parts = urlsplit(config.get_ollama_config()["base_url"])
+    return parts.hostname or "127.0.0.1", parts.port or 11434
+
+
+def main():
+    host, port = default_address()
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务器")
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="首 token 延迟（秒）"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--response-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_second, args.response_tokens)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .config import config
+from .rate_limiter import is_retryable
+from .tracing import get_tracer
+
+T = TypeVar("T")
+
+
+class ModelStats:
+    """单个模型的滚动延迟和错误统计"""
+
+    def __init__(self, window: int = 20):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "p50": self.latency_percentile(50),
+            "p95": self.latency_percentile(95),
+            "circuit_open": self.open_until > time.monotonic(),
+        }
+
+
+class ModelRouter:
+    """延迟感知的模型路由器
+
+    按 agent 的首选模型和备选模型排序：熔断中的模型排最后，p95 延迟超过阈值的
+    模型排在正常模型之后。只有限流、超时、连接错误和 5xx 这类暂时性错误才回退到
+    下一个模型，认证失败、请求无效等错误直接抛出；全部失败时抛出排在最前的模型的
+    错误。对配置了对冲的 agent，首选模型在 hedge_delay 秒内没有返回时，同时向备选
+    模型发出请求，取先返回的结果。call() 同时返回实际作答的模型，调用方据此写缓存
+    和追踪。
+
+    另一侧（云端/本地）的模型默认不作为备选，cross_side_fallback 为 True 时才加入。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        latency_threshold: float = 30.0,
+        error_threshold: float = 0.5,
+        window: int = 20,
+        cooldown: float = 30.0,
+        hedge_agents: Optional[List[str]] = None,
+        hedge_delay: float = 2.0,
+        fallbacks: Optional[Dict[str, List[str]]] = None,
+        cross_side_fallback: bool = False,
+    ):
+        self.enabled = enabled
+        self.latency_threshold = latency_threshold
+        self.error_threshold = error_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.hedge_agents = set(hedge_agents or [])
+        self.hedge_delay = hedge_delay
+        self.fallbacks = fallbacks or {}
+        self.cross_side_fallback = cross_side_fallback
+        self.stats: Dict[str, ModelStats] = {}
+
+    @classmethod
+    def from_config(cls) -> "ModelRouter":
+        """根据 config.yaml 的 routing 段创建路由器"""
+        settings = config.get_routing_config()
+        return cls(
+            enabled=settings["enabled"],
+            latency_threshold=settings["latency_threshold"],
+            error_threshold=settings["error_threshold"],
+            window=settings["window"],
+            cooldown=settings["cooldown"],
+            hedge_agents=settings["hedge_agents"],
+            hedge_delay=settings["hedge_delay"],
+            fallbacks=settings["fallbacks"],
+            cross_side_fallback=settings["cross_side_fallback"],
+        )
+
+    def _stats(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats(self.window)
+        return self.stats[model]
+
+    def candidates(self, agent_name: str) -> List[str]:
+        """agent 的候选模型：首选模型、显式配置的备选，以及（启用时）另一侧模型"""
+        primary = config.get_model(agent_name)
+        ordered = [primary, *self.fallbacks.get(primary, [])]
+        if self.cross_side_fallback:
+            agent_models = config.config.get("agents", {}).get(agent_name, {})
+            defaults = config.config.get("defaults", {})
+            if config.is_using_local():
+                ordered += [agent_models.get("cloud"), defaults.get("cloud_model")]
+            else:
+                ordered += [agent_models.get("local"), defaults.get("local_model")]
+
+        result: List[str] = []
+        for model in ordered:
+            if model and model not in result:
+                result.append(model)
+        return result
+
+    def _tier(self, model: str) -> int:
+        stats = self.stats.get(model)
+        if stats is None:
+            return 0
+        if stats.open_until > time.monotonic():
+            return 2
+        p95 = stats.latency_percentile(95)
+        if (
+            p95 is not None
+            and len(stats.latencies) >= 3
+            and p95 > self.latency_threshold
+        ):
+            return 1
+        return 0
+
+    def order(self, agent_name: str) -> List[str]:
+        """按健康状况排序的候选模型"""
+        candidates = self.candidates(agent_name)
+        if not self.enabled:
+            return candidates[:1]
+        return sorted(candidates, key=self._tier)
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        """记录一次调用结果，错误过多时在 cooldown 秒内熔断该模型"""
+        stats = self._stats(model)
+        stats.record(latency, ok)
+        if not ok and (
+            stats.consecutive_failures >= 2
+            or (len(stats.outcomes) >= 4 and stats.error_rate >= self.error_threshold)
+        ):
+            stats.open_until = time.monotonic() + self.cooldown
+
+    async def _attempt(
+        self, model: str, call: Callable[[str], Awaitable[T]], hedged: bool = False
+    ) -> Tuple[str, T]:
+        start = time.perf_counter()
+        with get_tracer().span("llm.attempt", model=model, hedged=hedged):
+            try:
+                result = await call(model)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.record(model, time.perf_counter() - start, False)
+                raise
+        self.record(model, time.perf_counter() - start, True)
+        return model, result
+
+    async def call(
+        self, agent_name: str, call: Callable[[str], Awaitable[T]]
+    ) -> Tuple[str, T]:
+        """以路由选出的模型执行 call(model)，暂时性错误时回退
+
+        返回 (作答的模型, 结果)；对冲或回退时作答的模型不一定是首先发起调用的模型。
+        """
+        models = self.order(agent_name)
+        first_error: Optional[Exception] = None
+        if len(models) > 1 and agent_name in self.hedge_agents:
+            try:
+                return await self._hedged(models[0], models[1], call)
+            except Exception as e:
+                if len(models) == 2 or not is_retryable(e):
+                    raise
+                print(f"模型 {models[0]} 和 {models[1]} 均失败，继续回退: {e}")
+                first_error = e
+                models = models[2:]
+
+        for model in models:
+            try:
+                return await self._attempt(model, call)
+            except Exception as e:
+                first_error = first_error or e
+                if not is_retryable(e):
+                    break
+                print(f"模型 {model} 调用失败，尝试回退: {e}")
+        assert first_error is not None
+        raise first_error
+
+    async def _hedged(
+        self, primary: str, secondary: str, call: Callable[[str], Awaitable[T]]
+    ) -> Tuple[str, T]:
+        """对冲请求：首选模型超过 hedge_delay 未返回时并行请求备选模型"""
+        tasks = [asyncio.ensure_future(self._attempt(primary, call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if done:
+                error = tasks[0].exception()
+                if error is None:
+                    return tasks[0].result()
+                if not is_retryable(error):
+                    raise error
+            tasks.append(
+                asyncio.ensure_future(self._attempt(secondary, call, hedged=True))
+            )
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if task is tasks[0] and not is_retryable(task.exception()):
+                        raise task.exception()
+            # 两个模型都失败时抛出首选模型的错误
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各模型当前的统计"""
+        return {model: stats.to_dict() for model, stats in self.stats.items()}
+
+
+# 全局模型路由器实例
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """获取共享的模型路由器实例，首次调用时才读取配置"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter.from_config()
+    return _model_router
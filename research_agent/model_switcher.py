@@ -1,24 +1,65 @@
+import asyncio
 import os
-import subprocess
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
 from .config import config
 
 
 class ModelSwitcher:
     """模型切换器 - 在云端和本地模型之间切换"""
 
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None):
         self.config = config
+        ollama = config.get_ollama_config()
+        self.base_url = (base_url or ollama["base_url"]).rstrip("/")
+        self.probe_ttl = ollama.get("probe_ttl", 10)
+        self.probe_timeout = ollama.get("probe_timeout", 2)
+        self.last_probe: Optional[Dict[str, Any]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def _run_probe(self) -> Dict[str, Any]:
+        """请求 Ollama 的 OpenAI 兼容 /models 接口，记录可达性、延迟和模型列表"""
+        start = time.perf_counter()
+        probe: Dict[str, Any] = {"ok": False, "models": [], "error": None}
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(f"{self.base_url}/models") as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+            probe["ok"] = True
+            probe["models"] = [m["id"] for m in data.get("data", []) if "id" in m]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            probe["error"] = f"{type(e).__name__}: {e}"
+
+        probe["latency"] = time.perf_counter() - start
+        probe["checked_at"] = time.monotonic()
+        self.last_probe = probe
+        return probe
+
+    async def probe_ollama(self, force: bool = False) -> Dict[str, Any]:
+        """获取 Ollama 探测结果
+
+        结果在 probe_ttl 秒内直接复用；过期后在 2 倍 TTL 内先返回旧结果，
+        同时在后台刷新，避免热路径等待网络请求。
+        """
+        probe = self.last_probe
+        if probe is not None and not force:
+            age = time.monotonic() - probe["checked_at"]
+            if age < self.probe_ttl:
+                return probe
+            if age < self.probe_ttl * 2:
+                if self._refresh_task is None or self._refresh_task.done():
+                    self._refresh_task = asyncio.ensure_future(self._run_probe())
+                return probe
+        return await self._run_probe()
 
     async def check_ollama_status(self) -> bool:
-        """检查 Ollama 服务是否运行"""
-        try:
-            # 检查 Ollama 进程
-            result = subprocess.run(
-                ["pgrep", "-f", "ollama"], capture_output=True, text=True
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        """检查 Ollama 服务是否可访问"""
+        return (await self.probe_ollama())["ok"]
 
     async def list_available_models(self) -> dict:
         """列出可用的模型"""
@@ -33,20 +74,10 @@ class ModelSwitcher:
         if os.getenv("OPENAI_API_KEY"):
             models["cloud"].extend(["openai.gpt-4o", "openai.gpt-3.5-turbo"])
 
-        # 本地模型（如果 Ollama 运行中）
-        if await self.check_ollama_status():
-            try:
-                result = subprocess.run(
-                    ["ollama", "list"], capture_output=True, text=True
-                )
-                if result.returncode == 0:
-                    lines = result.stdout.strip().split("\n")[1:]  # 跳过标题行
-                    for line in lines:
-                        if line.strip():
-                            model_name = line.split()[0]
-                            models["local"].append(f"generic.{model_name}")
-            except Exception as e:
-                print(f"获取 Ollama 模型列表失败: {e}")
+        # 本地模型（如果 Ollama 可访问）
+        probe = await self.probe_ollama()
+        if probe["ok"]:
+            models["local"].extend(f"generic.{name}" for name in probe["models"])
 
         return models
 
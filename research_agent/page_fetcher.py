@@ -0,0 +1,348 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .config import config
+from .tracing import get_tracer
+
+# 内容不参与正文提取的标签
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "footer", "aside"}
+# 结束时换行的块级标签
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "br", "li", "ul", "ol", "table", "tr",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "header", "main",
+}  # fmt: skip
+# 只抓取 text/* 和 XHTML 页面，PDF、图片等其他类型跳过
+TEXT_TYPES = {"application/xhtml+xml"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title: List[str] = []
+        self.parts: List[str] = []
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip:
+            self.parts.append(data)
+
+
+def extract_text(html: str) -> Tuple[str, str]:
+    """从 HTML 中提取标题和正文，去掉脚本、样式和导航，合并空白
+
+    模块级函数，可以在进程池中执行。
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    text = "\n".join(line for line in lines if line)
+    return " ".join("".join(parser.title).split()), text
+
+
+class PageCache:
+    """页面缓存 - 保存提取后的正文及 ETag/Last-Modified，用于条件请求"""
+
+    def __init__(self, path: str = ".cache/page_cache.sqlite3"):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT etag, last_modified, title, content, fetched_at "
+                "FROM pages WHERE url = ?",
+                (url,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        keys = ("etag", "last_modified", "title", "content", "fetched_at")
+        return dict(zip(keys, row))
+
+    def set(
+        self,
+        url: str,
+        title: str,
+        content: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, title, content, time.time()),
+        )
+        conn.commit()
+
+    def touch(self, url: str) -> None:
+        """条件请求返回 304 后刷新抓取时间"""
+        conn = self._connect()
+        conn.execute(
+            "UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url)
+        )
+        conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class PageFetcher:
+    """网页抓取器
+
+    共享 aiohttp 连接池（支持 gzip 压缩传输），按域名限制并发；命中缓存的页面
+    在 revalidate_after 秒内直接复用，之后用 ETag/Last-Modified 发条件请求；
+    HTML 正文提取在进程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        cache: Optional[PageCache] = None,
+        timeout: float = 15,
+        max_connections: int = 20,
+        per_domain: int = 2,
+        max_bytes: int = 2_000_000,
+        max_chars: int = 20000,
+        workers: int = 2,
+        revalidate_after: float = 3600,
+        user_agent: str = "research-agent/0.1",
+    ):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_domain = per_domain
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.workers = workers
+        self.revalidate_after = revalidate_after
+        self.user_agent = user_agent
+        self.stats = {
+            "fetched": 0,
+            "not_modified": 0,
+            "cached": 0,
+            "skipped": 0,
+            "errors": 0,
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._domains: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_config(cls) -> "PageFetcher":
+        """根据 config.yaml 的 fetch 段创建抓取器"""
+        settings = config.get_fetch_config()
+        return cls(
+            cache=PageCache(settings["cache_path"]),
+            timeout=settings["timeout"],
+            max_connections=settings["max_connections"],
+            per_domain=settings["per_domain"],
+            max_bytes=settings["max_bytes"],
+            max_chars=settings["max_chars"],
+            workers=settings["workers"],
+            revalidate_after=settings["revalidate_after"],
+            user_agent=settings["user_agent"],
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "User-Agent": self.user_agent,
+                    "Accept-Encoding": "gzip, deflate",
+                },
+            )
+        return self._session
+
+    def _domain_limit(self, url: str) -> asyncio.Semaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        if host not in self._domains:
+            self._domains[host] = asyncio.Semaphore(self.per_domain)
+        return self._domains[host]
+
+    async def _extract(self, html: str) -> Tuple[str, str]:
+        if self.workers <= 0:
+            return extract_text(html)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, extract_text, html)
+
+    async def fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """抓取单个页面，返回 {url, title, content, status}，失败时返回 None"""
+        cached = self.cache.get(url) if self.cache else None
+        if cached and time.time() - cached["fetched_at"] < self.revalidate_after:
+            self.stats["cached"] += 1
+            return {**_page(url, cached), "status": "cached"}
+
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        with get_tracer().span("fetch.page", url=url) as span:
+            try:
+                async with self._domain_limit(url):
+                    async with self._get_session().get(
+                        url, headers=headers
+                    ) as response:
+                        if response.status == 304 and cached:
+                            self.cache.touch(url)
+                            self.stats["not_modified"] += 1
+                            span.set(status=304)
+                            return {**_page(url, cached), "status": "not_modified"}
+                        response.raise_for_status()
+                        content_type = response.content_type
+                        if not _is_text(content_type):
+                            self.stats["skipped"] += 1
+                            span.set(status=response.status, skipped=content_type)
+                            return None
+                        body = await _read_limited(response, self.max_bytes)
+                        charset = response.charset or "utf-8"
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.stats["errors"] += 1
+                span.set(error=str(e))
+                print(f"抓取 {url} 时出错: {e}")
+                return None
+
+            try:
+                text = body.decode(charset, errors="replace")
+            except LookupError:  # 响应头声明了无法识别的字符集
+                text = body.decode("utf-8", errors="replace")
+            if "html" in content_type:
+                title, content = await self._extract(text)
+            else:
+                title, content = "", text.strip()
+            content = content[: self.max_chars]
+            span.set(status=200, bytes=len(body), content_chars=len(content))
+
+        if self.cache:
+            self.cache.set(url, title, content, etag, last_modified)
+        self.stats["fetched"] += 1
+        return {"url": url, "title": title, "content": content, "status": "fetched"}
+
+    async def fetch_sources(
+        self, sources: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """并发抓取搜索结果对应的页面，把正文写入 content 字段
+
+        抓取失败或没有 URL 的来源原样保留，仍使用搜索摘要。
+        """
+
+        async def _fetch(source: Dict[str, Any]) -> Dict[str, Any]:
+            url = source.get("url")
+            page = await self.fetch(url) if url else None
+            if not page or not page["content"]:
+                return source
+            return {
+                **source,
+                "title": source.get("title") or page["title"],
+                "content": page["content"],
+            }
+
+        return list(await asyncio.gather(*(_fetch(s) for s in sources)))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _is_text(content_type: str) -> bool:
+    """只抓取文本类内容"""
+    return content_type.startswith("text/") or content_type in TEXT_TYPES
+
+
+async def _read_limited(response: aiohttp.ClientResponse, limit: int) -> bytes:
+    """读取响应体（已解压），超过 limit 字节的部分丢弃"""
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return b"".join(chunks)[:limit]
+
+
+def _page(url: str, cached: Dict[str, Any]) -> Dict[str, Any]:
+    return {"url": url, "title": cached["title"], "content": cached["content"]}
+
+
+_page_fetcher: Optional[PageFetcher] = None
+
+
+def get_page_fetcher() -> PageFetcher:
+    """获取共享的网页抓取器实例"""
+    global _page_fetcher
+    if _page_fetcher is None:
+        _page_fetcher = PageFetcher.from_config()
+    return _page_fetcher
+
+
+async def close_page_fetcher() -> None:
+    """关闭共享的网页抓取器"""
+    global _page_fetcher
+    if _page_fetcher is not None:
+        await _page_fetcher.close()
+        _page_fetcher = None
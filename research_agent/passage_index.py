@@ -0,0 +1,426 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import config
+from .context_packer import estimate_tokens, tokenize
+
+_SENTENCE_RE = re.compile(r"(?<=[。！？；!?;.])\s+|(?<=[。！？；])|\n+")
+
+
+def split_passages(text: str, max_tokens: int = 120) -> List[str]:
+    """按句子把文本切成不超过 max_tokens 的段落"""
+    passages: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        # 单句超长时按字符硬切（CJK 1 字约 1 token，是保守的上限）
+        while estimate_tokens(sentence) > max_tokens:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(sentence[:max_tokens])
+            sentence = sentence[max_tokens:]
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and estimate_tokens(candidate) > max_tokens:
+            passages.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        passages.append(current)
+    return passages
+
+
+def _numpy() -> Any:
+    """按需导入 numpy，未安装时返回 None
+
+    哈希词向量是可选功能（pip install research-agent[vectors]），只用 BM25 时不导入。
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _passage_id(url: str, text: str) -> str:
+    return hashlib.sha1(f"{url}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _atomic_write(target: str, data: bytes) -> None:
+    """先写临时文件再原子替换，多个进程同时写同一文件时不会留下半个文件"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+class PassageIndex:
+    """来源段落的本地检索索引
+
+    段落按来源 URL 分片持久化到 path/sources/，同一 URL 的内容变化时整片覆盖，
+    检索时只加载当前来源的分片；内存中最多保留 max_sources 个最近使用的来源。
+    BM25 分数在候选段落上计算。安装 numpy 且 vectors 为 True 时，额外用哈希技巧
+    计算词项向量，以分片内容哈希命名存放在内存映射的 float32 文件中，与 BM25
+    分数加权混合。这仍是词面匹配，不是语义嵌入：没有使用任何嵌入模型，同义词和
+    改写不会因此匹配上，它只在 BM25 之外补充一个归一化的词重叠分数。文件都先写
+    临时文件再原子替换，多个进程共用目录无需加锁；同一进程内的多个线程通过
+    _lock 串行访问。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        passage_tokens: int = 120,
+        vectors: bool = False,
+        vector_dim: int = 256,
+        vector_weight: float = 0.3,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_sources: int = 500,
+    ):
+        self.path = path
+        self.passage_tokens = passage_tokens
+        self.vector_dim = vector_dim
+        self.vector_weight = vector_weight
+        self.k1 = k1
+        self.b = b
+        self.max_sources = max_sources
+        # 只有开启向量时才导入 numpy
+        self.vectors = vectors and _numpy() is not None
+        if vectors and not self.vectors:
+            print("未安装 numpy，段落检索仅使用 BM25")
+
+        # url -> 分片：digest、passages、每个段落的词频和长度、向量、是否未保存
+        self._sources: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls) -> "PassageIndex":
+        """根据 config.yaml 的 retrieval 段创建索引"""
+        settings = config.get_retrieval_config()
+        return cls(
+            path=settings["path"],
+            passage_tokens=settings["passage_tokens"],
+            vectors=settings["vectors"],
+            vector_dim=settings["vector_dim"],
+            vector_weight=settings["vector_weight"],
+            max_sources=settings["max_sources"],
+        )
+
+    def __len__(self) -> int:
+        """内存中的段落数"""
+        return sum(len(shard["passages"]) for shard in self._sources.values())
+
+    def _digest(self, source: Dict[str, Any]) -> str:
+        """来源内容（和切分参数）的哈希，内容不变时复用已保存的分片"""
+        text = source.get("content") or source.get("summary") or ""
+        key = f"{self.passage_tokens}\n{source.get('title', '')}\n{text}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def _shard_file(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.path, "sources", f"{name}.json")
+
+    def _vector_file(self, digest: str) -> str:
+        return os.path.join(self.path, "vectors", f"{digest}-{self.vector_dim}.f32")
+
+    @staticmethod
+    def _terms(passage: Dict[str, Any]) -> List[str]:
+        return tokenize(f"{passage.get('title', '')} {passage['text']}")
+
+    def _embed(self, terms: Iterable[str]) -> Any:
+        """哈希技巧词项向量（crc32 保证跨进程稳定），L2 归一化
+
+        每个词项按哈希落到一个维度上，余弦相似度只反映共有词项（以及哈希冲突），
+        不携带语义信息。
+        """
+        np = _numpy()
+        vector = np.zeros(self.vector_dim, dtype=np.float32)
+        for term in terms:
+            h = zlib.crc32(term.encode("utf-8"))
+            vector[h % self.vector_dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _map_vectors(self, digest: str, rows: int) -> Any:
+        """内存映射已保存的向量文件，不存在或不完整时返回 None"""
+        if self.path is None or not rows:
+            return None
+        target = self._vector_file(digest)
+        if (
+            not os.path.exists(target)
+            or os.path.getsize(target) != 4 * rows * self.vector_dim
+        ):
+            return None
+        np = _numpy()
+        return np.memmap(
+            target, dtype=np.float32, mode="r", shape=(rows, self.vector_dim)
+        )
+
+    def _shard(self, digest: str, passages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """为一个来源的段落计算词频，开启向量时加载或计算向量"""
+        counts: List[Dict[str, int]] = []
+        lengths: List[int] = []
+        embedded = []
+        for passage in passages:
+            terms = self._terms(passage)
+            tf: Dict[str, int] = {}
+            for term in terms:
+                tf[term] = tf.get(term, 0) + 1
+            counts.append(tf)
+            lengths.append(len(terms))
+            if self.vectors:
+                embedded.append(terms)
+
+        vectors = None
+        if self.vectors and passages:
+            vectors = self._map_vectors(digest, len(passages))
+            if vectors is None:
+                vectors = _numpy().asarray(
+                    [self._embed(terms) for terms in embedded], dtype="float32"
+                )
+        return {
+            "digest": digest,
+            "passages": passages,
+            "counts": counts,
+            "lengths": lengths,
+            "vectors": vectors,
+            "dirty": False,
+        }
+
+    def _read_shard(
+        self, url: str, digest: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """读取已保存的分片，不存在或与 digest 不一致时返回 None"""
+        if self.path is None:
+            return None
+        try:
+            with open(self._shard_file(url), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("url") != url or digest not in (None, data.get("digest")):
+            return None
+        return self._shard(data["digest"], data["passages"])
+
+    def _write(self, url: str, shard: Dict[str, Any]) -> None:
+        """保存分片和向量"""
+        record = {"url": url, "digest": shard["digest"], "passages": shard["passages"]}
+        _atomic_write(
+            self._shard_file(url),
+            json.dumps(record, ensure_ascii=False).encode("utf-8"),
+        )
+        shard["dirty"] = False
+        vectors = shard["vectors"]
+        if vectors is not None and not isinstance(vectors, _numpy().memmap):
+            # 文件名由内容决定，多个进程写入的内容相同
+            target = self._vector_file(shard["digest"])
+            if not os.path.exists(target):
+                _atomic_write(target, vectors.tobytes())
+            shard["vectors"] = self._map_vectors(
+                shard["digest"], len(shard["passages"])
+            )
+
+    def _evict(self, keep: int) -> None:
+        """超过 max_sources 时淘汰最久未使用的来源，至少保留最近的 keep 个"""
+        if not self.max_sources:
+            return
+        while len(self._sources) > max(self.max_sources, keep):
+            url, shard = self._sources.popitem(last=False)
+            if shard["dirty"] and self.path is not None:
+                self._write(url, shard)
+
+    def add_sources(self, sources: List[Dict[str, Any]]) -> int:
+        """把来源切成段落加入索引，返回新切分的段落数
+
+        内容未变的来源直接复用内存或磁盘上的分片。没有 URL 的来源无法按来源
+        检索，不加入索引。
+        """
+        with self._lock:
+            added = 0
+            urls: Set[str] = set()
+            for source in sources:
+                url = source.get("url")
+                if not url:
+                    continue
+                urls.add(url)
+                digest = self._digest(source)
+                shard = self._sources.get(url)
+                if shard is None or shard["digest"] != digest:
+                    shard = self._read_shard(url, digest)
+                if shard is None:
+                    text = source.get("content") or source.get("summary") or ""
+                    chunks = split_passages(str(text), self.passage_tokens)
+                    passages = [
+                        {
+                            "id": _passage_id(url, chunk),
+                            "url": url,
+                            "title": source.get("title", ""),
+                            "text": chunk,
+                        }
+                        for chunk in chunks
+                    ]
+                    shard = self._shard(digest, passages)
+                    shard["dirty"] = True
+                    added += len(passages)
+                self._sources[url] = shard
+                self._sources.move_to_end(url)
+            self._evict(len(urls))
+            return added
+
+    def _bm25(
+        self, query_terms: Set[str], docs: List[Tuple[Dict[str, Any], int]]
+    ) -> Dict[int, float]:
+        n = len(docs)
+        total_length = sum(shard["lengths"][i] for shard, i in docs)
+        avg_length = total_length / n if n else 0.0
+        df = {
+            term: sum(1 for shard, i in docs if term in shard["counts"][i])
+            for term in query_terms
+        }
+        scores: Dict[int, float] = {}
+        for doc, (shard, i) in enumerate(docs):
+            counts = shard["counts"][i]
+            norm = 1 - self.b + self.b * shard["lengths"][i] / (avg_length or 1)
+            for term in query_terms:
+                tf = counts.get(term)
+                if not tf:
+                    continue
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (
+                    tf + self.k1 * norm
+                )
+        return scores
+
+    def _cosine(
+        self, query_terms: List[str], docs: List[Tuple[Dict[str, Any], int]]
+    ) -> Dict[int, float]:
+        np = _numpy()
+        query = self._embed(query_terms)
+        return {
+            doc: float(np.dot(shard["vectors"][i], query))
+            for doc, (shard, i) in enumerate(docs)
+            if shard["vectors"] is not None
+        }
+
+    def search(
+        self, query: str, k: int = 5, urls: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """检索与查询最相关的 k 个段落
+
+        urls 限定只在这些来源中检索，不在内存中的来源从磁盘加载；不指定时在内存中
+        的全部来源中检索。
+        """
+        with self._lock:
+            if urls is None:
+                selected = list(self._sources)
+            else:
+                for url in urls - set(self._sources):
+                    shard = self._read_shard(url)
+                    if shard is not None:
+                        self._sources[url] = shard
+                self._evict(len(urls))
+                selected = [url for url in self._sources if url in urls]
+            docs = [
+                (self._sources[url], i)
+                for url in selected
+                for i in range(len(self._sources[url]["passages"]))
+            ]
+            query_terms = tokenize(query)
+            scores = self._bm25(set(query_terms), docs)
+
+            if self.vectors and scores:
+                top = max(scores.values())
+                cosine = self._cosine(query_terms, docs)
+                scores = {
+                    doc: scores.get(doc, 0.0) / top + self.vector_weight * cosine[doc]
+                    for doc in cosine
+                    if doc in scores or cosine[doc] > 0
+                }
+
+            ranked = sorted(scores, key=lambda doc: (-scores[doc], doc))[:k]
+            return [
+                {
+                    **docs[doc][0]["passages"][docs[doc][1]],
+                    "score": round(scores[doc], 4),
+                }
+                for doc in ranked
+            ]
+
+    def save(self) -> None:
+        """把新增或内容变化的分片（和向量）写入磁盘"""
+        if self.path is None:
+            return
+        with self._lock:
+            for url, shard in self._sources.items():
+                if shard["dirty"]:
+                    self._write(url, shard)
+
+
+def _retrieve(
+    plan: Dict[str, Any],
+    search_data: Dict[str, Any],
+    index: PassageIndex,
+    top_k: int,
+) -> Dict[str, Any]:
+    sources = search_data.get("raw_results", [])
+    numbers: Dict[str, int] = {}
+    for i, source in enumerate(sources):
+        if source.get("url"):
+            numbers.setdefault(source["url"], i + 1)
+
+    # 持有锁直到检索结束，其他线程的加入不会淘汰本次的来源
+    with index._lock:
+        index.add_sources(sources)
+        index.save()
+        selected: Dict[str, Dict[str, Any]] = {}
+        for question in plan.get("sub_questions") or plan.get("queries") or []:
+            for hit in index.search(question, top_k, urls=set(numbers)):
+                if hit["id"] not in selected:
+                    selected[hit["id"]] = {
+                        **hit,
+                        "source": numbers[hit["url"]],
+                        "sub_question": question,
+                    }
+    return {**search_data, "passages": list(selected.values())}
+
+
+async def retrieve_passages(
+    plan: Dict[str, Any],
+    search_data: Dict[str, Any],
+    index: Optional[PassageIndex] = None,
+    top_k: Optional[int] = None,
+) -> Dict[str, Any]:
+    """为每个子问题检索 top_k 个段落，附加到搜索数据的 passages 字段
+
+    段落的 source 为来源在 raw_results 中的序号（从 1 开始），与引用编号一致。
+    切分、分词和读写磁盘在线程中执行，不阻塞事件循环。
+    """
+    index = index or get_passage_index()
+    if top_k is None:
+        top_k = config.get_retrieval_config()["top_k"]
+    return await asyncio.to_thread(_retrieve, plan, search_data, index, top_k)
+
+
+# 全局段落索引实例（首次检索时才从磁盘加载）
+_passage_index: Optional[PassageIndex] = None
+
+
+def get_passage_index() -> PassageIndex:
+    """获取共享的段落索引实例，首次调用时才读取配置"""
+    global _passage_index
+    if _passage_index is None:
+        _passage_index = PassageIndex.from_config()
+    return _passage_index
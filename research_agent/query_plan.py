@@ -0,0 +1,193 @@
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .search_cache import normalize_query
+
+# 英文停用词，以及中文问句里常见的虚词和疑问词
+STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "between", "by", "can",
+    "compare", "current", "do", "does", "for", "from", "how", "in", "is", "it",
+    "its", "of", "on", "or", "should", "than", "that", "the", "their", "this",
+    "to", "vs", "was", "what", "when", "where", "which", "who", "why", "will",
+    "with", "would",
+}  # fmt: skip
+CJK_STOPWORDS = [
+    "为什么", "怎么样", "是什么", "有哪些", "有什么", "如何", "怎样", "什么",
+    "哪些", "哪个", "是否", "可以", "能否", "应该", "以及", "或者", "还是",
+    "对于", "关于", "目前", "当前", "现在", "之间", "的", "了", "是", "在",
+    "和", "与", "及", "或", "吗", "呢", "吧", "把", "被", "对", "从", "有",
+    "中", "将", "会", "要", "这", "那", "其", "请", "我",
+]  # fmt: skip
+
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+_TOKEN_RE = re.compile(
+    r"[A-Za-z][A-Za-z0-9+#.\-]*|[0-9]+|[\u3400-\u4dbf\u4e00-\u9fff]+"
+)
+_CJK_STOP_RE = re.compile("|".join(map(re.escape, CJK_STOPWORDS)))
+_JSON_BLOCK_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+# 超过该长度的中文片段按此长度切分，避免整句成为一个关键词
+MAX_CJK_TERM = 6
+
+
+def extract_keywords(text: str, limit: int = 5) -> List[str]:
+    """本地提取搜索关键词：英文去停用词，中文按虚词和疑问词切分
+
+    按出现次数降序、首次出现位置升序排列。
+    """
+    counts: Dict[str, int] = {}
+    for token in _TOKEN_RE.findall(text):
+        if _CJK_RUN_RE.match(token):
+            pieces = [p for p in _CJK_STOP_RE.split(token) if len(p) >= 2]
+            for piece in pieces:
+                for i in range(0, len(piece), MAX_CJK_TERM):
+                    term = piece[i : i + MAX_CJK_TERM]
+                    if len(term) >= 2:
+                        counts[term] = counts.get(term, 0) + 1
+        else:
+            term = token.strip(".-").lower()
+            if len(term) >= 2 and term not in STOPWORDS:
+                counts[term] = counts.get(term, 0) + 1
+
+    order = {term: i for i, term in enumerate(counts)}
+    ranked = sorted(counts, key=lambda t: (-counts[t], order[t]))
+    return ranked[:limit]
+
+
+class QueryPlan:
+    """问题分析阶段产出的查询计划"""
+
+    def __init__(
+        self,
+        sub_questions: List[str],
+        queries: List[str],
+        expected_sources: int = 5,
+        analysis: str = "",
+        source: str = "llm",
+    ):
+        self.sub_questions = sub_questions
+        self.queries = queries
+        self.expected_sources = expected_sources
+        self.analysis = analysis
+        self.source = source
+
+    def results_per_query(self) -> int:
+        """每个查询需要的结果数，使总数接近 expected_sources"""
+        return max(1, math.ceil(self.expected_sources / max(len(self.queries), 1)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sub_questions": self.sub_questions,
+            "queries": self.queries,
+            "expected_sources": self.expected_sources,
+            "analysis": self.analysis,
+            "source": self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QueryPlan":
+        return cls(
+            sub_questions=list(data.get("sub_questions", [])),
+            queries=list(data.get("queries", [])),
+            expected_sources=data.get("expected_sources", 5),
+            analysis=data.get("analysis", ""),
+            source=data.get("source", "llm"),
+        )
+
+    @classmethod
+    def fallback(
+        cls, question: str, analysis: str = "", max_queries: int = 5
+    ) -> "QueryPlan":
+        """模型没有给出可用计划时，用本地关键词提取生成计划"""
+        keywords = extract_keywords(question, max_queries)
+        queries = [" ".join(keywords)] if len(keywords) > 1 else []
+        queries += keywords
+        return cls(
+            sub_questions=[question],
+            queries=_clean_queries(queries, max_queries) or [question.strip()],
+            analysis=analysis,
+            source="keywords",
+        )
+
+
+def _find_json(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """从模型输出中找出查询计划 JSON：优先代码块，其次第一个完整的对象
+
+    返回解析出的对象和去掉该 JSON 后的剩余文本。
+    """
+    decoder = json.JSONDecoder()
+    for match in _JSON_BLOCK_RE.finditer(text):
+        try:
+            data, _ = decoder.raw_decode(match.group(1))
+        except ValueError:
+            continue
+        if isinstance(data, dict) and "queries" in data:
+            return data, text[: match.start()] + text[match.end() :]
+
+    start = text.find("{")
+    while start >= 0:
+        try:
+            data, end = decoder.raw_decode(text, start)
+        except ValueError:
+            data, end = None, start
+        if isinstance(data, dict) and "queries" in data:
+            return data, text[:start] + text[end:]
+        start = text.find("{", start + 1)
+    return None, text
+
+
+def _clean_queries(queries: List[Any], limit: int) -> List[str]:
+    """去掉空查询和规范化后重复的查询"""
+    seen = set()
+    result = []
+    for query in queries:
+        query = " ".join(str(query).split())
+        key = normalize_query(query)
+        if query and key not in seen:
+            seen.add(key)
+            result.append(query)
+    return result[:limit]
+
+
+def parse_query_plan(text: str, question: str, max_queries: int = 5) -> QueryPlan:
+    """解析问题分析阶段的输出
+
+    queries 可以是字符串，也可以是带 priority 的对象（数字越小越优先）。
+    解析失败或没有查询时退回本地关键词提取。
+    """
+    data, analysis = _find_json(text)
+    analysis = analysis.strip()
+    if data is None:
+        return QueryPlan.fallback(question, analysis, max_queries)
+
+    ranked = []
+    for i, item in enumerate(data.get("queries") or []):
+        if isinstance(item, dict):
+            priority = item.get("priority", i)
+            item = item.get("query", "")
+        else:
+            priority = i
+        try:
+            ranked.append((float(priority), i, item))
+        except (TypeError, ValueError):
+            ranked.append((float(i), i, item))
+    queries = _clean_queries([item for _, _, item in sorted(ranked)], max_queries)
+    if not queries:
+        return QueryPlan.fallback(question, analysis, max_queries)
+
+    sub_questions = [
+        str(q).strip() for q in data.get("sub_questions") or [] if str(q).strip()
+    ]
+    try:
+        expected = int(data.get("expected_sources", 5))
+    except (TypeError, ValueError):
+        expected = 5
+
+    return QueryPlan(
+        sub_questions=sub_questions or [question],
+        queries=queries,
+        expected_sources=min(max(expected, 1), 50),
+        analysis=analysis,
+    )
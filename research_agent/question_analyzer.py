@@ -1,9 +1,12 @@
-import fast
+from typing import Any, Dict
+
 from .config import config
+from .llm_cache import cached_run
+from .query_plan import parse_query_plan
+from .runtime import agent_runtime, deferred_agent
 
 
-@fast.agent(
-    instruction="""你是一个研究问题分析专家。你的任务是：
+QUESTION_ANALYZER_INSTRUCTION = """你是一个研究问题分析专家。你的任务是：
 1. 分析用户提出的研究问题
 2. 识别问题的关键领域和概念
 3. 将复杂问题分解为可研究的子问题
@@ -13,10 +16,24 @@ from .config import config
 - 问题分类
 - 关键概念
 - 子问题列表
-- 搜索关键词""",
-    model=config.get_model("question_analyzer"),
-)
-async def analyze_question(question: str):
-    async with fast.run() as agent:
-        response = await agent.run(f"请分析以下研究问题：{question}")
-        return response
+- 搜索关键词
+
+最后用 ```json 代码块给出机器可读的查询计划，queries 按优先级排序（priority 越小越优先），
+每个查询是适合搜索引擎的简短关键词组合，expected_sources 为回答问题所需的来源数量：
+```json
+{"sub_questions": ["..."], "queries": [{"query": "...", "priority": 1}], "expected_sources": 8}
+```"""
+
+
+@deferred_agent("question_analyzer", QUESTION_ANALYZER_INSTRUCTION)
+async def analyze_question(question: str) -> Dict[str, Any]:
+    """分析问题并返回查询计划（QueryPlan.to_dict()），analysis 字段为分析文本"""
+    async with agent_runtime.session() as agent:
+        response = await cached_run(
+            agent,
+            "question_analyzer",
+            QUESTION_ANALYZER_INSTRUCTION,
+            f"请分析以下研究问题：{question}",
+        )
+    max_queries = config.get_query_plan_config()["max_queries"]
+    return parse_query_plan(str(response), question, max_queries).to_dict()
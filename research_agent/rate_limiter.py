@@ -0,0 +1,295 @@
+import asyncio
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from .config import config
+from .context_packer import estimate_tokens
+from .tracing import get_tracer
+
+T = TypeVar("T")
+
+# 各提供方的默认限额，0 表示不限制；模型名前缀（anthropic./openai./generic.）决定提供方
+DEFAULT_LIMITS = {
+    "anthropic": {"rpm": 50, "tpm": 40000, "max_concurrency": 8},
+    "openai": {"rpm": 500, "tpm": 30000, "max_concurrency": 8},
+    "generic": {"rpm": 0, "tpm": 0, "max_concurrency": 2},
+}
+# 已知的提供方前缀；其余的点号属于模型名本身（如 llama3.2:latest），按 generic 计
+PROVIDERS = ("anthropic", "openai", "generic")
+# 可重试的 HTTP 状态码（529 为 Anthropic 的 overloaded）
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+_RETRYABLE_TEXT = ("rate limit", "rate_limit", "overloaded", "too many requests")
+
+
+class TokenBucket:
+    """令牌桶，rate_per_minute 为每分钟补充的令牌数，0 表示不限制
+
+    单次请求超过桶容量时，等桶满后放行并把余额记为负数，避免永远等不到。
+    """
+
+    def __init__(
+        self, rate_per_minute: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate_per_minute / 60
+        self.capacity = float(rate_per_minute)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """还需等待多少秒才能取出 amount 个令牌"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(needed / self.rate, 0.0)
+
+    def consume(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self.tokens -= amount
+
+
+class ProviderGovernor:
+    """单个提供方的限流器：每分钟请求数、每分钟 token 数和并发上限，
+    以及对 429、超时和 5xx 的指数退避重试（带随机抖动）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_concurrency: int = 0,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"calls": 0, "retries": 0, "throttled_s": 0.0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _primitives(self):
+        # 锁和信号量绑定事件循环，换了循环（如多次 asyncio.run）时重新创建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._semaphore = (
+                asyncio.Semaphore(self.max_concurrency)
+                if self.max_concurrency
+                else None
+            )
+        return self._lock, self._semaphore
+
+    async def _acquire(self, tokens: int) -> None:
+        """按先来后到等待请求和 token 配额"""
+        lock, _ = self._primitives()
+        async with lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                self.stats["throttled_s"] += delay
+                await asyncio.sleep(delay)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int) -> AsyncIterator[None]:
+        """取得配额和并发槽位后执行一次请求（不重试）"""
+        _, semaphore = self._primitives()
+        if semaphore is None:
+            await self._acquire(tokens)
+            self.stats["calls"] += 1
+            yield
+            return
+        async with semaphore:
+            await self._acquire(tokens)
+            self.stats["calls"] += 1
+            yield
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """第 attempt 次重试前的等待秒数：指数退避加全抖动
+
+        服务端给出 Retry-After 时至少等待该时长（不超过 max_delay）。
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """限流执行 call()，可重试的错误按退避策略重试"""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(tokens):
+                    result = await call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                self.stats["retries"] += 1
+                print(
+                    f"{self.name} 请求失败（{type(e).__name__}: {e}），"
+                    f"{delay:.1f} 秒后第 {attempt} 次重试"
+                )
+                with get_tracer().span(
+                    "llm.retry", provider=self.name, attempt=attempt
+                ):
+                    await asyncio.sleep(delay)
+                continue
+            # 响应的 token 在返回后计入每分钟 token 数
+            self.tokens.consume(estimate_tokens(str(result)))
+            return result
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for attr in ("status", "status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、超时、连接错误和服务端错误可以重试"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # 没有导入过 aiohttp 就不会有它的异常，不为此导入（启动时不加载 aiohttp）
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError):
+        return True
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    text = str(error).lower()
+    return any(marker in text for marker in _RETRYABLE_TEXT)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """从错误的 retry_after 属性或响应头 Retry-After 读取等待秒数"""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(error, "headers", None) or getattr(
+            getattr(error, "response", None), "headers", None
+        )
+        if headers is not None:
+            value = headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """按提供方共享的限流器，同一进程内所有工作流共用"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        limits: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.enabled = enabled
+        self.limits = limits if limits is not None else DEFAULT_LIMITS
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.governors: Dict[str, ProviderGovernor] = {}
+
+    @classmethod
+    def from_config(cls) -> "RateLimiter":
+        """根据 config.yaml 的 rate_limits 段创建限流器"""
+        settings = config.get_rate_limit_config()
+        limits = {
+            name: {**DEFAULT_LIMITS.get(name, {}), **(values or {})}
+            for name, values in {**DEFAULT_LIMITS, **settings["providers"]}.items()
+        }
+        return cls(
+            enabled=settings["enabled"],
+            limits=limits,
+            max_retries=settings["max_retries"],
+            base_delay=settings["base_delay"],
+            max_delay=settings["max_delay"],
+        )
+
+    @staticmethod
+    def provider(model: str) -> str:
+        """模型名前缀即提供方，如 anthropic.claude-3-haiku-latest -> anthropic
+
+        只认已知的前缀，没有前缀的本地模型（llama3.2:latest）也归入 generic，
+        受本地模型的并发上限约束。
+        """
+        prefix = model.split(".", 1)[0]
+        return prefix if "." in model and prefix in PROVIDERS else "generic"
+
+    def governor(self, model: str) -> ProviderGovernor:
+        name = self.provider(model)
+        if name not in self.governors:
+            limits = self.limits.get(name, {})
+            self.governors[name] = ProviderGovernor(
+                name,
+                rpm=limits.get("rpm", 0),
+                tpm=limits.get("tpm", 0),
+                max_concurrency=limits.get("max_concurrency", 0),
+                max_retries=self.max_retries,
+                base_delay=self.base_delay,
+                max_delay=self.max_delay,
+            )
+        return self.governors[name]
+
+    async def call(
+        self, model: str, call: Callable[[], Awaitable[T]], tokens: int = 0
+    ) -> T:
+        """以 model 所属提供方的限额和重试策略执行 call()"""
+        if not self.enabled:
+            return await call()
+        return await self.governor(model).run(call, tokens)
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int = 0) -> AsyncIterator[None]:
+        """流式请求使用：只限流不重试（已产出的片段无法撤回）"""
+        if not self.enabled:
+            yield
+            return
+        async with self.governor(model).slot(tokens):
+            yield
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(g.stats) for name, g in self.governors.items()}
+
+
+# 全局限流器实例
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取共享的限流器实例，首次调用时才读取配置"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter.from_config()
+    return _rate_limiter
@@ -1,11 +1,12 @@
-import fast
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+from typing import Dict, Any, Callable, Optional
 from .config import config
+from .context_packer import pack_search_context, source_budget
+from .llm_cache import cached_run, cached_stream
+from .runtime import agent_runtime, deferred_agent
+from .streaming import default_report_filename
 
 
-@fast.agent(
-    instruction="""你是一个专业的研究报告撰写专家。你的任务是：
+REPORT_INSTRUCTION = """你是一个专业的研究报告撰写专家。你的任务是：
 1. 将分析结果整合为结构化报告
 2. 确保引用格式正确和完整
 3. 提供清晰的摘要和结论
@@ -17,19 +18,55 @@ from .config import config
 - 主要发现
 - 详细分析
 - 结论和建议
-- 参考文献
 
-使用清晰的标题层次和专业的学术语言。""",
-    model=config.get_model("report_generator"),
-)
+引用搜索结果时，在句末用方括号标注来源编号，如 [1] 或 [2, 3]，编号与搜索结果中的编号一致。
+不要编写参考文献列表，列表会根据引用编号自动生成。
+
+使用清晰的标题层次和专业的学术语言。"""
+
+
+async def _complete(
+    agent,
+    instruction: str,
+    prompt: str,
+    on_chunk: Optional[Callable[[str], None]],
+) -> str:
+    """执行报告类调用；提供 on_chunk 时以流式方式把片段交给回调
+
+    流式只让报告更早出现在终端和文件中，并不减少内存：完整的报告仍会拼接
+    返回，用于生成参考文献、写入检查点和 LLM 缓存。
+    """
+    if on_chunk is None:
+        return await cached_run(agent, "report_generator", instruction, prompt)
+
+    chunks = []
+    async for chunk in cached_stream(agent, "report_generator", instruction, prompt):
+        on_chunk(chunk)
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+@deferred_agent("report_generator", REPORT_INSTRUCTION)
 async def generate_report(
     original_question: str,
     question_analysis: str,
     search_results: Dict[str, Any],
     analysis: str,
     critical_review: str,
+    on_chunk: Optional[Callable[[str], None]] = None,
 ):
-    async with fast.run() as agent:
+    search_context = pack_search_context(
+        search_results,
+        f"{original_question}\n{question_analysis}",
+        source_budget(
+            config.get_model("report_generator"),
+            original_question,
+            question_analysis,
+            analysis,
+            critical_review,
+        ),
+    )
+    async with agent_runtime.session() as agent:
         report_prompt = f"""
 请基于以下信息生成一份完整的研究报告：
 
@@ -40,7 +77,7 @@ async def generate_report(
 {question_analysis}
 
 搜索结果：
-{search_results}
+{search_context}
 
 深度分析：
 {analysis}
@@ -48,41 +85,14 @@ async def generate_report(
 批判性审查：
 {critical_review}
 
-请生成一份结构化的研究报告，包含适当的引用和学术格式。
-"""
-        response = await agent.run(report_prompt)
-        return response
-
-
-@fast.agent(
-    instruction="""你是一个引用格式专家。你的任务是：
-1. 从文本中提取所有引用来源
-2. 标准化引用格式
-3. 生成完整的参考文献列表
-4. 确保引用的准确性和一致性""",
-    model=config.get_model("report_generator"),
-)
-async def format_citations(report_text: str, sources: List[Dict]):
-    async with fast.run() as agent:
-        citation_prompt = f"""
-请为以下报告添加规范的引用格式：
-
-报告内容：
-{report_text}
-
-可用来源：
-{sources}
-
-请使用 APA 格式进行引用，并在报告末尾生成完整的参考文献列表。
+请生成一份结构化的研究报告，用 [编号] 标注引用的来源。
 """
-        response = await agent.run(citation_prompt)
-        return response
+        return await _complete(agent, REPORT_INSTRUCTION, report_prompt, on_chunk)
 
 
 def save_report(report_content: str, filename: Optional[str] = None):
     if filename is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"research_report_{timestamp}.md"
+        filename = default_report_filename()
 
     with open(filename, "w", encoding="utf-8") as f:
         f.write(report_content)
@@ -0,0 +1,184 @@
+import asyncio
+import functools
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .config import config
+
+
+def _fast_run():
+    import fast
+
+    return fast.run()
+
+
+class DeferredAgent:
+    """延迟注册的 agent
+
+    声明时只记录指令和配置键，首次调用时才导入 fast、解析模型并应用
+    fast.agent 装饰器，导入 agent 模块不再加载 fast 或读取模型配置。
+    """
+
+    def __init__(self, func: Callable, config_key: str, instruction: str):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.config_key = config_key
+        self.instruction = instruction
+        self._registered: Optional[Callable] = None
+        AGENTS[func.__name__] = self
+
+    @property
+    def registered(self) -> bool:
+        return self._registered is not None
+
+    def register(self) -> Callable:
+        """向 fast 注册 agent（只执行一次）"""
+        if self._registered is None:
+            import fast
+
+            self._registered = fast.agent(
+                instruction=self.instruction, model=config.get_model(self.config_key)
+            )(self.func)
+        return self._registered
+
+    async def __call__(self, *args, **kwargs):
+        if not agent_runtime.register_agents:
+            return await self.func(*args, **kwargs)
+        return await self.register()(*args, **kwargs)
+
+
+class DeferredChain:
+    """延迟注册的 agent 链，首次调用时先注册链中的 agent"""
+
+    def __init__(
+        self,
+        func: Callable,
+        agents: List[str],
+        loader: Optional[Callable[[], Any]] = None,
+    ):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.agents = agents
+        self.loader = loader
+        self._registered: Optional[Callable] = None
+
+    @property
+    def registered(self) -> bool:
+        return self._registered is not None
+
+    def register(self) -> Callable:
+        """导入并注册链中的 agent，再注册链本身（只执行一次）"""
+        if self._registered is None:
+            if self.loader is not None:
+                self.loader()
+            for name in self.agents:
+                AGENTS[name].register()
+
+            import fast
+
+            self._registered = fast.chain(agents=self.agents)(self.func)
+        return self._registered
+
+    async def __call__(self, *args, **kwargs):
+        if not agent_runtime.register_agents:
+            if self.loader is not None:
+                self.loader()
+            return await self.func(*args, **kwargs)
+        return await self.register()(*args, **kwargs)
+
+
+# 已声明的 agent，按函数名索引
+AGENTS: Dict[str, DeferredAgent] = {}
+
+
+def deferred_agent(
+    config_key: str, instruction: str
+) -> Callable[[Callable], DeferredAgent]:
+    """声明 agent，注册推迟到首次调用"""
+    return lambda func: DeferredAgent(func, config_key, instruction)
+
+
+def deferred_chain(
+    agents: List[str], loader: Optional[Callable[[], Any]] = None
+) -> Callable[[Callable], DeferredChain]:
+    """声明 agent 链，loader 负责导入链中 agent 所在的模块"""
+    return lambda func: DeferredChain(func, agents, loader)
+
+
+class AgentRuntime:
+    """共享的 agent 运行时
+
+    首次使用时进入 fast.run()，之后所有阶段和问题复用同一个运行时，
+    模型客户端和连接只建立一次；shutdown() 时统一释放。运行时不绑定某个
+    agent，调用方每次通过 run(prompt, instruction=..., model=...) 传入指令和模型。
+
+    register_agents 为 False 时（例如 use(http_runtime)），声明的 agent 和 agent 链
+    直接调用原函数，不导入 fast、不向 fast 注册。
+    """
+
+    def __init__(
+        self, factory: Callable[[], Any] = _fast_run, register_agents: bool = True
+    ):
+        self.factory = factory
+        self.register_agents = register_agents
+        self.starts = 0
+        self._agent: Any = None
+        self._stack: Optional[AsyncExitStack] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return self._stack is not None
+
+    async def start(self) -> Any:
+        """启动运行时（已启动时直接返回）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 运行时绑定在创建它的事件循环上，换了事件循环只能重新建立
+            self._agent = None
+            self._stack = None
+            self._lock = asyncio.Lock()
+            self._loop = loop
+
+        async with self._lock:
+            if self._stack is None:
+                stack = AsyncExitStack()
+                self._agent = await stack.enter_async_context(self.factory())
+                self._stack = stack
+                self.starts += 1
+        return self._agent
+
+    def use(self, factory: Callable[[], Any], register_agents: bool = False) -> None:
+        """换用其他运行时（如 http_runtime），只能在运行时启动之前调用"""
+        if self.running:
+            raise RuntimeError("运行时已启动，先调用 shutdown()")
+        self.factory = factory
+        self.register_agents = register_agents
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Any]:
+        """借用共享的 agent"""
+        yield await self.start()
+
+    async def shutdown(self) -> None:
+        """关闭运行时"""
+        stack, self._stack, self._agent = self._stack, None, None
+        if stack is not None and self._loop is asyncio.get_running_loop():
+            await stack.aclose()
+
+
+async def shutdown_shared_resources() -> None:
+    """关闭进程内共享的运行时和连接池"""
+    from .page_fetcher import close_page_fetcher
+    from .search_providers import close_search_provider
+
+    try:
+        await agent_runtime.shutdown()
+    finally:
+        await close_search_provider()
+        await close_page_fetcher()
+
+
+# 全局 agent 运行时实例
+agent_runtime = AgentRuntime()
@@ -0,0 +1,129 @@
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .tracing import get_tracer
+
+
+class Stage:
+    """工作流阶段 - 声明名称、执行函数和依赖的输入"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        label: Optional[str] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.label = label or name
+
+
+class DAGScheduler:
+    """依赖图调度器 - 按依赖关系并发执行相互独立的阶段"""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self.stages: Dict[str, Stage] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        label: Optional[str] = None,
+    ) -> "DAGScheduler":
+        """注册一个阶段，func 按 inputs 的顺序接收依赖阶段的结果"""
+        if name in self.stages:
+            raise ValueError(f"阶段重复注册: {name}")
+        self.stages[name] = Stage(name, func, inputs, label)
+        return self
+
+    def _validate(self, available: Iterable[str]) -> None:
+        """检查缺失的依赖和环"""
+        known = set(self.stages) | set(available)
+        for stage in self.stages.values():
+            missing = [i for i in stage.inputs if i not in known]
+            if missing:
+                raise ValueError(f"阶段 {stage.name} 缺少输入: {missing}")
+
+        visiting: set = set()
+        visited: set = set()
+
+        def visit(name: str) -> None:
+            if name in visited or name not in self.stages:
+                return
+            if name in visiting:
+                raise ValueError(f"阶段依赖存在环: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].inputs:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def _run_stage(
+        self, stage: Stage, results: Dict[str, Any], semaphore: asyncio.Semaphore
+    ) -> Any:
+        args = [results[i] for i in stage.inputs]
+        async with semaphore:
+            with get_tracer().span(
+                f"stage.{stage.name}", stage=stage.name, label=stage.label
+            ):
+                value = stage.func(*args)
+                if inspect.isawaitable(value):
+                    value = await value
+        return value
+
+    async def run(
+        self,
+        initial: Optional[Dict[str, Any]] = None,
+        on_complete: Optional[Callable[[str, Any], None]] = None,
+        on_start: Optional[Callable[[Stage], None]] = None,
+    ) -> Dict[str, Any]:
+        """执行全部阶段，返回包含初始值和各阶段结果的字典
+
+        initial 中已有结果的阶段不会再次执行；on_start 在阶段开始前以阶段对象调用，
+        on_complete 在每个阶段完成后以 (阶段名, 结果) 调用。
+        """
+        results: Dict[str, Any] = dict(initial or {})
+        self._validate(results)
+
+        pending = {name: s for name, s in self.stages.items() if name not in results}
+        # 未配置上限时，所有就绪阶段都可以同时运行
+        semaphore = asyncio.Semaphore(self.max_concurrency or len(pending) or 1)
+        running: Dict[asyncio.Task, str] = {}
+
+        try:
+            while pending or running:
+                ready = [
+                    s for s in pending.values() if all(i in results for i in s.inputs)
+                ]
+                for stage in ready:
+                    del pending[stage.name]
+                    if on_start is not None:
+                        on_start(stage)
+                    task = asyncio.ensure_future(
+                        self._run_stage(stage, results, semaphore)
+                    )
+                    running[task] = stage.name
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    results[name] = task.result()
+                    if on_complete is not None:
+                        on_complete(name, results[name])
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return results
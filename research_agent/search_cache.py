@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from .config import config
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：全角转半角、小写、合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class SearchCache:
+    """搜索结果缓存 - 以 (后端, 规范化查询, 结果数) 为键存储在 SQLite 中"""
+
+    def __init__(
+        self,
+        path: str = ".cache/search_cache.sqlite3",
+        ttl: Optional[float] = 86400,
+        enabled: bool = True,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_config(cls) -> "SearchCache":
+        """根据 config.yaml 的 search_cache 段创建缓存"""
+        settings = config.get_search_cache_config()
+        return cls(
+            path=settings["path"], ttl=settings["ttl"], enabled=settings["enabled"]
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS search_results (
+                    provider TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    max_results INTEGER NOT NULL,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (provider, query, max_results)
+                )"""
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(
+        self, provider: str, query: str, max_results: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """查找缓存的结果，未命中或已过期时返回 None"""
+        if not self.enabled:
+            return None
+
+        conn = self._connect()
+        key = (provider, normalize_query(query), max_results)
+        row = conn.execute(
+            "SELECT results, created_at FROM search_results "
+            "WHERE provider = ? AND query = ? AND max_results = ?",
+            key,
+        ).fetchone()
+
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(
+        self,
+        provider: str,
+        query: str,
+        max_results: int,
+        results: List[Dict[str, Any]],
+    ) -> None:
+        """写入查询结果"""
+        if not self.enabled:
+            return
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?)",
+            (
+                provider,
+                normalize_query(query),
+                max_results,
+                json.dumps(results, ensure_ascii=False),
+                time.time(),
+            ),
+        )
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """删除过期条目，返回删除数量"""
+        if not self.ttl:
+            return 0
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM search_results WHERE created_at < ?",
+            (time.time() - self.ttl,),
+        )
+        conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# 全局搜索缓存实例
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """获取共享的搜索缓存实例，首次调用时才读取配置"""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache.from_config()
+    return _search_cache
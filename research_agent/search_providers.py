@@ -0,0 +1,214 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from .config import config
+from .search_cache import SearchCache, normalize_query
+from .singleflight import SingleFlight
+from .tracing import get_tracer
+from .urls import canonicalize_url
+
+
+class SearchProvider:
+    """搜索后端接口"""
+
+    name = "base"
+
+    @property
+    def cache_key(self) -> str:
+        """缓存命名空间，区分不同后端的结果"""
+        return self.name
+
+    async def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """执行单个查询，返回搜索结果列表"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """释放后端持有的资源"""
+
+
+class MockSearchProvider(SearchProvider):
+    """模拟搜索后端 - 不发起网络请求，每个关键词返回一条占位结果"""
+
+    name = "mock"
+
+    async def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        return [
+            {
+                "keyword": query,
+                "title": f"搜索结果: {query}",
+                "url": f"https://example.com/search?q={query}",
+                "summary": f"关于 {query} 的相关信息...",
+                "credibility": "中等",
+            }
+        ]
+
+
+class HTTPSearchProvider(SearchProvider):
+    """HTTP 搜索后端 - 兼容 SearxNG 的 JSON 接口，复用同一个连接池"""
+
+    name = "http"
+
+    def __init__(
+        self,
+        endpoint: str,
+        timeout: float = 10,
+        max_connections: int = 20,
+        per_host_limit: int = 4,
+    ):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}:{self.endpoint}"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.per_host_limit
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        session = self._get_session()
+        params = {"q": query, "format": "json"}
+        async with session.get(self.endpoint, params=params) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+
+        results = []
+        for item in data.get("results", [])[:max_results]:
+            results.append(
+                {
+                    "keyword": query,
+                    "title": item.get("title", ""),
+                    "url": item.get("url", ""),
+                    "summary": item.get("content") or item.get("snippet", ""),
+                    "credibility": item.get("credibility", "未评估"),
+                }
+            )
+        return results
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def create_search_provider(settings: Optional[Dict[str, Any]] = None) -> SearchProvider:
+    """根据配置创建搜索后端"""
+    settings = settings or config.get_search_config()
+    provider = settings.get("provider", "mock")
+
+    if provider == "mock":
+        return MockSearchProvider()
+    if provider == "http":
+        return HTTPSearchProvider(
+            settings["endpoint"],
+            timeout=settings.get("timeout", 10),
+            max_connections=settings.get("max_connections", 20),
+            per_host_limit=settings.get("per_host_limit", 4),
+        )
+    raise ValueError(f"未知的搜索后端: {provider}")
+
+
+async def search_keywords(
+    provider: SearchProvider,
+    keywords: List[str],
+    max_results: int = 5,
+    max_concurrency: int = 8,
+    cache: Optional[SearchCache] = None,
+) -> List[Dict[str, Any]]:
+    """并发搜索所有关键词，单个关键词失败不影响其他结果
+
+    其他请求正在搜索同一个（规范化后相同的）关键词时，等待并共享其结果。
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or len(keywords) or 1)
+
+    async def _fetch(keyword: str, span) -> List[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                results = await provider.search(keyword, max_results)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                span.set(error=str(e))
+                print(f"搜索 {keyword} 时出错: {e}")
+                return []
+        if cache is not None:
+            cache.set(provider.cache_key, keyword, max_results, results)
+        return results
+
+    async def _search(keyword: str) -> List[Dict[str, Any]]:
+        with get_tracer().span(
+            "search.query", provider=provider.cache_key, query=keyword
+        ) as span:
+            if cache is not None:
+                cached = cache.get(provider.cache_key, keyword, max_results)
+                span.set(cache_hit=cached is not None)
+                if cached is not None:
+                    return cached
+
+            key = (provider.cache_key, normalize_query(keyword), max_results)
+            flight = get_search_flight()
+            span.set(coalesced=flight.in_flight(key))
+            results = await flight.do(key, lambda: _fetch(keyword, span))
+            span.set(results=len(results))
+            return results
+
+    batches = await asyncio.gather(*(_search(k) for k in keywords))
+    return [result for batch in batches for result in batch]
+
+
+def dedupe_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按规范化 URL 去重，保留首次出现的结果并合并命中的关键词"""
+    unique: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        url = result.get("url")
+        # 没有 URL 的结果无法判断重复，原样保留
+        key = canonicalize_url(url) if url else f"#{len(unique)}"
+        if key in unique:
+            keywords = unique[key]["keywords"]
+            if result.get("keyword") not in keywords:
+                keywords.append(result.get("keyword"))
+            continue
+        unique[key] = {**result, "keywords": [result.get("keyword")]}
+    return list(unique.values())
+
+
+# 合并同时在途的相同搜索查询
+_search_flight: Optional[SingleFlight] = None
+
+
+def get_search_flight() -> SingleFlight:
+    """获取共享的搜索查询合并实例，首次调用时才读取配置"""
+    global _search_flight
+    if _search_flight is None:
+        _search_flight = SingleFlight.from_config("search")
+    return _search_flight
+
+
+_search_provider: Optional[SearchProvider] = None
+
+
+def get_search_provider() -> SearchProvider:
+    """获取共享的搜索后端实例"""
+    global _search_provider
+    if _search_provider is None:
+        _search_provider = create_search_provider()
+    return _search_provider
+
+
+async def close_search_provider() -> None:
+    """关闭共享的搜索后端"""
+    global _search_provider
+    if _search_provider is not None:
+        await _search_provider.close()
+        _search_provider = None
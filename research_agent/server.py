@@ -0,0 +1,307 @@
+"""
+研究服务 - 以 HTTP 接口提供 research_workflow
+
+所有请求共享同一进程内的缓存、连接池和模型状态。提交的问题进入有界队列，
+由固定数量的 worker 执行；队列已满时返回 429：
+
+    python -m research_agent.server --port 8080 --workers 2 --max-queue 16
+
+接口：
+    POST /jobs                 {"question": "...", "profile": "fast"} -> 202
+    GET  /jobs/{id}            任务状态和阶段进度
+    GET  /jobs/{id}/events     阶段进度（Server-Sent Events）
+    GET  /jobs/{id}/report     最终报告（Markdown）
+    GET  /health               队列和 worker 状态
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+from .config import config
+
+FINISHED = ("done", "error")
+
+
+class QueueFull(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    """一个研究任务及其进度事件"""
+
+    def __init__(self, question: str, profile: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.profile = profile
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """记录事件并唤醒等待中的订阅者"""
+        self.events.append({**event, "time": round(time.time(), 3)})
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """依次产出全部事件（包括订阅前的历史事件），任务结束后停止"""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.status in FINISHED:
+                return
+            await changed.wait()
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages = [e["stage"] for e in self.events if e["event"] == "stage_completed"]
+        return {
+            "id": self.id,
+            "question": self.question,
+            "profile": self.profile,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "completed_stages": stages,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """有界任务队列和 worker 池
+
+    队列满时 submit 抛出 QueueFull；只保留最近 max_jobs 个任务，超出时
+    淘汰最早结束的任务。
+    """
+
+    def __init__(
+        self,
+        workflow: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+        workers: int = 2,
+        max_queue: int = 16,
+        max_jobs: int = 1000,
+    ):
+        self.workflow = workflow
+        self.workers = max(workers, 1)
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(max_queue, 1))
+        self._tasks: List[asyncio.Task] = []
+        self.running = 0
+
+    @classmethod
+    def from_config(cls, workflow=None) -> "JobManager":
+        """根据 config.yaml 的 server 段创建任务管理器"""
+        settings = config.get_server_config()
+        return cls(
+            workflow=workflow,
+            workers=settings["workers"],
+            max_queue=settings["max_queue"],
+            max_jobs=settings["max_jobs"],
+        )
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self.workflow is None:
+            from .main import research_workflow
+
+            self.workflow = research_workflow
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, question: str, profile: Optional[str] = None) -> Job:
+        job = Job(question, profile)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"任务队列已满（{self._queue.maxsize}）") from None
+        self.jobs[job.id] = job
+        self._evict()
+        job.publish({"event": "queued"})
+        return job
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, j in self.jobs.items() if j.status in FINISHED]
+        while len(self.jobs) > self.max_jobs and finished:
+            del self.jobs[finished.pop(0)]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        self.running += 1
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish({"event": "started"})
+        try:
+            job.result = await self.workflow(
+                job.question,
+                stream=False,
+                resume=False,
+                profile=job.profile,
+                on_progress=job.publish,
+            )
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status, job.error = "error", "服务已关闭"
+            raise
+        except Exception as e:  # 单个任务失败不影响 worker
+            job.status, job.error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            self.running -= 1
+            job.finished_at = time.time()
+            job.publish({"event": job.status, "error": job.error})
+
+
+MANAGER_KEY = web.AppKey("job_manager", JobManager)
+
+
+def _error(status: int, message: str, **headers) -> web.Response:
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+def _get_job(request: web.Request) -> Job:
+    job = request.app[MANAGER_KEY].jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(
+            text=json.dumps({"error": "任务不存在"}), content_type="application/json"
+        )
+    return job
+
+
+async def submit_job(request: web.Request) -> web.Response:
+    manager = request.app[MANAGER_KEY]
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "请求体必须是 JSON")
+    question = str(body.get("question") or "").strip() if isinstance(body, dict) else ""
+    if not question:
+        return _error(400, "缺少 question")
+    profile = body.get("profile")
+    if profile is not None and profile not in ("standard", "fast"):
+        return _error(400, f"未知的流水线配置: {profile}")
+
+    try:
+        job = manager.submit(question, profile)
+    except QueueFull as e:
+        return _error(429, str(e), **{"Retry-After": "5"})
+    return web.json_response(
+        job.to_dict(), status=202, headers={"Location": f"/jobs/{job.id}"}
+    )
+
+
+async def get_job(request: web.Request) -> web.Response:
+    return web.json_response(_get_job(request).to_dict())
+
+
+async def job_events(request: web.Request) -> web.StreamResponse:
+    job = _get_job(request)
+    response = web.StreamResponse(
+        headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+    )
+    await response.prepare(request)
+    async for event in job.stream():
+        data = json.dumps(event, ensure_ascii=False)
+        await response.write(f"event: {event['event']}\ndata: {data}\n\n".encode())
+    await response.write_eof()
+    return response
+
+
+async def job_report(request: web.Request) -> web.Response:
+    job = _get_job(request)
+    if job.status == "error":
+        return _error(409, job.error or "任务失败")
+    if job.status != "done":
+        return _error(409, f"任务尚未完成（{job.status}）", **{"Retry-After": "5"})
+    return web.Response(
+        text=job.result.get("final_report", ""), content_type="text/markdown"
+    )
+
+
+async def health(request: web.Request) -> web.Response:
+    manager = request.app[MANAGER_KEY]
+    return web.json_response(
+        {
+            "workers": manager.workers,
+            "running": manager.running,
+            "queued": manager.queued,
+            "jobs": len(manager.jobs),
+        }
+    )
+
+
+def create_app(manager: Optional[JobManager] = None) -> web.Application:
+    """创建服务应用；未传入 manager 时按配置运行 research_workflow"""
+    manager = manager or JobManager.from_config()
+    shared = manager.workflow is None
+
+    async def on_startup(app: web.Application) -> None:
+        manager.start()
+
+    async def on_cleanup(app: web.Application) -> None:
+        await manager.stop()
+        if shared:
+            from .runtime import shutdown_shared_resources
+
+            await shutdown_shared_resources()
+
+    app = web.Application()
+    app[MANAGER_KEY] = manager
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/jobs", submit_job)
+    app.router.add_get("/jobs/{job_id}", get_job)
+    app.router.add_get("/jobs/{job_id}/events", job_events)
+    app.router.add_get("/jobs/{job_id}/report", job_report)
+    app.router.add_get("/health", health)
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = config.get_server_config()
+    parser = argparse.ArgumentParser(description="研究服务")
+    parser.add_argument("--host", default=settings["host"])
+    parser.add_argument("--port", type=int, default=settings["port"])
+    parser.add_argument("--workers", type=int, default=settings["workers"])
+    parser.add_argument("--max-queue", type=int, default=settings["max_queue"])
+    args = parser.parse_args(argv)
+
+    manager = JobManager(
+        workers=args.workers, max_queue=args.max_queue, max_jobs=settings["max_jobs"]
+    )
+    web.run_app(create_app(manager), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from .config import config
+
+
+class SingleFlight:
+    """合并并发的相同请求
+
+    同一个 key 的请求正在执行时，后到的请求不再重复执行，而是等待第一个请求的
+    结果（或异常）并共享它。请求结束后 key 立即释放，之后的请求重新执行，
+    因此这里只合并同时在途的请求，不做缓存。共享的结果是同一个对象，调用方
+    不应修改它。
+    """
+
+    def __init__(self, name: str = "", enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.coalesced = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    @classmethod
+    def from_config(cls, name: str) -> "SingleFlight":
+        """根据 config.yaml 的 singleflight 段创建实例"""
+        return cls(name, config.get_singleflight_config()["enabled"])
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 factory() 或等待同 key 的在途请求，返回共享的结果"""
+        if not self.enabled:
+            return await factory()
+
+        while key in self._calls:
+            future = self._calls[key]
+            self.coalesced += 1
+            try:
+                # shield：等待方被取消不影响正在执行的请求
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 执行请求的一方被取消，由等待方重新执行
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待方时避免 "exception was never retrieved"
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
@@ -0,0 +1,60 @@
+import os
+import sys
+import uuid
+from datetime import datetime
+from typing import Optional, TextIO
+
+
+def default_report_filename() -> str:
+    """按时间戳生成报告文件名，附加随机后缀，同一秒内的并发运行不会互相覆盖"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"research_report_{timestamp}_{uuid.uuid4().hex[:8]}.md"
+
+
+def echo_chunk(chunk: str) -> None:
+    """把流式片段直接输出到终端"""
+    sys.stdout.write(chunk)
+    sys.stdout.flush()
+
+
+class ReportWriter:
+    """流式报告写入器 - 片段到达即写入文件并刷新，可同时回显到终端
+
+    写入器本身不缓存内容。文件在第一个片段到达时才创建；with 块因异常退出时
+    删除已写入的部分报告，失败的运行不会留下空的或不完整的报告文件。
+    """
+
+    def __init__(self, filename: Optional[str] = None, echo: bool = True):
+        self.filename = filename or default_report_filename()
+        self.echo = echo
+        self.chars_written = 0
+        self._file: Optional[TextIO] = None
+        self._open = False
+
+    def __enter__(self) -> "ReportWriter":
+        self._open = True
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        created = self._file is not None
+        self.close()
+        if exc_type is not None and created:
+            os.remove(self.filename)
+
+    def write(self, chunk: str) -> None:
+        """写入一个片段"""
+        if not self._open:
+            raise RuntimeError("ReportWriter 尚未打开")
+        if self._file is None:
+            self._file = open(self.filename, "w", encoding="utf-8")
+        self._file.write(chunk)
+        self._file.flush()
+        self.chars_written += len(chunk)
+        if self.echo:
+            echo_chunk(chunk)
+
+    def close(self) -> None:
+        self._open = False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
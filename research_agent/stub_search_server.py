@@ -0,0 +1,58 @@
+"""
+本地搜索桩服务器
+
+提供与 SearxNG 相同格式的 /search JSON 接口，返回确定性的结果，
+用于离线开发和测试 HTTPSearchProvider：
+
+    python -m research_agent.stub_search_server --port 8888
+"""
+
+import argparse
+import asyncio
+import hashlib
+
+from aiohttp import web
+
+
+def make_results(query: str, count: int):
+    """为查询生成确定性的搜索结果"""
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+    return [
+        {
+            "title": f"{query} - 资料 {i + 1}",
+            "url": f"https://stub.local/{digest}/{i + 1}",
+            "content": f"关于 {query} 的第 {i + 1} 条参考资料摘要。",
+        }
+        for i in range(count)
+    ]
+
+
+def create_app(results_per_query: int = 5, latency: float = 0.0) -> web.Application:
+    """创建桩服务器应用，latency 为每个请求的模拟延迟（秒）"""
+
+    async def search(request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response(
+            {"query": query, "results": make_results(query, results_per_query)}
+        )
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地搜索桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--results", type=int, default=5, help="每个查询的结果数")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟延迟（秒）")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.results, args.latency), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import config
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """一次计时的操作，记录耗时、属性和错误"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        """添加或更新属性"""
+        self.attributes.update(attributes)
+
+    def elapsed(self) -> float:
+        """开始至今的秒数"""
+        return time.perf_counter() - self._start
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.duration = time.perf_counter() - self._start
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为字段命名与 OpenTelemetry 一致的字典"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error}
+            if self.error
+            else {"code": "OK"},
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """导出为 OTLP/JSON 格式的 span"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """基于 span 的追踪器 - 记录阶段和模型调用，导出为 JSON Lines"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        export_path: Optional[str] = None,
+        export_format: str = "jsonl",
+        verbose: bool = False,
+        max_spans: int = 10000,
+    ):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.export_path = export_path
+        self.export_format = export_format
+        self.verbose = verbose
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "Tracer":
+        """根据 config.yaml 的 tracing 段创建追踪器"""
+        settings = config.get_tracing_config()
+        return cls(
+            enabled=settings["enabled"],
+            export_path=settings["export_path"],
+            export_format=settings["format"],
+            verbose=settings["verbose"],
+        )
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes) -> Iterator[Span]:
+        """在当前 span 下创建子 span
+
+        activate 为 False 时不把新 span 设为当前 span，用于异步生成器等
+        会在 yield 处挂起、可能在其他上下文中结束的代码。
+        """
+        span = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(e)
+            raise
+        else:
+            span.finish()
+        finally:
+            if token is not None:
+                _current_span.reset(token)
+            if self.enabled:
+                with self._lock:
+                    self.spans.append(span)
+                    # 不属于任何完整运行的 span 不会被取走，超出上限时丢弃最旧的
+                    if len(self.spans) > self.max_spans:
+                        del self.spans[: len(self.spans) - self.max_spans]
+                if self.verbose and "label" in span.attributes:
+                    mark = "✗" if span.error else "✓"
+                    print(f"{mark} {span.attributes['label']} ({span.duration:.2f}s)")
+
+    def pop_trace(self, trace_id: str) -> List[Span]:
+        """取出并移除某个 trace 的全部 span"""
+        with self._lock:
+            trace = [s for s in self.spans if s.trace_id == trace_id]
+            self.spans = [s for s in self.spans if s.trace_id != trace_id]
+        return trace
+
+    def export(self, spans: List[Span], path: Optional[str] = None) -> None:
+        """把 span 追加写入导出文件"""
+        path = path or self.export_path
+        if not path or not spans:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, "a", encoding="utf-8") as f:
+            if self.export_format == "otlp":
+                # 与 OpenTelemetry Collector 文件导出器相同：每行一个导出请求
+                request = {
+                    "resourceSpans": [
+                        {
+                            "resource": {
+                                "attributes": [
+                                    {
+                                        "key": "service.name",
+                                        "value": {"stringValue": "research-agent"},
+                                    }
+                                ]
+                            },
+                            "scopeSpans": [
+                                {
+                                    "scope": {"name": "research_agent"},
+                                    "spans": [s.to_otlp() for s in spans],
+                                }
+                            ],
+                        }
+                    ]
+                }
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            else:
+                for span in spans:
+                    f.write(
+                        json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+                        + "\n"
+                    )
+
+
+def summarize(spans: List[Span]) -> str:
+    """按 span 名称和模型汇总耗时、大小、缓存命中和错误，生成文本表格"""
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    for span in spans:
+        key = (span.name, str(span.attributes.get("model", "")))
+        row = rows.setdefault(
+            key,
+            {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "prompt": 0,
+                "completion": 0,
+                "cache_hits": 0,
+                "errors": 0,
+            },
+        )
+        row["count"] += 1
+        row["total"] += span.duration
+        row["max"] = max(row["max"], span.duration)
+        row["prompt"] += span.attributes.get("prompt_tokens", 0)
+        row["completion"] += span.attributes.get("completion_tokens", 0)
+        row["cache_hits"] += bool(span.attributes.get("cache_hit"))
+        row["errors"] += bool(span.error)
+
+    header = (
+        f"{'span':<28} {'model':<34} {'次数':>4} {'总耗时':>8} {'最大':>8} "
+        f"{'输入tok':>8} {'输出tok':>8} {'缓存':>4} {'错误':>4}"
+    )
+    lines = [header, "-" * len(header)]
+    for (name, model), row in sorted(rows.items(), key=lambda r: -r[1]["total"]):
+        lines.append(
+            f"{name:<28} {model:<34} {row['count']:>4} {row['total']:>7.2f}s "
+            f"{row['max']:>7.2f}s {row['prompt']:>8} {row['completion']:>8} "
+            f"{row['cache_hits']:>4} {row['errors']:>4}"
+        )
+    return "\n".join(lines)
+
+
+# 全局追踪器实例
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """获取共享的追踪器实例，首次调用时才读取配置"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer.from_config()
+    return _tracer
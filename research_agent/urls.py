@@ -0,0 +1,26 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 规范化 URL 时去除的跟踪参数
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "spm"}
+
+
+def canonicalize_url(url: str) -> str:
+    """规范化 URL：小写协议和主机，去掉默认端口、片段、跟踪参数和末尾斜杠"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    if port and not (
+        (scheme == "http" and port == 80) or (scheme == "https" and port == 443)
+    ):
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
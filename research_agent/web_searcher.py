@@ -1,10 +1,16 @@
+import asyncio
 from typing import List
-import fast
 from .config import config
+from .context_packer import pack_sources, source_budget
+from .dedup import collapse_near_duplicates
+from .llm_cache import cached_run
+from .page_fetcher import get_page_fetcher
+from .runtime import agent_runtime, deferred_agent
+from .search_cache import get_search_cache
+from .search_providers import dedupe_results, get_search_provider, search_keywords
 
 
-@fast.agent(
-    instruction="""你是一个信息检索专家。你的任务是：
+WEB_SEARCHER_INSTRUCTION = """你是一个信息检索专家。你的任务是：
 1. 根据关键词执行网络搜索
 2. 评估搜索结果的相关性和可信度
 3. 提取关键信息和数据
@@ -14,30 +20,46 @@ from .config import config
 - 标题
 - 来源URL
 - 关键信息摘要
-- 可信度评估""",
-    model=config.get_model("web_searcher"),
-)
-async def search_web(keywords: List[str], max_results: int = 5):
-    async with fast.run() as agent:
-        search_results = []
-
-        for keyword in keywords:
-            try:
-                # 这里使用一个简化的搜索模拟
-                # 在实际实现中，可以集成 Google Search API 或其他搜索服务
-                result = {
-                    "keyword": keyword,
-                    "title": f"搜索结果: {keyword}",
-                    "url": f"https://example.com/search?q={keyword}",
-                    "summary": f"关于 {keyword} 的相关信息...",
-                    "credibility": "中等",
-                }
-                search_results.append(result)
-            except Exception as e:
-                print(f"搜索 {keyword} 时出错: {e}")
-
-        # 让 agent 分析和整理搜索结果
-        analysis_prompt = f"请分析以下搜索结果，提取关键信息：\n{search_results}"
-        response = await agent.run(analysis_prompt)
+- 可信度评估"""
+
+
+@deferred_agent("web_searcher", WEB_SEARCHER_INSTRUCTION)
+async def search_web(keywords: List[str], max_results: int = 5, summarize: bool = True):
+    settings = config.get_search_config()
+    async with agent_runtime.session() as agent:
+        search_results = dedupe_results(
+            await search_keywords(
+                get_search_provider(),
+                keywords,
+                max_results,
+                settings["max_concurrency"],
+                cache=get_search_cache(),
+            )
+        )
+        if config.get_fetch_config()["enabled"]:
+            search_results = await get_page_fetcher().fetch_sources(search_results)
+        # 转载和镜像页面只保留一份，其余记录在 alternates 中
+        # MinHash 签名和逐对比较是纯 CPU 计算，放到线程中避免阻塞事件循环
+        search_results = await asyncio.to_thread(
+            collapse_near_duplicates, search_results
+        )
+
+        if not summarize:
+            # fast 流水线直接把原始结果交给后续阶段
+            return {"raw_results": search_results, "analysis": ""}
+
+        # 让 agent 分析和整理搜索结果；抓取的正文可能很长，按模型预算打包
+        prompt_head = "请分析以下搜索结果，提取关键信息：\n"
+        sources_text = pack_sources(
+            search_results,
+            " ".join(keywords),
+            source_budget(
+                config.get_model("web_searcher"), WEB_SEARCHER_INSTRUCTION, prompt_head
+            ),
+        )
+        analysis_prompt = prompt_head + sources_text
+        response = await cached_run(
+            agent, "web_searcher", WEB_SEARCHER_INSTRUCTION, analysis_prompt
+        )
 
         return {"raw_results": search_results, "analysis": response}
@@ -0,0 +1,229 @@
+"""
+多进程研究 worker
+
+任务保存在持久化的 SQLite 队列中，同一台机器上的多个进程、或共享文件系统的
+多台主机都可以从同一个队列文件取任务运行 research_workflow：
+
+    python -m research_agent.worker enqueue questions.txt
+    python -m research_agent.worker run --processes 4
+    python -m research_agent.worker status
+    python -m research_agent.worker results -o results.jsonl
+
+worker 崩溃时任务租约过期后由其他 worker 接管，并从阶段检查点续跑。
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .batch import load_questions
+from .config import config
+from .job_queue import JobQueue
+
+
+def worker_name(index: int = 0) -> str:
+    """worker 标识：主机名、进程号和序号"""
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+async def work(
+    queue: JobQueue,
+    owner: str,
+    workflow: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+    poll_interval: float = 2.0,
+    exit_when_idle: bool = False,
+    max_jobs: Optional[int] = None,
+) -> int:
+    """循环领取并运行任务，返回完成（含失败）的任务数
+
+    运行期间每隔租约的三分之一续约一次，续约失败（租约已被其他 worker 接管）时
+    取消正在运行的工作流，不再提交结果；exit_when_idle 为 True 时队列中没有
+    可运行的任务就退出。队列的 SQLite 调用都在线程中执行。
+    """
+    if workflow is None:
+        from .main import research_workflow
+
+        workflow = research_workflow
+
+    async def heartbeat(job_id: str, run: asyncio.Future, stopped: asyncio.Event):
+        """定期续约；租约被其他 worker 接管时取消正在运行的工作流并返回 True"""
+        while True:
+            try:
+                await asyncio.wait_for(stopped.wait(), queue.lease_seconds / 3)
+                return False
+            except asyncio.TimeoutError:
+                pass
+            if not await asyncio.to_thread(queue.heartbeat, job_id, owner):
+                print(f"任务 {job_id} 的租约已被其他 worker 接管，停止运行")
+                run.cancel()
+                return True
+
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        # SQLite 调用可能等待文件锁，放到线程中避免阻塞事件循环
+        job = await asyncio.to_thread(queue.claim, owner)
+        if job is None:
+            if exit_when_idle:
+                break
+            await asyncio.sleep(poll_interval)
+            continue
+
+        # 重试时复用上次中断前已完成的阶段
+        run = asyncio.ensure_future(
+            workflow(job["question"], stream=False, resume=True, profile=job["profile"])
+        )
+        stopped = asyncio.Event()
+        beat = asyncio.ensure_future(heartbeat(job["id"], run, stopped))
+        error: Optional[BaseException] = None
+        lost = False
+        try:
+            result = await run
+        except asyncio.CancelledError:
+            lost = beat.done() and not beat.cancelled() and beat.result()
+            if not lost:
+                raise
+        except Exception as e:  # 单个任务失败不影响 worker
+            error = e
+        finally:
+            # 等续约协程退出，不与下面的队列更新同时使用连接
+            stopped.set()
+            run.cancel()
+            await asyncio.gather(beat, return_exceptions=True)
+
+        # 租约丢失时任务已由其他 worker 接管，结果由它提交
+        if error is not None:
+            await asyncio.to_thread(
+                queue.fail, job["id"], owner, f"{type(error).__name__}: {error}"
+            )
+            print(f"任务 {job['id']} 第 {job['attempts']} 次运行失败: {error}")
+        elif not lost:
+            await asyncio.to_thread(
+                queue.complete,
+                job["id"],
+                owner,
+                {
+                    "saved_file": result.get("saved_file"),
+                    "final_report": result.get("final_report"),
+                    "run_id": result.get("run_id"),
+                },
+            )
+        processed += 1
+    return processed
+
+
+def run_worker(queue_path: str, index: int, exit_when_idle: bool = False) -> None:
+    """单个 worker 进程的入口"""
+    from .runtime import shutdown_shared_resources
+
+    async def _main() -> int:
+        queue = JobQueue.from_config(queue_path)
+        try:
+            return await work(
+                queue,
+                worker_name(index),
+                poll_interval=config.get_worker_config()["poll_interval"],
+                exit_when_idle=exit_when_idle,
+            )
+        finally:
+            queue.close()
+            await shutdown_shared_resources()
+
+    processed = asyncio.run(_main())
+    print(f"worker {worker_name(index)} 退出，共处理 {processed} 个任务")
+
+
+def run_pool(queue_path: str, processes: int, exit_when_idle: bool = False) -> None:
+    """启动多个 worker 进程并等待它们退出"""
+    pool: List[multiprocessing.Process] = [
+        multiprocessing.Process(
+            target=run_worker, args=(queue_path, i, exit_when_idle), daemon=False
+        )
+        for i in range(max(processes, 1))
+    ]
+    for process in pool:
+        process.start()
+    try:
+        for process in pool:
+            process.join()
+    except KeyboardInterrupt:
+        for process in pool:
+            process.terminate()
+        for process in pool:
+            process.join()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = config.get_worker_config()
+    parser = argparse.ArgumentParser(description="多进程研究 worker")
+    parser.add_argument("--queue", default=settings["queue_path"], help="队列文件")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="加入问题（纯文本或 JSONL）")
+    enqueue.add_argument("input", help="问题文件，- 表示标准输入")
+    enqueue.add_argument("--profile", choices=["standard", "fast"])
+
+    run = commands.add_parser("run", help="启动 worker 进程")
+    run.add_argument("-p", "--processes", type=int, default=settings["processes"])
+    run.add_argument(
+        "--exit-when-idle", action="store_true", help="队列中没有任务时退出"
+    )
+
+    commands.add_parser("status", help="显示各状态的任务数")
+
+    results = commands.add_parser("results", help="导出已结束任务的结果")
+    results.add_argument(
+        "-o", "--output", default="-", help="JSONL 文件，- 表示标准输出"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run_pool(args.queue, args.processes, args.exit_when_idle)
+        return
+
+    queue = JobQueue.from_config(args.queue)
+    try:
+        if args.command == "enqueue":
+            if args.input == "-":
+                questions = load_questions(sys.stdin)
+            else:
+                with open(args.input, "r", encoding="utf-8") as f:
+                    questions = load_questions(f)
+            for item in questions:
+                queue.enqueue(item["question"], args.profile, item["id"])
+            print(f"已加入 {len(questions)} 个问题，队列状态: {queue.counts()}")
+        elif args.command == "status":
+            print(json.dumps(queue.counts(), ensure_ascii=False))
+        else:
+            out = (
+                sys.stdout
+                if args.output == "-"
+                else open(args.output, "w", encoding="utf-8")
+            )
+            try:
+                for job in queue.jobs():
+                    if job["status"] not in ("done", "failed"):
+                        continue
+                    record = {
+                        "id": job["id"],
+                        "question": job["question"],
+                        "status": "ok" if job["status"] == "done" else "error",
+                        "attempts": job["attempts"],
+                        **(job["result"] or {}),
+                    }
+                    if job["status"] == "failed":
+                        record["error"] = job["error"]
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,35 @@
 """
 AI 研究助手启动脚本
 基于 fast-agent 构建的智能研究原型系统
+
+    python run_research.py                       # 交互式研究
+    python run_research.py batch questions.txt   # 批量研究，参数见 --help
+    python run_research.py --list-models         # 列出各 agent 使用的模型
+    python run_research.py --health              # 检查模型后端是否可用
 """
 
-import asyncio
 import sys
 import os
 
 # 添加项目路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from research_agent.main import main
-
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["batch"]:
+        from research_agent.batch import main as batch_main
+
+        batch_main(sys.argv[2:])
+        sys.exit(0)
+
+    if sys.argv[1:2] in (["--list-models"], ["--health"]):
+        from research_agent.cli import main as cli_main
+
+        sys.exit(cli_main(sys.argv[1]))
+
+    import asyncio
+
+    from research_agent.main import main
+
     print("启动 AI 研究助手...")
     try:
         asyncio.run(main())
@@ -21,4 +38,4 @@ if __name__ == "__main__":
         print("\n程序已中断")
     except Exception as e:
         print(f"启动失败: {e}")
-        print("请确保已安装所需依赖并配置了 API 密钥")
\ No newline at end of file
+        print("请确保已安装所需依赖并配置了 API 密钥")
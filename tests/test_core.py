@@ -110,16 +110,86 @@ class TestModelSwitcher:
 
     def test_check_ollama_status_not_running(self):
         """Test checking Ollama status when not running"""
-        with patch("subprocess.run") as mock_run:
-            mock_run.return_value = MagicMock(returncode=1)
+        import asyncio
+        import socket
+
+        from research_agent.model_switcher import ModelSwitcher
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        ms = ModelSwitcher(base_url=f"http://127.0.0.1:{port}/v1")
+        result = asyncio.run(ms.check_ollama_status())
+        assert result is False
+        assert ms.last_probe["error"]
+
+    def test_probe_running_ollama(self):
+        """Test the HTTP probe reports models and latency"""
+        import asyncio
+
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.mock_llm_server import create_app
+        from research_agent.model_switcher import ModelSwitcher
+
+        async def run():
+            server = TestServer(create_app(models=["llama3.2:latest"]))
+            await server.start_server()
+            try:
+                ms = ModelSwitcher(base_url=str(server.make_url("/v1")))
+                running = await ms.check_ollama_status()
+                with patch.dict(os.environ, {}, clear=True):
+                    models = await ms.list_available_models()
+                return ms, running, models
+            finally:
+                await server.close()
+
+        ms, running, models = asyncio.run(run())
+        assert running is True
+        assert models == {"cloud": [], "local": ["generic.llama3.2:latest"]}
+        assert ms.last_probe["latency"] > 0
+
+    def test_probe_cache_and_background_refresh(self):
+        """Test fresh results are reused and stale ones refresh in the background"""
+        import asyncio
+
+        from research_agent.model_switcher import ModelSwitcher
 
-            from research_agent.model_switcher import ModelSwitcher
+        ms = ModelSwitcher(base_url="http://127.0.0.1:1/v1")
+        calls = []
 
-            ms = ModelSwitcher()
-            import asyncio
+        async def fake_probe():
+            calls.append(1)
+            ms.last_probe = {"ok": True, "models": [], "checked_at": clock[0]}
+            return ms.last_probe
 
-            result = asyncio.run(ms.check_ollama_status())
-            assert result is False
+        clock = [100.0]
+
+        async def run():
+            with (
+                patch.object(ms, "_run_probe", fake_probe),
+                patch(
+                    "research_agent.model_switcher.time.monotonic",
+                    side_effect=lambda: clock[0],
+                ),
+            ):
+                await ms.probe_ollama()
+                clock[0] = 105.0
+                await ms.probe_ollama()
+                assert len(calls) == 1
+
+                clock[0] = 115.0
+                stale = await ms.probe_ollama()
+                assert stale["checked_at"] == 100.0
+                await ms._refresh_task
+                assert len(calls) == 2
+
+                clock[0] = 200.0
+                await ms.probe_ollama()
+                assert len(calls) == 3
+
+        asyncio.run(run())
 
     def test_list_models_structure(self):
         """Test model listing returns correct structure"""
@@ -128,17 +198,52 @@ class TestModelSwitcher:
 
         ms = ModelSwitcher()
 
-        # Mock the check_ollama_status to return False (no local models)
-        async def mock_check():
-            return False
+        # Mock the HTTP probe to report Ollama as unreachable (no local models)
+        async def mock_probe(force=False):
+            return {"ok": False, "models": [], "error": "unreachable"}
 
-        with patch.object(ms, "check_ollama_status", mock_check):
+        with patch.object(ms, "probe_ollama", mock_probe):
             result = asyncio.run(ms.list_available_models())
 
             assert "cloud" in result
             assert "local" in result
             assert isinstance(result["cloud"], list)
-            assert isinstance(result["local"], list)
+            assert result["local"] == []
+
+    def test_probe_reports_http_errors(self):
+        """Test a server answering /models with an error counts as not running"""
+        import asyncio
+
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.model_switcher import ModelSwitcher
+
+        requests = []
+
+        async def models(request):
+            requests.append(request.path)
+            return web.Response(status=503, text="loading model")
+
+        app = web.Application()
+        app.router.add_get("/v1/models", models)
+
+        async def run():
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                ms = ModelSwitcher(base_url=str(server.make_url("/v1/")))
+                with patch.dict(os.environ, {}, clear=True):
+                    listed = await ms.list_available_models()
+                return ms, listed
+            finally:
+                await server.close()
+
+        ms, listed = asyncio.run(run())
+        assert requests == ["/v1/models"]
+        assert listed == {"cloud": [], "local": []}
+        assert ms.last_probe["ok"] is False
+        assert "503" in ms.last_probe["error"]
 
 
 class TestResearchAgent:
@@ -158,6 +263,2651 @@ class TestResearchAgent:
         assert isinstance(config, Config)
 
 
+class TestDAGScheduler:
+    """Test DAGScheduler"""
+
+    def test_dependencies_are_passed_in_order(self):
+        """Test stage functions receive dependency results"""
+        import asyncio
+
+        from research_agent.scheduler import DAGScheduler
+
+        async def add(a, b):
+            return a + b
+
+        scheduler = DAGScheduler()
+        scheduler.add("double", lambda x: x * 2, inputs=["x"])
+        scheduler.add("total", add, inputs=["x", "double"])
+
+        results = asyncio.run(scheduler.run({"x": 3}))
+        assert results == {"x": 3, "double": 6, "total": 9}
+
+    def test_independent_stages_run_concurrently(self):
+        """Test independent stages overlap instead of running serially"""
+        import asyncio
+
+        from research_agent.scheduler import DAGScheduler
+
+        async def run():
+            a_started = asyncio.Event()
+            b_started = asyncio.Event()
+
+            async def a():
+                a_started.set()
+                await asyncio.wait_for(b_started.wait(), timeout=1)
+                return "a"
+
+            async def b():
+                b_started.set()
+                await asyncio.wait_for(a_started.wait(), timeout=1)
+                return "b"
+
+            scheduler = DAGScheduler()
+            scheduler.add("a", a).add("b", b)
+            return await scheduler.run()
+
+        assert asyncio.run(run()) == {"a": "a", "b": "b"}
+
+    def test_max_concurrency(self):
+        """Test concurrency cap is respected"""
+        import asyncio
+
+        from research_agent.scheduler import DAGScheduler
+
+        active = 0
+        peak = 0
+
+        async def work():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        scheduler = DAGScheduler(max_concurrency=2)
+        for i in range(5):
+            scheduler.add(f"s{i}", work)
+
+        asyncio.run(scheduler.run())
+        assert peak == 2
+
+    def test_cycle_and_missing_inputs(self):
+        """Test invalid graphs are rejected before running"""
+        import asyncio
+
+        from research_agent.scheduler import DAGScheduler
+
+        scheduler = DAGScheduler()
+        scheduler.add("a", lambda b: b, inputs=["b"])
+        scheduler.add("b", lambda a: a, inputs=["a"])
+        with pytest.raises(ValueError):
+            asyncio.run(scheduler.run())
+
+        scheduler = DAGScheduler()
+        scheduler.add("a", lambda x: x, inputs=["missing"])
+        with pytest.raises(ValueError):
+            asyncio.run(scheduler.run())
+
+    def test_failure_cancels_running_stages(self):
+        """Test a failing stage propagates and cancels siblings"""
+        import asyncio
+
+        from research_agent.scheduler import DAGScheduler
+
+        cancelled = False
+
+        async def slow():
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        scheduler = DAGScheduler()
+        scheduler.add("slow", slow).add("fail", fail)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(scheduler.run())
+        assert cancelled is True
+
+
+class TestLLMCache:
+    """Test LLMCache"""
+
+    def test_hit_and_miss_counters(self, tmp_path):
+        """Test identical (model, instruction, prompt) hits the cache"""
+        from research_agent.llm_cache import LLMCache
+
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+        assert cache.get("m", "inst", "prompt") is None
+        cache.set("m", "inst", "prompt", "answer")
+
+        assert cache.get("m", "inst", "prompt") == "answer"
+        assert cache.get("other-model", "inst", "prompt") is None
+        assert cache.get("m", "other-inst", "prompt") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 3
+
+    def test_persists_across_instances(self, tmp_path):
+        """Test responses survive a new cache instance"""
+        from research_agent.llm_cache import LLMCache
+
+        path = str(tmp_path / "cache.sqlite3")
+        LLMCache(path).set("m", "inst", "prompt", "answer")
+        assert LLMCache(path).get("m", "inst", "prompt") == "answer"
+
+    def test_ttl_expiry(self, tmp_path):
+        """Test expired entries are treated as misses"""
+        from research_agent.llm_cache import LLMCache
+
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+        with patch("research_agent.llm_cache.time.time", return_value=1000.0):
+            cache.set("m", "inst", "prompt", "answer")
+        with patch("research_agent.llm_cache.time.time", return_value=1030.0):
+            assert cache.get("m", "inst", "prompt") == "answer"
+        with patch("research_agent.llm_cache.time.time", return_value=1100.0):
+            assert cache.get("m", "inst", "prompt") is None
+
+    def test_lru_eviction(self, tmp_path):
+        """Test least recently used entries are evicted over the size bound"""
+        from research_agent.llm_cache import LLMCache
+
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"), max_size_mb=25 / 2**20)
+        with patch("research_agent.llm_cache.time.time", side_effect=range(100)):
+            cache.set("m", "i", "a", "x" * 10)
+            cache.set("m", "i", "b", "x" * 10)
+            cache.get("m", "i", "a")
+            cache.set("m", "i", "c", "x" * 10)
+
+            assert cache.get("m", "i", "a") is not None
+            assert cache.get("m", "i", "b") is None
+            assert cache.get("m", "i", "c") is not None
+
+    def test_bypass(self, tmp_path):
+        """Test bypass skips lookups but still stores fresh responses"""
+        from research_agent.llm_cache import LLMCache
+
+        path = str(tmp_path / "cache.sqlite3")
+        cache = LLMCache(path, bypass=True)
+        cache.set("m", "inst", "prompt", "answer")
+        assert cache.get("m", "inst", "prompt") is None
+        assert LLMCache(path).get("m", "inst", "prompt") == "answer"
+
+    def test_cached_run_skips_agent_on_hit(self, tmp_path):
+        """Test cached_run only calls the agent on a miss"""
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_run
+
+        agent = MagicMock()
+
+        async def fake_run(prompt, instruction, model):
+            return f"reply to {prompt}"
+
+        agent.run = MagicMock(side_effect=fake_run)
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+
+        with patch.object(llm_cache_module, "_llm_cache", cache):
+            first = asyncio.run(cached_run(agent, "web_searcher", "inst", "hi"))
+            second = asyncio.run(cached_run(agent, "web_searcher", "inst", "hi"))
+
+        assert first == second == "reply to hi"
+        assert agent.run.call_count == 1
+
+
+class TestSearchProviders:
+    """Test search providers against the local stub server"""
+
+    async def _search(self, keywords, latency=0.0, path="/search"):
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.search_providers import (
+            HTTPSearchProvider,
+            search_keywords,
+        )
+        from research_agent.stub_search_server import create_app
+
+        server = TestServer(create_app(results_per_query=3, latency=latency))
+        await server.start_server()
+        provider = HTTPSearchProvider(str(server.make_url(path)), per_host_limit=8)
+        try:
+            return await search_keywords(provider, keywords, max_results=2)
+        finally:
+            await provider.close()
+            await server.close()
+
+    def test_http_provider_results(self):
+        """Test results are parsed and limited per keyword"""
+        import asyncio
+
+        results = asyncio.run(self._search(["量子计算", "quantum"]))
+
+        assert len(results) == 4
+        assert [r["keyword"] for r in results] == ["量子计算"] * 2 + ["quantum"] * 2
+        assert results[0]["url"].startswith("https://stub.local/")
+        assert "量子计算" in results[0]["summary"]
+
+    def test_keywords_are_searched_concurrently(self):
+        """Test total time does not grow linearly with keywords"""
+        import asyncio
+        import time
+
+        start = time.perf_counter()
+        results = asyncio.run(self._search([f"k{i}" for i in range(6)], latency=0.2))
+        elapsed = time.perf_counter() - start
+
+        assert len(results) == 12
+        assert elapsed < 0.8
+
+    def test_failed_query_is_skipped(self):
+        """Test HTTP errors are reported without failing the whole search"""
+        import asyncio
+
+        results = asyncio.run(self._search(["a"], path="/missing"))
+        assert results == []
+
+    def test_mock_provider_is_default(self):
+        """Test the default provider works offline"""
+        import asyncio
+
+        from research_agent.search_providers import (
+            MockSearchProvider,
+            create_search_provider,
+        )
+
+        provider = create_search_provider({"provider": "mock"})
+        assert isinstance(provider, MockSearchProvider)
+        results = asyncio.run(provider.search("AI"))
+        assert results[0]["keyword"] == "AI"
+
+        with pytest.raises(ValueError):
+            create_search_provider({"provider": "unknown"})
+
+
+class TestSearchCache:
+    """Test SearchCache and URL deduplication"""
+
+    def test_cache_keyed_on_normalized_query(self, tmp_path):
+        """Test queries differing only in case/whitespace share an entry"""
+        from research_agent.search_cache import SearchCache
+
+        cache = SearchCache(str(tmp_path / "search.sqlite3"))
+        cache.set("http:x", "Quantum  Computing", 5, [{"url": "https://a.com"}])
+
+        assert cache.get("http:x", " quantum computing ", 5) == [
+            {"url": "https://a.com"}
+        ]
+        assert cache.get("mock", "quantum computing", 5) is None
+        assert cache.get("http:x", "quantum computing", 3) is None
+
+    def test_cache_ttl(self, tmp_path):
+        """Test expired entries miss and can be purged"""
+        from research_agent.search_cache import SearchCache
+
+        cache = SearchCache(str(tmp_path / "search.sqlite3"), ttl=60)
+        with patch("research_agent.search_cache.time.time", return_value=1000.0):
+            cache.set("mock", "q", 5, [])
+        with patch("research_agent.search_cache.time.time", return_value=1100.0):
+            assert cache.get("mock", "q", 5) is None
+            assert cache.purge_expired() == 1
+
+    def test_search_keywords_uses_cache(self, tmp_path):
+        """Test cached keywords skip the provider"""
+        import asyncio
+
+        from research_agent.search_cache import SearchCache
+        from research_agent.search_providers import (
+            MockSearchProvider,
+            search_keywords,
+        )
+
+        provider = MockSearchProvider()
+        cache = SearchCache(str(tmp_path / "search.sqlite3"))
+        asyncio.run(search_keywords(provider, ["AI"], cache=cache))
+
+        with patch.object(provider, "search") as mock_search:
+            results = asyncio.run(search_keywords(provider, ["ai"], cache=cache))
+
+        mock_search.assert_not_called()
+        assert results[0]["keyword"] == "AI"
+        assert cache.hits == 1
+
+    def test_canonicalize_url(self):
+        """Test equivalent URLs map to the same canonical form"""
+        from research_agent.urls import canonicalize_url
+
+        canonical = canonicalize_url("https://example.com/a?b=2&a=1")
+        assert canonicalize_url("HTTPS://www.Example.com:443/a/?a=1&b=2") == (canonical)
+        assert canonicalize_url("https://example.com/a?a=1&b=2&utm_source=x#top") == (
+            canonical
+        )
+        assert canonicalize_url("https://example.com/a?a=2&b=2") != canonical
+
+    def test_dedupe_results_merges_keywords(self):
+        """Test duplicate URLs across keywords are collapsed"""
+        from research_agent.search_providers import dedupe_results
+
+        results = dedupe_results(
+            [
+                {"keyword": "a", "url": "https://example.com/x"},
+                {"keyword": "b", "url": "https://www.example.com/x/"},
+                {"keyword": "b", "url": "https://example.com/y"},
+                {"keyword": "c", "url": ""},
+                {"keyword": "d", "url": ""},
+            ]
+        )
+
+        assert len(results) == 4
+        assert results[0]["keywords"] == ["a", "b"]
+        assert results[1]["keywords"] == ["b"]
+
+
+class TestContextPacker:
+    """Test token-budgeted context packing"""
+
+    SOURCES = [
+        {"title": "Cooking tips", "url": "https://a.com", "summary": "pasta " * 50},
+        {
+            "title": "Quantum computing basics",
+            "url": "https://b.com",
+            "summary": "qubits and quantum gates",
+        },
+        {"title": "量子计算的挑战", "url": "https://c.com", "summary": "纠错与退相干"},
+    ]
+
+    def test_estimate_tokens(self):
+        """Test CJK characters weigh more than latin characters"""
+        from research_agent.context_packer import estimate_tokens
+
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd" * 10) == 10
+        assert estimate_tokens("量子计算") == 4
+
+    def test_truncate_to_tokens(self):
+        """Test truncation respects the budget"""
+        from research_agent.context_packer import estimate_tokens, truncate_to_tokens
+
+        text = "word " * 100
+        truncated = truncate_to_tokens(text, 20)
+        assert estimate_tokens(truncated) <= 20
+        assert truncated.endswith("…")
+        assert truncate_to_tokens("short", 20) == "short"
+
+    def test_rank_sources(self):
+        """Test relevant sources rank first"""
+        from research_agent.context_packer import rank_sources
+
+        assert rank_sources(self.SOURCES, "quantum computing")[0] == 1
+        assert rank_sources(self.SOURCES, "量子计算")[0] == 2
+
+    def test_pack_sources_within_budget(self):
+        """Test packing keeps original numbering and fits the budget"""
+        from research_agent.context_packer import estimate_tokens, pack_sources
+
+        packed = pack_sources(self.SOURCES, "quantum computing", 40)
+
+        assert estimate_tokens(packed) <= 40
+        assert packed.startswith("[2] Quantum computing basics | https://b.com")
+        assert "pasta " * 50 not in packed
+
+    def test_fetched_content_replaces_summary(self):
+        """Test fetched page text is preferred over the snippet and truncated"""
+        from research_agent.context_packer import estimate_tokens, pack_sources
+
+        sources = [
+            {**self.SOURCES[1], "content": "Quantum error correction. " * 200},
+            self.SOURCES[2],
+        ]
+        packed = pack_sources(sources, "quantum", 120)
+
+        assert estimate_tokens(packed) <= 120
+        assert packed.startswith("[1] Quantum computing basics | https://b.com\n")
+        assert "Quantum error correction." in packed
+        assert "qubits and quantum gates" not in packed
+
+    def test_pack_search_context_drops_summary_first(self):
+        """Test the search summary only uses leftover budget"""
+        from research_agent.context_packer import pack_search_context
+
+        search_data = {"raw_results": self.SOURCES, "analysis": "摘要" * 1000}
+        packed = pack_search_context(search_data, "quantum", 300)
+
+        assert "[1]" in packed and "[2]" in packed and "[3]" in packed
+        assert "检索摘要" in packed
+        assert "{'raw_results'" not in packed
+
+    def test_source_budget_uses_model_budget(self, tmp_path):
+        """Test per-model budgets are read from config"""
+        from research_agent import context_packer
+        from research_agent.config import Config
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            """
+context_budget:
+  default: 5000
+  models:
+    small-model: 1000
+"""
+        )
+        with patch.object(context_packer, "config", Config(str(config_file))):
+            assert context_packer.source_budget("big-model") == 4700
+            assert context_packer.source_budget("small-model", "abcd" * 100) == 600
+            assert context_packer.source_budget("small-model", "x" * 10000) == (
+                context_packer.MIN_SOURCE_BUDGET
+            )
+
+
+class TestStreaming:
+    """Test streaming report output"""
+
+    def test_report_writer_flushes_each_chunk(self, tmp_path, capsys):
+        """Test chunks are on disk and on the terminal before close"""
+        from research_agent.streaming import ReportWriter
+
+        path = tmp_path / "report.md"
+        with ReportWriter(str(path)) as writer:
+            writer.write("# 标题\n")
+            assert path.read_text(encoding="utf-8") == "# 标题\n"
+            writer.write("正文")
+
+        assert path.read_text(encoding="utf-8") == "# 标题\n正文"
+        assert writer.chars_written == len("# 标题\n正文")
+        assert capsys.readouterr().out == "# 标题\n正文"
+
+    def test_failed_run_leaves_no_report_file(self, tmp_path, monkeypatch):
+        """Test the file is created on the first chunk and removed on error"""
+        import pytest
+
+        from research_agent.streaming import ReportWriter
+
+        monkeypatch.chdir(tmp_path)
+        with pytest.raises(RuntimeError):
+            with ReportWriter(echo=False) as idle:
+                assert not (tmp_path / idle.filename).exists()
+                raise RuntimeError("stage failed")
+        with pytest.raises(RuntimeError):
+            with ReportWriter(echo=False) as partial:
+                partial.write("一半")
+                assert (tmp_path / partial.filename).exists()
+                raise RuntimeError("stage failed")
+
+        assert list(tmp_path.iterdir()) == []
+
+    def test_concurrent_reports_get_distinct_files(self, tmp_path, monkeypatch):
+        """Test reports saved in the same second do not overwrite each other"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from research_agent.report_generator import save_report
+        from research_agent.streaming import ReportWriter
+
+        monkeypatch.chdir(tmp_path)
+        with ThreadPoolExecutor(4) as pool:
+            saved = list(pool.map(save_report, [f"报告{i}" for i in range(4)]))
+        with ReportWriter(echo=False) as first, ReportWriter(echo=False) as second:
+            first.write("流式一")
+            second.write("流式二")
+
+        assert len(set(saved + [first.filename, second.filename])) == 6
+        assert [(tmp_path / f).read_text(encoding="utf-8") for f in saved] == [
+            f"报告{i}" for i in range(4)
+        ]
+        assert (tmp_path / second.filename).read_text(encoding="utf-8") == "流式二"
+
+    def test_cached_stream(self, tmp_path):
+        """Test streamed chunks are yielded then served from cache"""
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_stream
+
+        class StreamingAgent:
+            calls = 0
+
+            async def stream(self, prompt, instruction, model):
+                StreamingAgent.calls += 1
+                for chunk in ["a", "b", "c"]:
+                    yield chunk
+
+        async def collect():
+            return [c async for c in cached_stream(StreamingAgent(), "x", "inst", "p")]
+
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+        with patch.object(llm_cache_module, "_llm_cache", cache):
+            assert asyncio.run(collect()) == ["a", "b", "c"]
+            assert asyncio.run(collect()) == ["abc"]
+
+        assert StreamingAgent.calls == 1
+
+
+class TestBatchRunner:
+    """Test the batch runner"""
+
+    def test_load_questions(self):
+        """Test plain text and JSONL lines are both accepted"""
+        from research_agent.batch import load_questions, question_id
+
+        questions = load_questions(
+            [
+                "什么是量子计算？\n",
+                "\n",
+                '{"id": "q2", "question": "AI safety"}\n',
+                "什么是量子计算？\n",
+            ]
+        )
+
+        assert questions == [
+            {"id": question_id("什么是量子计算？"), "question": "什么是量子计算？"},
+            {"id": "q2", "question": "AI safety"},
+        ]
+
+    def test_run_batch_concurrency_and_output(self, tmp_path):
+        """Test questions run concurrently under the limit and are written as JSONL"""
+        import asyncio
+        import json
+
+        from research_agent.batch import load_questions, run_batch
+
+        active = 0
+        peak = 0
+
+        async def workflow(question, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if question == "bad":
+                raise RuntimeError("boom")
+            return {"final_report": f"report: {question}", "saved_file": "r.md"}
+
+        output = tmp_path / "results.jsonl"
+        questions = load_questions(["a", "b", "c", "d", "bad"])
+        summary = asyncio.run(run_batch(questions, str(output), 2, workflow))
+
+        assert summary == {"ok": 4, "error": 1, "skipped": 0}
+        assert peak == 2
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        assert {r["question"] for r in records if r["status"] == "ok"} == {
+            "a",
+            "b",
+            "c",
+            "d",
+        }
+        assert "RuntimeError: boom" in [r.get("error") for r in records]
+
+    def test_run_batch_resumes(self, tmp_path):
+        """Test completed questions are skipped and failed ones retried"""
+        import asyncio
+
+        from research_agent.batch import load_questions, run_batch
+
+        seen = []
+
+        async def workflow(question, **kwargs):
+            seen.append(question)
+            if question == "flaky" and seen.count("flaky") == 1:
+                raise RuntimeError("timeout")
+            return {"final_report": question}
+
+        output = str(tmp_path / "results.jsonl")
+        questions = load_questions(["a", "flaky"])
+        asyncio.run(run_batch(questions, output, 2, workflow))
+        with open(output, "a", encoding="utf-8") as f:
+            f.write('{"id": "trunc')
+
+        summary = asyncio.run(run_batch(questions, output, 2, workflow))
+
+        assert summary == {"ok": 1, "error": 0, "skipped": 1}
+        assert sorted(seen) == ["a", "flaky", "flaky"]
+
+        summary = asyncio.run(run_batch(questions, output, 2, workflow))
+        assert summary == {"ok": 0, "error": 0, "skipped": 2}
+
+
+class TestCheckpoint:
+    """Test stage checkpointing"""
+
+    def test_save_and_load(self, tmp_path):
+        """Test stage results round-trip through the run directory"""
+        from research_agent.checkpoint import CheckpointStore, make_run_id
+
+        run_id = make_run_id("什么是 AI？")
+        assert run_id == make_run_id("什么是  AI？ ")
+
+        store = CheckpointStore(run_id, str(tmp_path))
+        store.save("keywords", ["a", "b"])
+        store.save("search_results", {"raw_results": [{"url": "https://a.com"}]})
+        (tmp_path / run_id / "broken.json").write_text("{")
+
+        restored = CheckpointStore(run_id, str(tmp_path)).load_all()
+        assert restored == {
+            "keywords": ["a", "b"],
+            "search_results": {"raw_results": [{"url": "https://a.com"}]},
+        }
+
+        store.clear()
+        assert store.load_all() == {}
+
+    def test_resume_skips_completed_stages(self, tmp_path):
+        """Test a resumed scheduler run only executes missing stages"""
+        import asyncio
+
+        from research_agent.checkpoint import CheckpointStore
+        from research_agent.scheduler import DAGScheduler
+
+        calls = []
+
+        def build(fail):
+            def stage(name):
+                def run(*args):
+                    calls.append(name)
+                    if fail and name == "c":
+                        raise RuntimeError("timeout")
+                    return name
+
+                return run
+
+            scheduler = DAGScheduler()
+            scheduler.add("a", stage("a"))
+            scheduler.add("b", stage("b"), inputs=["a"])
+            scheduler.add("c", stage("c"), inputs=["b"])
+            return scheduler
+
+        store = CheckpointStore("run", str(tmp_path))
+        with pytest.raises(RuntimeError):
+            asyncio.run(build(fail=True).run(on_complete=store.save))
+
+        results = asyncio.run(build(fail=False).run(store.load_all(), store.save))
+
+        assert results == {"a": "a", "b": "b", "c": "c"}
+        assert calls == ["a", "b", "c", "c"]
+
+    def test_expired_run_is_not_resumed(self, tmp_path):
+        """Test checkpoints older than the ttl are discarded"""
+        import os
+        import time
+
+        from research_agent.checkpoint import CheckpointStore
+
+        store = CheckpointStore("run", str(tmp_path), ttl=60)
+        store.save("a", 1)
+        assert store.load_all() == {"a": 1}
+
+        stale = time.time() - 120
+        os.utime(store._stage_file("a"), (stale, stale))
+        assert store.load_all() == {}
+        assert not os.path.exists(store.path)
+
+    def test_completed_run_is_not_resumed(self, tmp_path, monkeypatch):
+        """Test a successful run clears its checkpoints so a re-ask starts fresh"""
+        import asyncio
+        from types import SimpleNamespace
+
+        from research_agent import main
+        from research_agent.config import config
+
+        calls = []
+
+        async def analyze_question(question):
+            calls.append("plan")
+            return {"analysis": "分析", "queries": ["q"], "expected_sources": 1}
+
+        async def search_web(queries, max_results, summarize=True):
+            calls.append("search")
+            return {"raw_results": [], "analysis": ""}
+
+        async def analyze_information(evidence, question_analysis):
+            return f"分析{len(calls)}"
+
+        async def critical_review(analysis, evidence):
+            return "审查"
+
+        async def generate_report(*args, on_chunk=None):
+            return args[3]
+
+        agents = SimpleNamespace(
+            analyze_question=analyze_question,
+            search_web=search_web,
+            analyze_information=analyze_information,
+            critical_review=critical_review,
+            analyze_and_review=None,
+            generate_report=generate_report,
+            save_report=lambda report: "report.md",
+        )
+        checkpoint = {"enabled": True, "dir": str(tmp_path), "resume": True, "ttl": 0}
+        monkeypatch.chdir(tmp_path)
+        with (
+            patch.object(main, "_load_agents", return_value=agents),
+            patch.object(config, "get_checkpoint_config", return_value=checkpoint),
+            patch.object(
+                config, "get_retrieval_config", return_value={"enabled": False}
+            ),
+        ):
+            first = asyncio.run(
+                main._run_workflow("问题", False, None, True, "standard")
+            )
+            second = asyncio.run(
+                main._run_workflow("问题", False, None, True, "standard")
+            )
+
+        assert calls == ["plan", "search", "plan", "search"]
+        assert first["final_report"] == "分析2"
+        assert second["final_report"] == "分析4"
+        assert not (tmp_path / first["run_id"]).exists()
+
+
+class TestTracing:
+    """Test span tracing"""
+
+    def test_nested_spans_and_errors(self):
+        """Test child spans share the trace and errors are recorded"""
+        from research_agent.tracing import Tracer
+
+        tracer = Tracer()
+        with tracer.span("root") as root:
+            with tracer.span("child", model="m") as child:
+                child.set(prompt_tokens=10)
+            with pytest.raises(ValueError):
+                with tracer.span("failing"):
+                    raise ValueError("bad")
+
+        spans = tracer.pop_trace(root.trace_id)
+        by_name = {s.name: s for s in spans}
+        assert set(by_name) == {"root", "child", "failing"}
+        assert by_name["child"].parent_id == root.span_id
+        assert by_name["child"].attributes == {"model": "m", "prompt_tokens": 10}
+        assert by_name["failing"].error == "ValueError: bad"
+        assert tracer.spans == []
+
+    def test_spans_propagate_into_tasks(self):
+        """Test concurrent tasks attach to the span that created them"""
+        import asyncio
+
+        from research_agent.tracing import Tracer
+
+        tracer = Tracer()
+
+        async def child(name):
+            with tracer.span(name):
+                await asyncio.sleep(0)
+
+        async def run():
+            with tracer.span("root") as root:
+                await asyncio.gather(child("a"), child("b"))
+            return root
+
+        root = asyncio.run(run())
+        spans = tracer.pop_trace(root.trace_id)
+        assert {s.parent_id for s in spans if s.name != "root"} == {root.span_id}
+
+    def test_export_formats(self, tmp_path):
+        """Test JSON lines and OTLP exports"""
+        import json
+
+        from research_agent.tracing import Tracer
+
+        tracer = Tracer()
+        with tracer.span("root", cache_hit=True, prompt_tokens=3) as root:
+            pass
+        spans = tracer.pop_trace(root.trace_id)
+
+        path = tmp_path / "traces.jsonl"
+        tracer.export(spans, str(path))
+        record = json.loads(path.read_text())
+        assert record["name"] == "root"
+        assert record["status"] == {"code": "OK"}
+        assert record["attributes"]["cache_hit"] is True
+
+        tracer.export_format = "otlp"
+        otlp_path = tmp_path / "traces.otlp.jsonl"
+        tracer.export(spans, str(otlp_path))
+        request = json.loads(otlp_path.read_text())
+        span = request["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert span["traceId"] == root.trace_id
+        assert {"key": "prompt_tokens", "value": {"intValue": "3"}} in span[
+            "attributes"
+        ]
+
+    def test_cached_run_records_llm_span(self, tmp_path):
+        """Test agent calls record model, sizes and cache hits"""
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_run
+        from research_agent.tracing import Tracer, summarize
+
+        class Agent:
+            async def run(self, prompt, instruction, model):
+                return "answer"
+
+        tracer = Tracer()
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+
+        async def run():
+            with tracer.span("root") as root:
+                await cached_run(Agent(), "web_searcher", "inst", "prompt")
+                await cached_run(Agent(), "web_searcher", "inst", "prompt")
+            return root
+
+        with (
+            patch.object(llm_cache_module, "_llm_cache", cache),
+            patch("research_agent.tracing._tracer", tracer),
+        ):
+            root = asyncio.run(run())
+
+        spans = [s for s in tracer.pop_trace(root.trace_id) if s.name == "llm.call"]
+        assert [s.attributes["cache_hit"] for s in spans] == [False, True]
+        assert spans[0].attributes["prompt_chars"] == 6
+        assert spans[0].attributes["completion_chars"] == 6
+        assert spans[0].attributes["model"]
+
+        table = summarize(spans)
+        assert "llm.call" in table
+        assert spans[0].attributes["model"] in table
+
+
+class TestMockLLMServer:
+    """Test the OpenAI-compatible mock server used by the benchmarks"""
+
+    async def _request(self, app, method, path, **kwargs):
+        from aiohttp.test_utils import TestClient, TestServer
+
+        async with TestClient(TestServer(app)) as client:
+            response = await client.request(method, path, **kwargs)
+            if path == "/v1/chat/completions" and kwargs["json"].get("stream"):
+                return await response.text()
+            return await response.json()
+
+    def test_chat_completion(self):
+        """Test non-streaming completions follow the OpenAI schema"""
+        import asyncio
+
+        from research_agent.mock_llm_server import STATS_KEY, create_app
+
+        app = create_app(response_tokens=5)
+        body = {"model": "llama3.2:latest", "messages": [{"content": "hi"}]}
+        data = asyncio.run(
+            self._request(app, "POST", "/v1/chat/completions", json=body)
+        )
+
+        content = data["choices"][0]["message"]["content"]
+        assert content.endswith("token0 token1 token2 token3 token4")
+        assert data["usage"]["completion_tokens"] == 5
+        assert app[STATS_KEY].requests == 1
+
+    def test_completion_depends_on_prompt_content(self):
+        """Test same-length prompts get different responses"""
+        from research_agent.mock_llm_server import _completion_text
+
+        assert _completion_text("问题甲", 3) == _completion_text("问题甲", 3)
+        assert _completion_text("问题甲", 3) != _completion_text("问题乙", 3)
+
+    def test_streaming_completion(self):
+        """Test streamed chunks reassemble into the full response"""
+        import asyncio
+        import json
+
+        from research_agent.mock_llm_server import create_app
+
+        body = {"messages": [{"content": "hi"}], "stream": True}
+        text = asyncio.run(
+            self._request(
+                create_app(response_tokens=3), "POST", "/v1/chat/completions", json=body
+            )
+        )
+
+        events = [line[6:] for line in text.splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        content = "".join(
+            json.loads(e)["choices"][0]["delta"]["content"] for e in events[:-1]
+        )
+        assert content.endswith("token0 token1 token2")
+
+    def test_model_listing(self):
+        """Test OpenAI and Ollama model listing endpoints"""
+        import asyncio
+
+        from research_agent.mock_llm_server import create_app
+
+        app = create_app(models=["llama3.2:latest"])
+        models = asyncio.run(self._request(app, "GET", "/v1/models"))
+        tags = asyncio.run(self._request(create_app(models=["a"]), "GET", "/api/tags"))
+
+        assert models["data"][0]["id"] == "llama3.2:latest"
+        assert tags["models"][0]["name"] == "a"
+
+    def test_http_runtime_sends_instruction_and_model(self):
+        """Test the HTTP runtime delivers instruction, prompt and model to the server"""
+        import asyncio
+
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.http_runtime import http_runtime
+        from research_agent.mock_llm_server import (
+            STATS_KEY,
+            _completion_text,
+            create_app,
+        )
+
+        app = create_app(response_tokens=3)
+
+        async def run():
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                async with http_runtime(str(server.make_url("/v1"))) as agent:
+                    answer = await agent.run("问题", "指令", "generic.qwen2.5:latest")
+                    chunks = [
+                        c
+                        async for c in agent.stream(
+                            "问题", "指令", "generic.llama3.2:latest"
+                        )
+                    ]
+                return answer, chunks
+            finally:
+                await server.close()
+
+        answer, chunks = asyncio.run(run())
+        # 模拟服务器的响应取决于 system 和 user 消息的全部内容
+        assert answer == "".join(chunks) == _completion_text("指令问题", 3)
+        assert len(chunks) > 1
+        assert app[STATS_KEY].models == {"qwen2.5:latest": 1, "llama3.2:latest": 1}
+
+
+class TestAgentRuntime:
+    """Test the shared agent runtime"""
+
+    def _factory(self, events):
+        import asyncio
+        from contextlib import asynccontextmanager
+
+        @asynccontextmanager
+        async def fake_run():
+            events.append("enter")
+            await asyncio.sleep(0.01)
+            yield object()
+            events.append("exit")
+
+        return fake_run
+
+    def test_runtime_is_shared_across_sessions(self):
+        """Test concurrent and sequential sessions reuse one runtime"""
+        import asyncio
+
+        from research_agent.runtime import AgentRuntime
+
+        events = []
+        runtime = AgentRuntime(self._factory(events))
+
+        async def borrow():
+            async with runtime.session() as agent:
+                return agent
+
+        async def run():
+            agents = await asyncio.gather(*(borrow() for _ in range(5)))
+            agents.append(await borrow())
+            await runtime.shutdown()
+            return agents
+
+        agents = asyncio.run(run())
+        assert len({id(a) for a in agents}) == 1
+        assert runtime.starts == 1
+        assert events == ["enter", "exit"]
+        assert runtime.running is False
+
+    def test_runtime_restarts_on_new_event_loop(self):
+        """Test a runtime from a finished event loop is rebuilt"""
+        import asyncio
+
+        from research_agent.runtime import AgentRuntime
+
+        runtime = AgentRuntime(self._factory([]))
+
+        async def borrow():
+            async with runtime.session() as agent:
+                return agent
+
+        first = asyncio.run(borrow())
+        second = asyncio.run(borrow())
+        assert first is not second
+        assert runtime.starts == 2
+
+    def test_unregistered_runtime_calls_agents_directly(self):
+        """Test a runtime that does not register agents never imports fast"""
+        import asyncio
+        import sys
+
+        from research_agent import runtime as runtime_module
+        from research_agent.runtime import AgentRuntime, deferred_agent, deferred_chain
+
+        loaded = []
+
+        @deferred_agent("question_analyzer", "inst")
+        async def unregistered_agent(question):
+            return f"答复 {question}"
+
+        @deferred_chain(["unregistered_agent"], loader=lambda: loaded.append(1))
+        async def unregistered_chain(question):
+            return await unregistered_agent(question)
+
+        runtime = AgentRuntime(self._factory([]), register_agents=False)
+        with (
+            patch.object(runtime_module, "agent_runtime", runtime),
+            patch.dict(sys.modules, {"fast": None}),
+        ):
+            assert asyncio.run(unregistered_chain("问题")) == "答复 问题"
+
+        assert loaded == [1]
+        assert unregistered_agent.registered is False
+        assert unregistered_chain.registered is False
+
+    def test_use_refuses_a_running_runtime(self):
+        """Test the factory cannot be swapped while the runtime is running"""
+        import asyncio
+
+        from research_agent.runtime import AgentRuntime
+
+        runtime = AgentRuntime(self._factory([]))
+
+        async def run():
+            await runtime.start()
+            try:
+                with pytest.raises(RuntimeError):
+                    runtime.use(self._factory([]))
+            finally:
+                await runtime.shutdown()
+
+        asyncio.run(run())
+        runtime.use(self._factory([]))
+        assert runtime.register_agents is False
+
+    def test_each_stage_sends_its_instruction_and_model(self, tmp_path):
+        """Test the shared runtime receives every agent's own instruction and model"""
+        import asyncio
+        from contextlib import asynccontextmanager
+
+        from research_agent import analysis_chain, question_analyzer
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.config import config
+        from research_agent.llm_cache import LLMCache
+        from research_agent.model_router import ModelRouter
+        from research_agent.runtime import AgentRuntime
+
+        received = []
+
+        class RecordingAgent:
+            async def run(self, prompt, instruction, model):
+                received.append((instruction, model))
+                return "回答"
+
+        @asynccontextmanager
+        async def fake_run():
+            yield RecordingAgent()
+
+        runtime = AgentRuntime(fake_run)
+
+        async def run():
+            await question_analyzer.analyze_question.func("问题")
+            await analysis_chain.analyze_chunk.func("分析", "[1] 来源")
+
+        with (
+            patch.object(question_analyzer, "agent_runtime", runtime),
+            patch.object(analysis_chain, "agent_runtime", runtime),
+            patch.object(
+                llm_cache_module, "_llm_cache", LLMCache(str(tmp_path / "c.sqlite3"))
+            ),
+            patch("research_agent.model_router._model_router", ModelRouter()),
+        ):
+            asyncio.run(run())
+
+        assert received == [
+            (
+                question_analyzer.QUESTION_ANALYZER_INSTRUCTION,
+                config.get_model("question_analyzer"),
+            ),
+            (
+                analysis_chain.ANALYSIS_MAP_INSTRUCTION,
+                config.get_model("analysis_map"),
+            ),
+        ]
+
+
+class TestModelRouter:
+    """Test latency-aware model routing"""
+
+    def _router(self, tmp_path, **kwargs):
+        from research_agent.config import Config
+        from research_agent.model_router import ModelRouter
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            """
+defaults:
+  cloud_model: anthropic.claude-3-sonnet-latest
+  local_model: generic.llama3.2:latest
+  use_local: true
+agents:
+  web_searcher:
+    cloud: anthropic.claude-3-haiku-latest
+    local: generic.qwen2.5:latest
+"""
+        )
+        return Config(str(config_file)), ModelRouter(**kwargs)
+
+    def test_candidates_prefer_configured_side(self, tmp_path):
+        """Test the configured model comes first and the other side is the fallback"""
+        test_config, router = self._router(tmp_path, cross_side_fallback=True)
+        with patch("research_agent.model_router.config", test_config):
+            assert router.candidates("web_searcher") == [
+                "generic.qwen2.5:latest",
+                "anthropic.claude-3-haiku-latest",
+                "anthropic.claude-3-sonnet-latest",
+            ]
+
+    def test_cross_side_fallback_is_opt_in(self, tmp_path):
+        """Test only explicit fallbacks are used unless cross-side fallback is enabled"""
+        test_config, router = self._router(
+            tmp_path,
+            fallbacks={"generic.qwen2.5:latest": ["generic.llama3.2:latest"]},
+        )
+        with patch("research_agent.model_router.config", test_config):
+            assert router.candidates("web_searcher") == [
+                "generic.qwen2.5:latest",
+                "generic.llama3.2:latest",
+            ]
+
+    def test_non_transient_errors_do_not_fall_back(self, tmp_path):
+        """Test an auth error is raised as-is and the primary's error wins"""
+        import asyncio
+
+        class AuthError(Exception):
+            status = 401
+
+        test_config, router = self._router(tmp_path, cross_side_fallback=True)
+        calls = []
+
+        async def unauthorized(model):
+            calls.append(model)
+            raise AuthError("invalid api key")
+
+        async def all_down(model):
+            calls.append(model)
+            if model == "generic.qwen2.5:latest":
+                raise TimeoutError("primary timed out")
+            raise ConnectionError(f"{model} unreachable")
+
+        with patch("research_agent.model_router.config", test_config):
+            with pytest.raises(AuthError):
+                asyncio.run(router.call("web_searcher", unauthorized))
+            assert calls == ["generic.qwen2.5:latest"]
+
+            calls.clear()
+            with pytest.raises(TimeoutError, match="primary timed out"):
+                asyncio.run(router.call("web_searcher", all_down))
+            assert len(calls) == 3
+
+    def test_fallback_and_circuit_breaker(self, tmp_path):
+        """Test failing models fall back and are skipped while the circuit is open"""
+        import asyncio
+
+        test_config, router = self._router(
+            tmp_path, cooldown=60, cross_side_fallback=True
+        )
+        calls = []
+
+        async def call(model):
+            calls.append(model)
+            if model == "generic.qwen2.5:latest":
+                raise ConnectionError("ollama down")
+            return f"answer from {model}"
+
+        with patch("research_agent.model_router.config", test_config):
+            for _ in range(3):
+                model, result = asyncio.run(router.call("web_searcher", call))
+                assert model == "anthropic.claude-3-haiku-latest"
+                assert result == "answer from anthropic.claude-3-haiku-latest"
+            assert router.order("web_searcher")[-1] == "generic.qwen2.5:latest"
+
+        # 连续两次失败后熔断，第三次直接使用备选模型
+        assert calls.count("generic.qwen2.5:latest") == 2
+        assert router.snapshot()["generic.qwen2.5:latest"]["circuit_open"] is True
+
+    def test_slow_model_is_deprioritized(self, tmp_path):
+        """Test a model whose p95 latency exceeds the threshold moves behind the fallback"""
+        test_config, router = self._router(
+            tmp_path, latency_threshold=1.0, cross_side_fallback=True
+        )
+        for _ in range(3):
+            router.record("generic.qwen2.5:latest", 5.0, True)
+
+        with patch("research_agent.model_router.config", test_config):
+            assert router.order("web_searcher")[0] == "anthropic.claude-3-haiku-latest"
+
+    def test_hedged_request(self, tmp_path):
+        """Test a slow primary triggers a hedge and the loser is cancelled"""
+        import asyncio
+
+        test_config, router = self._router(
+            tmp_path,
+            hedge_agents=["web_searcher"],
+            hedge_delay=0.05,
+            cross_side_fallback=True,
+        )
+        cancelled = []
+
+        async def call(model):
+            try:
+                await asyncio.sleep(1.0 if model == "generic.qwen2.5:latest" else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return model
+
+        with patch("research_agent.model_router.config", test_config):
+            model, result = asyncio.run(router.call("web_searcher", call))
+
+        assert model == result == "anthropic.claude-3-haiku-latest"
+        assert cancelled == ["generic.qwen2.5:latest"]
+
+    def test_cached_run_caches_fallback_response(self, tmp_path):
+        """Test cached_run falls back and caches under the model that answered"""
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_run
+        from research_agent.rate_limiter import RateLimiter
+
+        test_config, router = self._router(tmp_path, cross_side_fallback=True)
+
+        class FlakyAgent:
+            async def run(self, prompt, instruction, model):
+                if model == "generic.qwen2.5:latest":
+                    raise TimeoutError("local model timed out")
+                return f"{model}: {prompt}"
+
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+        with (
+            patch("research_agent.model_router.config", test_config),
+            patch.object(llm_cache_module, "config", test_config),
+            patch("research_agent.model_router._model_router", router),
+            patch.object(llm_cache_module, "_llm_cache", cache),
+            # 不重试，超时后直接回退
+            patch(
+                "research_agent.rate_limiter._rate_limiter", RateLimiter(max_retries=0)
+            ),
+        ):
+            result = asyncio.run(cached_run(FlakyAgent(), "web_searcher", "i", "hi"))
+
+        assert result == "anthropic.claude-3-haiku-latest: hi"
+        assert cache.get("anthropic.claude-3-haiku-latest", "i", "hi") == result
+
+    def test_hedged_primary_win_is_cached_under_primary(self, tmp_path):
+        """Test the model that actually answered keys the cache and the trace"""
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_run
+        from research_agent.tracing import Tracer
+
+        test_config, router = self._router(
+            tmp_path,
+            hedge_agents=["web_searcher"],
+            hedge_delay=0.05,
+            cross_side_fallback=True,
+        )
+
+        class SlowHedgeAgent:
+            async def run(self, prompt, instruction, model):
+                # 首选模型晚于 hedge_delay 返回，但仍先于备选模型
+                slow = model != "generic.qwen2.5:latest"
+                await asyncio.sleep(1.0 if slow else 0.1)
+                return f"{model}: {prompt}"
+
+        tracer = Tracer()
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+
+        async def run():
+            with tracer.span("root") as root:
+                result = await cached_run(SlowHedgeAgent(), "web_searcher", "i", "hi")
+            return root, result
+
+        with (
+            patch("research_agent.model_router.config", test_config),
+            patch.object(llm_cache_module, "config", test_config),
+            patch("research_agent.model_router._model_router", router),
+            patch.object(llm_cache_module, "_llm_cache", cache),
+            patch("research_agent.tracing._tracer", tracer),
+        ):
+            root, result = asyncio.run(run())
+
+        [span] = [s for s in tracer.pop_trace(root.trace_id) if s.name == "llm.call"]
+        assert result == "generic.qwen2.5:latest: hi"
+        assert span.attributes["routed_model"] == "generic.qwen2.5:latest"
+        assert cache.get("generic.qwen2.5:latest", "i", "hi") == result
+        assert cache.get("anthropic.claude-3-haiku-latest", "i", "hi") is None
+
+
+class TestLazyStartup:
+    """Test lazy configuration loading and deferred agent registration"""
+
+    def test_config_loads_on_first_access(self, tmp_path):
+        """Test Config does not read the file until a value is needed"""
+        from research_agent.config import Config
+
+        config_file = tmp_path / "config.yaml"
+        test_config = Config(str(config_file))
+        config_file.write_text("defaults:\n  cloud_model: anthropic.late\n")
+
+        assert test_config.get_model("any") == "anthropic.late"
+
+    def test_main_import_skips_fast_and_agents(self):
+        """Test importing main loads neither fast, numpy, aiohttp nor agents"""
+        import subprocess
+        import sys
+
+        code = (
+            "import sys, research_agent.main; "
+            "print(sorted(m for m in sys.modules if m in ('fast', 'numpy', 'aiohttp') "
+            "or m.endswith(('question_analyzer', 'web_searcher', "
+            "'analysis_chain', 'report_generator'))))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "[]"
+
+    def test_main_import_does_not_read_config(self):
+        """Test shared caches, routers and tracers are created on first use"""
+        import subprocess
+        import sys
+
+        code = (
+            "import research_agent.main, research_agent.server, "
+            "research_agent.worker; "
+            "from research_agent.config import config; print(config._config)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "None"
+
+    def test_shared_instances_are_created_once(self):
+        """Test accessors build the shared instance lazily and then reuse it"""
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, get_llm_cache
+
+        with patch.object(llm_cache_module, "_llm_cache", None):
+            with patch.object(
+                LLMCache, "from_config", side_effect=lambda: LLMCache(enabled=False)
+            ) as from_config:
+                first = get_llm_cache()
+                assert get_llm_cache() is first
+        assert from_config.call_count == 1
+
+    def test_deferred_agent_declaration(self):
+        """Test declaring an agent records its spec without registering it"""
+        from research_agent.runtime import AGENTS, deferred_agent
+
+        @deferred_agent("question_analyzer", "inst")
+        async def sample_agent(question):
+            return question
+
+        assert AGENTS["sample_agent"] is sample_agent
+        assert sample_agent.__name__ == "sample_agent"
+        assert sample_agent.registered is False
+
+    def test_workflow_chain_lists_every_agent(self):
+        """Test the workflow chain registers every agent its modules declare"""
+        from research_agent.main import _load_agents, research_workflow
+        from research_agent.runtime import AGENTS
+
+        _load_agents()
+        declared = {
+            name
+            for name, agent in AGENTS.items()
+            if agent.func.__module__.startswith("research_agent.")
+        }
+        assert set(research_workflow.agents) == declared
+
+    def test_list_models(self, tmp_path):
+        """Test --list-models resolves every configured agent"""
+        from research_agent import cli
+        from research_agent.config import Config
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            """
+defaults:
+  cloud_model: anthropic.claude-3-sonnet-latest
+  local_model: generic.llama3.2:latest
+  use_local: true
+agents:
+  web_searcher:
+    local: generic.qwen2.5:latest
+"""
+        )
+        with patch.object(cli, "config", Config(str(config_file))):
+            result = cli.list_models()
+
+        assert result["mode"] == "local"
+        assert result["agents"]["web_searcher"] == "generic.qwen2.5:latest"
+        assert result["agents"]["report_generator"] == "generic.llama3.2:latest"
+
+
+class TestQueryPlan:
+    """Test query plan parsing and the local keyword fallback"""
+
+    def test_extract_keywords_cjk(self):
+        """Test Chinese questions are split on function words, not kept whole"""
+        from research_agent.query_plan import extract_keywords
+
+        assert extract_keywords("人工智能在医疗诊断中的应用前景如何？") == [
+            "人工智能",
+            "医疗诊断",
+            "应用前景",
+        ]
+
+    def test_extract_keywords_english(self):
+        """Test English stopwords are dropped and repeated terms rank first"""
+        from research_agent.query_plan import extract_keywords
+
+        keywords = extract_keywords(
+            "What is the impact of battery recycling on battery prices?", limit=3
+        )
+        assert keywords == ["battery", "impact", "recycling"]
+
+    def test_parse_ranked_plan(self):
+        """Test queries are ordered by priority, deduplicated and removed from analysis"""
+        from research_agent.query_plan import parse_query_plan
+
+        text = """问题分类：技术趋势
+```json
+{"sub_questions": ["成本如何变化？"],
+ "queries": [{"query": "储能 成本", "priority": 2},
+             {"query": "固态电池 进展", "priority": 1},
+             "储能  成本"],
+ "expected_sources": 8}
+```"""
+        plan = parse_query_plan(text, "固态电池的前景？")
+
+        assert plan.queries == ["固态电池 进展", "储能 成本"]
+        assert plan.sub_questions == ["成本如何变化？"]
+        assert plan.expected_sources == 8
+        assert plan.results_per_query() == 4
+        assert plan.analysis == "问题分类：技术趋势"
+        assert plan.source == "llm"
+
+    def test_fallback_on_unparseable_output(self):
+        """Test free-form model output falls back to local keywords"""
+        from research_agent.query_plan import QueryPlan, parse_query_plan
+
+        plan = parse_query_plan("无法给出计划 {not json", "量子计算的商业化进展")
+
+        assert plan.source == "keywords"
+        assert plan.analysis == "无法给出计划 {not json"
+        assert "量子计算" in plan.queries
+        assert QueryPlan.from_dict(plan.to_dict()).to_dict() == plan.to_dict()
+
+
+class TestMapReduceAnalysis:
+    """Test the map-reduce analysis mode"""
+
+    def test_chunks_are_mapped_concurrently_and_reduced(self):
+        """Test chunks run under the concurrency cap and keep global numbering"""
+        import asyncio
+        from contextlib import asynccontextmanager
+
+        from research_agent import analysis_chain
+        from research_agent.runtime import AgentRuntime
+
+        sources = [
+            {"title": f"来源{i}", "url": f"https://e.com/{i}", "summary": "内容"}
+            for i in range(1, 11)
+        ]
+        active = {"now": 0, "peak": 0}
+        mapped = []
+
+        async def fake_chunk(question_analysis, sources_text):
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            mapped.append(sources_text)
+            if "[9]" in sources_text:
+                raise TimeoutError("map model timed out")
+            return f"要点 {sources_text.count('https://')}"
+
+        prompts = []
+
+        async def fake_cached_run(agent, agent_name, instruction, prompt):
+            prompts.append((agent_name, prompt))
+            return "合并后的分析"
+
+        @asynccontextmanager
+        async def fake_run():
+            yield object()
+
+        settings = {"mode": "map_reduce", "chunk_size": 4, "max_concurrency": 2}
+        with (
+            patch.object(analysis_chain, "analyze_chunk", fake_chunk),
+            patch.object(analysis_chain, "cached_run", fake_cached_run),
+            patch.object(analysis_chain, "agent_runtime", AgentRuntime(fake_run)),
+        ):
+            result = asyncio.run(analysis_chain._map_reduce(sources, "问题", settings))
+
+        assert result == "合并后的分析"
+        assert len(mapped) == 3
+        assert active["peak"] == 2
+        assert any("[5] 来源5" in text and "[4]" not in text for text in mapped)
+        # 失败的批次被跳过，其余批次进入 reduce
+        [(agent_name, reduce_prompt)] = prompts
+        assert agent_name == "analysis_chain"
+        assert "来源 [1]-[4]" in reduce_prompt
+        assert "来源 [5]-[8]" in reduce_prompt
+        assert "来源 [9]-[10]" not in reduce_prompt
+
+
+class TestPassageIndex:
+    """Test the local passage retrieval index"""
+
+    SOURCES = [
+        {
+            "title": "固态电池进展",
+            "url": "https://a.com/1",
+            "summary": "固态电池的能量密度持续提升。量产成本仍然较高。",
+        },
+        {
+            "title": "Grid storage",
+            "url": "https://b.com/2",
+            "summary": "Grid storage prices fell sharply. Lithium supply is tight.",
+        },
+        {
+            "title": "无关来源",
+            "url": "https://c.com/3",
+            "summary": "今天的天气晴朗，适合出游。",
+        },
+    ]
+
+    def test_split_passages(self):
+        """Test passages respect the token limit and keep sentence boundaries"""
+        from research_agent.context_packer import estimate_tokens
+        from research_agent.passage_index import split_passages
+
+        text = "第一句话。第二句话比较长一些。" * 10
+        passages = split_passages(text, max_tokens=20)
+        assert len(passages) > 1
+        assert all(estimate_tokens(p) <= 20 for p in passages)
+        assert "".join(passages).replace(" ", "") == text
+
+    def test_bm25_search_and_persistence(self, tmp_path):
+        """Test BM25 ranking, URL filtering and reloading from disk"""
+        from research_agent.passage_index import PassageIndex
+
+        index = PassageIndex(str(tmp_path), passage_tokens=20)
+        added = index.add_sources(self.SOURCES)
+        assert index.add_sources(self.SOURCES) == 0
+        index.save()
+
+        hits = index.search("固态电池 成本", k=2)
+        assert hits[0]["url"] == "https://a.com/1"
+        assert index.search("lithium", k=2, urls={"https://a.com/1"}) == []
+
+        # 新进程只在检索时按 URL 加载当前来源的分片
+        reloaded = PassageIndex(str(tmp_path), passage_tokens=20)
+        assert len(reloaded) == 0
+        urls = {source["url"] for source in self.SOURCES}
+        assert reloaded.search("grid storage prices", k=1, urls=urls)[0]["url"] == (
+            "https://b.com/2"
+        )
+        assert len(reloaded) == added
+        assert (
+            PassageIndex(str(tmp_path), passage_tokens=20).add_sources(self.SOURCES)
+            == 0
+        )
+
+    def test_shards_are_keyed_by_url_and_bounded(self, tmp_path):
+        """Test changed content replaces its shard and memory keeps max_sources"""
+        from research_agent.passage_index import PassageIndex
+
+        index = PassageIndex(str(tmp_path), passage_tokens=20, max_sources=2)
+        index.add_sources(self.SOURCES)
+        assert list(index._sources) == [s["url"] for s in self.SOURCES]
+
+        index.add_sources(self.SOURCES[:1])
+        # b 最久未使用，被淘汰前写入磁盘
+        assert list(index._sources) == ["https://c.com/3", "https://a.com/1"]
+        index.save()
+
+        changed = {**self.SOURCES[0], "summary": "固态电池已经量产。"}
+        assert index.add_sources([changed]) == 1
+        index.save()
+        assert len(list((tmp_path / "sources").iterdir())) == 3
+        hits = PassageIndex(str(tmp_path), 20).search("量产", urls={changed["url"]})
+        assert hits[0]["text"] == "固态电池已经量产。"
+
+    def test_vectors_are_memory_mapped(self, tmp_path):
+        """Test optional hashed vectors persist in a memory-mapped file"""
+        np = pytest.importorskip("numpy")
+        from research_agent.passage_index import PassageIndex
+
+        index = PassageIndex(str(tmp_path), passage_tokens=20, vectors=True)
+        index.add_sources(self.SOURCES)
+        index.save()
+        assert all(
+            isinstance(shard["vectors"], np.memmap) for shard in index._sources.values()
+        )
+
+        reloaded = PassageIndex(str(tmp_path), passage_tokens=20, vectors=True)
+        urls = {source["url"] for source in self.SOURCES}
+        hits = reloaded.search("固态电池", k=1, urls=urls)
+        assert hits[0]["url"] == "https://a.com/1"
+        shard = reloaded._sources["https://a.com/1"]
+        assert isinstance(shard["vectors"], np.memmap)
+        assert len(shard["vectors"]) == len(shard["passages"])
+
+    def test_retrieve_passages_per_sub_question(self, tmp_path):
+        """Test retrieval numbers passages by source and feeds the packer"""
+        import asyncio
+
+        from research_agent.context_packer import pack_search_context
+        from research_agent.passage_index import PassageIndex, retrieve_passages
+
+        plan = {"sub_questions": ["固态电池成本", "grid storage prices"]}
+        search_data = {"raw_results": self.SOURCES, "analysis": "摘要"}
+        evidence = asyncio.run(
+            retrieve_passages(
+                plan, search_data, PassageIndex(str(tmp_path), 20), top_k=1
+            )
+        )
+
+        assert [p["source"] for p in evidence["passages"]] == [1, 2]
+        context = pack_search_context(evidence, "", 1000)
+        assert context.startswith("[1] 固态电池进展 | https://a.com/1")
+        assert "天气" not in context
+
+
+class TestNearDuplicates:
+    """Test near-duplicate source clustering"""
+
+    ARTICLE = (
+        "Researchers announced a solid state battery cell that reaches five hundred "
+        "watt hours per kilogram in laboratory tests while surviving more than one "
+        "thousand charge cycles without significant capacity loss according to the "
+        "team which plans pilot production next year with two automotive partners"
+    )
+
+    def _sources(self):
+        return [
+            {
+                "title": "Battery breakthrough",
+                "url": "https://news.a.com/battery",
+                "summary": self.ARTICLE,
+                "keywords": ["battery"],
+            },
+            {
+                "title": "Battery breakthrough (syndicated)",
+                "url": "https://mirror.b.com/story/123",
+                "summary": "Syndicated from A. "
+                + self.ARTICLE
+                + " All rights reserved.",
+                "keywords": ["solid state"],
+            },
+            {
+                "title": "Grid prices",
+                "url": "https://c.com/grid",
+                "summary": "Grid scale storage prices fell sharply this year as "
+                "lithium iron phosphate supply expanded and new factories in several "
+                "regions started production ahead of schedule for utility customers",
+            },
+            {"title": "关于 电池 的信息", "url": "https://e.com/1", "summary": "短"},
+            {"title": "关于 电网 的信息", "url": "https://e.com/2", "summary": "短"},
+        ]
+
+    @pytest.mark.parametrize("method", ["minhash", "simhash"])
+    def test_collapse_keeps_representative(self, method):
+        """Test mirrors collapse into the longest copy with alternates recorded"""
+        from research_agent.dedup import collapse_near_duplicates
+
+        settings = {
+            "enabled": True,
+            "method": method,
+            "threshold": 0.5,
+            "simhash_distance": 10,
+            "num_perm": 64,
+            "shingle_size": 2,
+            "min_tokens": 30,
+        }
+        collapsed = collapse_near_duplicates(self._sources(), settings)
+
+        assert [r["url"] for r in collapsed] == [
+            "https://mirror.b.com/story/123",
+            "https://c.com/grid",
+            "https://e.com/1",
+            "https://e.com/2",
+        ]
+        assert collapsed[0]["alternates"] == [
+            {"title": "Battery breakthrough", "url": "https://news.a.com/battery"}
+        ]
+        assert collapsed[0]["keywords"] == ["solid state", "battery"]
+
+    def test_disabled(self):
+        """Test the filter is a no-op when disabled"""
+        from research_agent.dedup import collapse_near_duplicates
+
+        sources = self._sources()
+        assert collapse_near_duplicates(sources, {"enabled": False}) is sources
+
+
+class TestPageFetcher:
+    """Test the page fetcher against a local aiohttp app"""
+
+    HTML = (
+        "<html><head><title>储能 报告</title><style>.x{}</style></head><body>"
+        "<nav>首页 | 关于</nav><article><h1>固态电池</h1><p>能量密度提升&amp;成本下降。"
+        "</p><script>var a = 1;</script><p>第二段</p></article></body></html>"
+    )
+
+    def _app(self, state):
+        import asyncio
+
+        from aiohttp import web
+
+        async def page(request):
+            state["requests"] += 1
+            state["seen_etag"] = request.headers.get("If-None-Match")
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304)
+            response = web.Response(
+                text=self.HTML, content_type="text/html", headers={"ETag": '"v1"'}
+            )
+            response.enable_compression()
+            return response
+
+        async def slow(request):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.05)
+            state["active"] -= 1
+            return web.Response(text="plain body", content_type="text/plain")
+
+        async def pdf(request):
+            return web.Response(body=b"%PDF-1.7", content_type="application/pdf")
+
+        async def bogus_charset(request):
+            return web.Response(
+                body="正文".encode("utf-8"),
+                headers={"Content-Type": "text/plain; charset=x-bogus"},
+            )
+
+        app = web.Application()
+        app.router.add_get("/page", page)
+        app.router.add_get("/slow", slow)
+        app.router.add_get("/report.pdf", pdf)
+        app.router.add_get("/bogus", bogus_charset)
+        return app
+
+    def test_skips_binary_and_recovers_bad_charset(self, tmp_path):
+        """Test non-text bodies are skipped and unknown charsets decode as UTF-8"""
+        import asyncio
+
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.page_fetcher import PageCache, PageFetcher
+
+        async def run():
+            server = TestServer(self._app({}))
+            await server.start_server()
+            fetcher = PageFetcher(PageCache(str(tmp_path / "pages.sqlite3")), workers=0)
+            try:
+                pdf = await fetcher.fetch(str(server.make_url("/report.pdf")))
+                bogus = await fetcher.fetch(str(server.make_url("/bogus")))
+            finally:
+                await fetcher.close()
+                await server.close()
+            return pdf, bogus, fetcher.stats
+
+        pdf, bogus, stats = asyncio.run(run())
+
+        assert pdf is None
+        assert bogus["content"] == "正文"
+        assert stats["skipped"] == 1 and stats["errors"] == 0
+
+    def test_extract_text(self):
+        """Test scripts, styles and navigation are dropped"""
+        from research_agent.page_fetcher import extract_text
+
+        title, text = extract_text(self.HTML)
+        assert title == "储能 报告"
+        assert text == "固态电池\n能量密度提升&成本下降。\n第二段"
+
+    def test_conditional_refetch(self, tmp_path):
+        """Test gzip pages are extracted in the process pool and revalidated by ETag"""
+        import asyncio
+
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.page_fetcher import PageCache, PageFetcher
+
+        state = {"requests": 0, "active": 0, "peak": 0}
+
+        async def run():
+            server = TestServer(self._app(state))
+            await server.start_server()
+            url = str(server.make_url("/page"))
+            fetcher = PageFetcher(
+                PageCache(str(tmp_path / "pages.sqlite3")),
+                workers=1,
+                revalidate_after=0,
+            )
+            try:
+                first = await fetcher.fetch(url)
+                second = await fetcher.fetch(url)
+            finally:
+                await fetcher.close()
+                await server.close()
+            return first, second
+
+        first, second = asyncio.run(run())
+
+        assert first["status"] == "fetched"
+        assert first["title"] == "储能 报告"
+        assert "能量密度提升" in first["content"]
+        assert second["status"] == "not_modified"
+        assert second["content"] == first["content"]
+        assert state["seen_etag"] == '"v1"'
+        assert state["requests"] == 2
+
+    def test_fresh_cache_skips_network_and_domain_limit(self, tmp_path):
+        """Test fresh cache entries skip the request and per-domain limits apply"""
+        import asyncio
+
+        from aiohttp.test_utils import TestServer
+
+        from research_agent.page_fetcher import PageCache, PageFetcher
+
+        state = {"requests": 0, "active": 0, "peak": 0}
+
+        async def run():
+            server = TestServer(self._app(state))
+            await server.start_server()
+            fetcher = PageFetcher(
+                PageCache(str(tmp_path / "pages.sqlite3")), per_domain=2, workers=0
+            )
+            sources = [
+                {"title": f"t{i}", "url": str(server.make_url(f"/slow?i={i}"))}
+                for i in range(5)
+            ] + [{"title": "no url", "summary": "摘要"}]
+            try:
+                enriched = await fetcher.fetch_sources(sources)
+                again = await fetcher.fetch(sources[0]["url"])
+            finally:
+                await fetcher.close()
+                await server.close()
+            return enriched, again
+
+        enriched, again = asyncio.run(run())
+
+        assert [s.get("content") for s in enriched[:5]] == ["plain body"] * 5
+        assert enriched[5] == {"title": "no url", "summary": "摘要"}
+        assert state["peak"] == 2
+        assert again["status"] == "cached"
+
+
+class TestCitations:
+    """Test the local citation formatter"""
+
+    SOURCES = [
+        {
+            "title": "Solid-state batteries",
+            "url": "https://www.example.com/ssb?utm_source=x",
+            "author": "Lee, J.",
+            "published": "2024-03-01",
+        },
+        {
+            "title": "储能市场报告",
+            "url": "https://news.example.org/storage",
+            "alternates": [{"title": "转载", "url": "https://mirror.example.net/a"}],
+        },
+        {"title": "Unused", "url": "https://example.com/unused"},
+    ]
+
+    def test_cited_numbers(self):
+        from research_agent.citations import cited_numbers
+
+        text = "结论 [2]。另见 [1, 3] 和 [4-5]，链接 [9](http://x) 不算，[2] 重复。"
+        assert cited_numbers(text) == [2, 1, 3, 4, 5]
+
+    def test_format_reference_apa(self):
+        from research_agent.citations import format_reference
+
+        assert format_reference(self.SOURCES[0]) == (
+            "Lee, J. (2024). *Solid-state batteries.* example.com. "
+            "https://www.example.com/ssb?utm_source=x"
+        )
+        assert format_reference(self.SOURCES[1]) == (
+            "*储能市场报告.* (n.d.). news.example.org. "
+            "https://news.example.org/storage 另见: https://mirror.example.net/a"
+        )
+
+    def test_format_citations_keeps_report_text(self):
+        from research_agent.citations import format_citations
+
+        report = "# 报告\n\n固态电池进展 [1]，市场 [2] [7]。\n"
+        final = format_citations(report, self.SOURCES)
+        assert final.startswith(report)
+        references = final[len(report) :]
+        assert "[1] Lee, J." in references
+        assert "[2] *储能市场报告.*" in references
+        assert "Unused" not in references
+        assert "[7]" not in references
+
+    def test_uncited_report_lists_all_sources(self):
+        from research_agent.citations import format_citations
+
+        final = format_citations("没有标记的报告", self.SOURCES)
+        assert "[3] *Unused.*" in final
+        assert format_citations("报告", []) == "报告"
+
+
+class TestFastProfile:
+    """Test the reduced-round-trip fast pipeline profile"""
+
+    def _patches(self, module, prompts, response):
+        from contextlib import asynccontextmanager
+
+        from research_agent.runtime import AgentRuntime
+
+        async def fake_cached_run(agent, agent_name, instruction, prompt):
+            prompts.append((agent_name, prompt))
+            return response
+
+        @asynccontextmanager
+        async def fake_run():
+            yield object()
+
+        return (
+            patch.object(module, "cached_run", fake_cached_run),
+            patch.object(module, "agent_runtime", AgentRuntime(fake_run)),
+        )
+
+    def test_default_profile(self):
+        from research_agent.config import config
+
+        assert config.get_workflow_config()["profile"] in ("standard", "fast")
+
+    def test_split_analysis_review(self):
+        from research_agent.analysis_chain import split_analysis_review
+
+        parts = split_analysis_review(
+            "## 深度分析\n发现 [1]\n\n## 批判性审查\n证据不足"
+        )
+        assert parts == {"analysis": "发现 [1]", "review": "证据不足"}
+        # 模型没有按格式输出时全文作为分析
+        assert split_analysis_review("只有分析") == {
+            "analysis": "只有分析",
+            "review": "",
+        }
+
+    def test_analyze_and_review_is_one_call(self):
+        import asyncio
+
+        from research_agent import analysis_chain
+
+        prompts = []
+        run_patch, runtime_patch = self._patches(
+            analysis_chain, prompts, "## 深度分析\n分析\n## 批判性审查\n审查"
+        )
+        search_data = {
+            "raw_results": [{"title": "来源", "url": "https://e.com", "summary": "x"}]
+        }
+        with run_patch, runtime_patch:
+            result = asyncio.run(
+                analysis_chain.analyze_and_review.func(search_data, "问题分析")
+            )
+        assert result == {"analysis": "分析", "review": "审查"}
+        assert len(prompts) == 1
+        assert "[1] 来源" in prompts[0][1]
+
+    def test_search_without_summary(self):
+        import asyncio
+
+        from research_agent import web_searcher
+        from research_agent.search_providers import MockSearchProvider
+
+        prompts = []
+        run_patch, runtime_patch = self._patches(web_searcher, prompts, "摘要")
+        with (
+            run_patch,
+            runtime_patch,
+            patch.object(
+                web_searcher, "get_search_provider", return_value=MockSearchProvider()
+            ),
+            patch.object(web_searcher, "get_search_cache", return_value=None),
+        ):
+            result = asyncio.run(
+                web_searcher.search_web.func(["储能"], 1, summarize=False)
+            )
+        assert prompts == []
+        assert result["analysis"] == ""
+
+    def test_search_summary_prompt_is_budgeted(self):
+        """Test fetched page text is packed into the model budget, not dumped raw"""
+        import asyncio
+
+        from research_agent import context_packer, web_searcher
+        from research_agent.search_providers import MockSearchProvider
+
+        class LongPages:
+            async def fetch_sources(self, sources):
+                return [{**s, "content": "长文" * 20000} for s in sources]
+
+        prompts = []
+        run_patch, runtime_patch = self._patches(web_searcher, prompts, "摘要")
+        with (
+            run_patch,
+            runtime_patch,
+            patch.object(
+                web_searcher, "get_search_provider", return_value=MockSearchProvider()
+            ),
+            patch.object(web_searcher, "get_search_cache", return_value=None),
+            patch.object(web_searcher, "get_page_fetcher", return_value=LongPages()),
+            patch.object(
+                web_searcher.config,
+                "get_fetch_config",
+                return_value={"enabled": True},
+            ),
+            patch.object(
+                context_packer.config, "get_context_budget", return_value=2000
+            ),
+        ):
+            result = asyncio.run(web_searcher.search_web.func(["储能"], 3))
+
+        prompt = prompts[0][1]
+        assert result["analysis"] == "摘要"
+        assert context_packer.estimate_tokens(prompt) <= 2000
+        assert prompt.startswith("请分析以下搜索结果，提取关键信息：\n[")
+        assert "长文长文" in prompt
+        assert "{'title'" not in prompt
+
+
+class TestResearchServer:
+    """Test the HTTP job service with an injected workflow"""
+
+    def _client(self, manager):
+        from aiohttp.test_utils import TestClient, TestServer
+
+        from research_agent.server import create_app
+
+        return TestClient(TestServer(create_app(manager)))
+
+    def test_job_lifecycle(self):
+        """Test submit, progress events over SSE, status and report"""
+        import asyncio
+
+        from research_agent.server import JobManager
+
+        calls = []
+
+        async def fake_workflow(question, on_progress=None, **kwargs):
+            calls.append((question, kwargs))
+            for stage in ("query_plan", "report"):
+                on_progress({"event": "stage_started", "stage": stage})
+                await asyncio.sleep(0.01)
+                on_progress({"event": "stage_completed", "stage": stage})
+            return {"final_report": f"# {question}\n报告 [1]"}
+
+        async def run():
+            async with self._client(JobManager(fake_workflow, workers=1)) as client:
+                response = await client.post(
+                    "/jobs", json={"question": "固态电池", "profile": "fast"}
+                )
+                assert response.status == 202
+                job = await response.json()
+                assert response.headers["Location"] == f"/jobs/{job['id']}"
+
+                events = await client.get(f"/jobs/{job['id']}/events")
+                assert events.headers["Content-Type"] == "text/event-stream"
+                body = await events.text()
+
+                status = await (await client.get(f"/jobs/{job['id']}")).json()
+                report = await client.get(f"/jobs/{job['id']}/report")
+                missing = await client.get("/jobs/nope")
+                return body, status, report.status, await report.text(), missing.status
+
+        body, status, report_status, report, missing_status = asyncio.run(run())
+
+        names = [
+            line.split(": ", 1)[1]
+            for line in body.splitlines()
+            if line.startswith("event: ")
+        ]
+        assert names == [
+            "queued",
+            "started",
+            "stage_started",
+            "stage_completed",
+            "stage_started",
+            "stage_completed",
+            "done",
+        ]
+        assert status["status"] == "done"
+        assert status["completed_stages"] == ["query_plan", "report"]
+        assert report_status == 200
+        assert report == "# 固态电池\n报告 [1]"
+        assert missing_status == 404
+        assert calls == [
+            ("固态电池", {"stream": False, "resume": False, "profile": "fast"})
+        ]
+
+    def test_backpressure_and_errors(self):
+        """Test a full queue returns 429 and failed jobs report their error"""
+        import asyncio
+
+        from research_agent.server import JobManager
+
+        release = asyncio.Event()
+
+        async def fake_workflow(question, **kwargs):
+            await release.wait()
+            if question == "失败":
+                raise RuntimeError("模型不可用")
+            return {"final_report": "ok"}
+
+        async def run():
+            manager = JobManager(fake_workflow, workers=1, max_queue=1)
+            async with self._client(manager) as client:
+                bad = await client.post("/jobs", json={"question": " "})
+                assert bad.status == 400
+
+                first = await (
+                    await client.post("/jobs", json={"question": "失败"})
+                ).json()
+                await asyncio.sleep(0.01)  # 第一个任务被 worker 取走
+                await client.post("/jobs", json={"question": "排队"})
+                rejected = await client.post("/jobs", json={"question": "溢出"})
+                pending = await client.get(f"/jobs/{first['id']}/report")
+                health = await (await client.get("/health")).json()
+
+                release.set()
+                await client.get(f"/jobs/{first['id']}/events")
+                failed = await client.get(f"/jobs/{first['id']}/report")
+                status = await (await client.get(f"/jobs/{first['id']}")).json()
+                return rejected, pending.status, health, failed.status, status
+
+        rejected, pending_status, health, failed_status, status = asyncio.run(run())
+
+        assert rejected.status == 429
+        assert rejected.headers["Retry-After"] == "5"
+        assert pending_status == 409
+        assert health == {"workers": 1, "running": 1, "queued": 1, "jobs": 2}
+        assert failed_status == 409
+        assert status["status"] == "error"
+        assert status["error"] == "RuntimeError: 模型不可用"
+
+
+class TestJobQueue:
+    """Test the durable job queue and the worker loop"""
+
+    def test_claims_are_exclusive_across_connections(self, tmp_path):
+        from research_agent.job_queue import JobQueue
+
+        path = str(tmp_path / "jobs.sqlite3")
+        a, b = JobQueue(path), JobQueue(path)
+        first = a.enqueue("问题一")
+        a.enqueue("问题二")
+        assert a.enqueue("问题一") == first  # 重复提交不产生新任务
+
+        claimed = [a.claim("w1"), b.claim("w2"), b.claim("w2")]
+        assert {claimed[0]["id"], claimed[1]["id"]} == {j["id"] for j in a.jobs()}
+        assert claimed[2] is None
+        assert a.counts() == {"queued": 0, "running": 2, "done": 0, "failed": 0}
+
+        # 只有持有租约的 worker 能提交结果
+        assert not b.complete(claimed[0]["id"], "w2", {"final_report": "x"})
+        assert a.complete(claimed[0]["id"], "w1", {"final_report": "报告"})
+        assert a.get(claimed[0]["id"])["result"] == {"final_report": "报告"}
+
+    def test_expired_lease_is_reclaimed(self, tmp_path):
+        import time
+
+        from research_agent.job_queue import JobQueue
+
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.05)
+        job_id = queue.enqueue("问题")
+        assert queue.claim("crashed")["attempts"] == 1
+        assert queue.claim("w2") is None
+        time.sleep(0.06)
+
+        job = queue.claim("w2")
+        assert job["id"] == job_id and job["attempts"] == 2
+        assert not queue.heartbeat(job_id, "crashed")
+        assert queue.heartbeat(job_id, "w2")
+
+    def test_retry_with_backoff_then_fail(self, tmp_path):
+        from research_agent.job_queue import JobQueue
+
+        queue = JobQueue(
+            str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_backoff=60
+        )
+        job_id = queue.enqueue("问题")
+        queue.claim("w")
+        assert queue.fail(job_id, "w", "TimeoutError")
+        job = queue.get(job_id)
+        assert job["status"] == "queued"
+        assert job["available_at"] > job["updated_at"] + 59
+        assert queue.claim("w") is None  # 退避期内不能领取
+
+        queue.retry_backoff = 0
+        queue._connect().execute("UPDATE jobs SET available_at = 0")
+        queue.claim("w")
+        queue.fail(job_id, "w", "TimeoutError")
+        assert queue.get(job_id)["status"] == "failed"
+
+    def test_work_runs_jobs_and_exports_results(self, tmp_path, capsys):
+        import asyncio
+        import json
+
+        from research_agent.job_queue import JobQueue
+        from research_agent.worker import main, work
+
+        path = str(tmp_path / "jobs.sqlite3")
+        questions = tmp_path / "questions.txt"
+        questions.write_text("好问题\n坏问题\n好问题\n", encoding="utf-8")
+        main(["--queue", path, "enqueue", str(questions), "--profile", "fast"])
+
+        calls = []
+
+        async def fake_workflow(question, **kwargs):
+            calls.append((question, kwargs))
+            if question == "坏问题":
+                raise RuntimeError("模型不可用")
+            return {"final_report": f"{question}的报告", "saved_file": "r.md"}
+
+        queue = JobQueue(path, max_attempts=1)
+        processed = asyncio.run(work(queue, "w1", fake_workflow, exit_when_idle=True))
+        assert processed == 2
+        assert calls[0] == (
+            "好问题",
+            {"stream": False, "resume": True, "profile": "fast"},
+        )
+
+        capsys.readouterr()
+        main(["--queue", path, "results"])
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [r["status"] for r in records] == ["ok", "error"]
+        assert records[0]["final_report"] == "好问题的报告"
+        assert records[1]["error"] == "RuntimeError: 模型不可用"
+
+    def test_lost_lease_cancels_the_workflow(self, tmp_path):
+        """Test a worker whose lease is taken over stops and does not report"""
+        import asyncio
+        import time
+
+        from research_agent.job_queue import JobQueue
+        from research_agent.worker import work
+
+        path = str(tmp_path / "jobs.sqlite3")
+        queue = JobQueue(path, lease_seconds=0.06)
+        job_id = queue.enqueue("问题")
+        other = JobQueue(path)
+        cancelled = []
+
+        async def slow_workflow(question, **kwargs):
+            # 模拟租约过期后被另一个 worker 领取
+            other._connect().execute("UPDATE jobs SET lease_owner = 'w2'")
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(question)
+                raise
+            return {"final_report": "不应提交"}
+
+        start = time.perf_counter()
+        processed = asyncio.run(work(queue, "w1", slow_workflow, max_jobs=1))
+
+        assert time.perf_counter() - start < 2
+        assert processed == 1
+        assert cancelled == ["问题"]
+        job = other.get(job_id)
+        assert job["status"] == "running" and job["lease_owner"] == "w2"
+        assert job["result"] is None
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical requests"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        import asyncio
+
+        from research_agent.singleflight import SingleFlight
+
+        flight = SingleFlight()
+        calls = []
+
+        async def factory(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return {"value": value}
+
+        async def run():
+            results = await asyncio.gather(
+                flight.do("a", lambda: factory(1)),
+                flight.do("a", lambda: factory(2)),
+                flight.do("b", lambda: factory(3)),
+            )
+            # 请求结束后 key 释放，之后的请求重新执行
+            later = await flight.do("a", lambda: factory(4))
+            return results, later
+
+        results, later = asyncio.run(run())
+        assert results[0] is results[1] and results[0] == {"value": 1}
+        assert results[2] == {"value": 3}
+        assert later == {"value": 4}
+        assert calls == [1, 3, 4]
+        assert flight.coalesced == 1
+
+    def test_errors_are_shared_and_cancelled_leader_is_replaced(self):
+        import asyncio
+
+        from research_agent.singleflight import SingleFlight
+
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("quota")
+
+        async def slow(value):
+            await asyncio.sleep(0.02)
+            return value
+
+        async def run():
+            errors = await asyncio.gather(
+                flight.do("k", boom), flight.do("k", boom), return_exceptions=True
+            )
+            leader = asyncio.ensure_future(flight.do("c", lambda: slow("leader")))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("c", lambda: slow("follower")))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return errors, await follower
+
+        errors, follower = asyncio.run(run())
+        assert [str(e) for e in errors] == ["quota", "quota"]
+        assert follower == "follower"
+
+    def test_disabled(self):
+        import asyncio
+
+        from research_agent.singleflight import SingleFlight
+
+        flight = SingleFlight(enabled=False)
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(flight.do("a", factory), flight.do("a", factory))
+
+        asyncio.run(run())
+        assert len(calls) == 2
+
+    def test_cached_run_coalesces_identical_prompts(self, tmp_path):
+        import asyncio
+
+        from research_agent import llm_cache as llm_cache_module
+        from research_agent.llm_cache import LLMCache, cached_run
+
+        agent = MagicMock()
+
+        async def fake_run(prompt, instruction, model):
+            await asyncio.sleep(0.01)
+            return f"reply to {prompt}"
+
+        agent.run = MagicMock(side_effect=fake_run)
+        cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+
+        async def run():
+            return await asyncio.gather(
+                *(cached_run(agent, "web_searcher", "inst", "hi") for _ in range(5)),
+                cached_run(agent, "web_searcher", "inst", "other"),
+            )
+
+        with patch.object(llm_cache_module, "_llm_cache", cache):
+            results = asyncio.run(run())
+
+        assert results == ["reply to hi"] * 5 + ["reply to other"]
+        assert agent.run.call_count == 2
+
+    def test_workflow_coalesces_equivalent_questions(self):
+        import asyncio
+
+        from research_agent import main
+
+        runs = []
+
+        async def fake_traced(question, *args):
+            runs.append(question)
+            await asyncio.sleep(0.01)
+            return {"question": question}
+
+        async def run():
+            return await asyncio.gather(
+                main.research_workflow.func("固态电池 现状", profile="fast"),
+                main.research_workflow.func(" 固态电池  现状", profile="fast"),
+                main.research_workflow.func("固态电池 现状", profile="standard"),
+            )
+
+        with patch.object(main, "_traced_workflow", fake_traced):
+            results = asyncio.run(run())
+
+        assert len(runs) == 2
+        assert results[0] is results[1]
+
+    def test_coalesced_workflows_receive_progress(self):
+        """Test followers get the leader's stage events, including earlier ones"""
+        import asyncio
+
+        from research_agent import main
+
+        async def fake_traced(question, stream, run_id, resume, profile, on_progress):
+            on_progress({"event": "stage_started", "stage": "query_plan"})
+            await asyncio.sleep(0.02)
+            on_progress({"event": "stage_completed", "stage": "query_plan"})
+            return {"question": question}
+
+        leader_events, follower_events = [], []
+
+        async def follow():
+            await asyncio.sleep(0.01)
+            return await main.research_workflow.func(
+                " 固态电池  现状", profile="fast", on_progress=follower_events.append
+            )
+
+        async def run():
+            return await asyncio.gather(
+                main.research_workflow.func(
+                    "固态电池 现状", profile="fast", on_progress=leader_events.append
+                ),
+                follow(),
+            )
+
+        with patch.object(main, "_traced_workflow", fake_traced):
+            results = asyncio.run(run())
+
+        assert results[0] is results[1]
+        assert [e["event"] for e in follower_events] == [
+            "stage_started",
+            "stage_completed",
+        ]
+        assert follower_events == leader_events
+        assert main._progress == {}
+
+    def test_search_keywords_coalesces_normalized_queries(self):
+        import asyncio
+
+        from research_agent.search_providers import MockSearchProvider, search_keywords
+
+        provider = MockSearchProvider()
+        seen = []
+        original = provider.search
+
+        async def slow_search(query, max_results=5):
+            seen.append(query)
+            await asyncio.sleep(0.01)
+            return await original(query, max_results)
+
+        provider.search = slow_search
+
+        async def run():
+            return await asyncio.gather(
+                search_keywords(provider, ["Solid  State", "储能"], 1),
+                search_keywords(provider, ["solid state"], 1),
+            )
+
+        first, second = asyncio.run(run())
+        assert sorted(seen) == ["Solid  State", "储能"]
+        assert second == [first[0]]
+
+
+class TestRateLimiter:
+    """Test the per-provider rate limiter and retry governor"""
+
+    def test_token_bucket(self):
+        from research_agent.rate_limiter import TokenBucket
+
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])  # 每秒 1 个
+        assert bucket.wait_time(60) == 0
+        bucket.consume(60)
+        assert bucket.wait_time(1) == 1.0
+        now[0] = 30.0
+        assert bucket.wait_time(10) == 0
+        # 超过容量的请求等桶满后放行
+        assert bucket.wait_time(100) == 30.0
+        assert TokenBucket(0).wait_time(10**9) == 0
+
+    def test_retries_transient_errors_with_backoff(self):
+        import asyncio
+
+        from research_agent.rate_limiter import ProviderGovernor
+
+        class RateLimited(Exception):
+            status_code = 429
+            headers = {"Retry-After": "0.01"}
+
+        class BadRequest(Exception):
+            status_code = 400
+
+        governor = ProviderGovernor("openai", max_retries=3, base_delay=0.001)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RateLimited("429 Too Many Requests")
+            if len(attempts) == 2:
+                raise asyncio.TimeoutError()
+            return "ok"
+
+        async def bad():
+            attempts.append(1)
+            raise BadRequest("invalid prompt")
+
+        assert asyncio.run(governor.run(flaky)) == "ok"
+        assert len(attempts) == 3
+        assert governor.stats["retries"] == 2
+
+        attempts.clear()
+        with pytest.raises(BadRequest):
+            asyncio.run(governor.run(bad))
+        assert len(attempts) == 1
+
+    def test_gives_up_after_max_retries(self):
+        import asyncio
+
+        from research_agent.rate_limiter import ProviderGovernor
+
+        governor = ProviderGovernor("anthropic", max_retries=2, base_delay=0.001)
+        attempts = []
+
+        async def overloaded():
+            attempts.append(1)
+            raise RuntimeError("Error code: 529 - overloaded_error")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(governor.run(overloaded))
+        assert len(attempts) == 3
+
+    def test_concurrency_cap_and_request_budget(self):
+        import asyncio
+
+        from research_agent.rate_limiter import RateLimiter
+
+        limiter = RateLimiter(
+            limits={"generic": {"rpm": 0, "tpm": 0, "max_concurrency": 2}}
+        )
+        active = {"now": 0, "peak": 0}
+
+        async def call():
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return "x"
+
+        async def run():
+            return await asyncio.gather(
+                *(limiter.call("generic.llama3.2:latest", call) for _ in range(6))
+            )
+
+        assert asyncio.run(run()) == ["x"] * 6
+        assert active["peak"] == 2
+        assert limiter.provider("anthropic.claude-3-haiku-latest") == "anthropic"
+        assert limiter.provider("llama3") == "generic"
+        assert limiter.snapshot()["generic"]["calls"] == 6
+
+    def test_unprefixed_local_models_share_the_generic_cap(self):
+        """Test a dot inside a model name is not mistaken for a provider prefix"""
+        from research_agent.rate_limiter import RateLimiter
+
+        limiter = RateLimiter()
+        assert limiter.provider("openai.gpt-4o") == "openai"
+        assert limiter.provider("generic.llama3.2:latest") == "generic"
+        assert limiter.provider("llama3.2:latest") == "generic"
+        assert limiter.provider("qwen2.5:latest") == "generic"
+        assert limiter.governor("llama3.2:latest") is limiter.governor(
+            "generic.qwen2.5:latest"
+        )
+        assert set(limiter.governors) == {"generic"}
+
+    def test_limits_from_config(self, tmp_path):
+        from research_agent.config import Config
+        from research_agent.rate_limiter import RateLimiter
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            "rate_limits:\n  providers:\n    anthropic: {rpm: 5}\n",
+            encoding="utf-8",
+        )
+        with patch("research_agent.rate_limiter.config", Config(str(config_file))):
+            limiter = RateLimiter.from_config()
+        assert limiter.limits["anthropic"] == {
+            "rpm": 5,
+            "tpm": 40000,
+            "max_concurrency": 8,
+        }
+        assert limiter.limits["generic"]["max_concurrency"] == 2
+
+
 class TestPackageMetadata:
     """Test package metadata"""
 